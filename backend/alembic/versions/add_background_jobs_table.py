@@ -0,0 +1,66 @@
+"""Add background_jobs table
+
+Revision ID: add_background_jobs_table
+Revises: add_debate_tables
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_background_jobs_table'
+down_revision = 'add_debate_tables'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if table already exists
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = inspector.get_table_names()
+
+    table_exists = 'background_jobs' in tables
+
+    if not table_exists:
+        op.create_table(
+            'background_jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('job_type', sa.String(50), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('payload', sa.JSON(), nullable=True),
+            sa.Column('dedupe_key', sa.String(200), nullable=True),
+            sa.Column('status', sa.String(20), nullable=False, server_default='queued'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='3'),
+            sa.Column('run_after', sa.DateTime(), nullable=True),
+            sa.Column('locked_by', sa.String(100), nullable=True),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    # Check if indexes exist before creating them
+    indexes = []
+    if table_exists:
+        indexes = [idx['name'] for idx in inspector.get_indexes('background_jobs')]
+
+    for column in ['id', 'job_type', 'user_id', 'dedupe_key', 'status', 'run_after']:
+        index_name = f'ix_background_jobs_{column}'
+        if index_name not in indexes:
+            try:
+                op.create_index(op.f(index_name), 'background_jobs', [column], unique=False)
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+
+def downgrade() -> None:
+    for column in ['run_after', 'status', 'dedupe_key', 'user_id', 'job_type', 'id']:
+        op.drop_index(op.f(f'ix_background_jobs_{column}'), table_name='background_jobs')
+    op.drop_table('background_jobs')
@@ -0,0 +1,40 @@
+"""Add generation latency columns to chat_messages
+
+Revision ID: add_chat_message_latency_columns
+Revises: add_model_usage_stats_table
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_chat_message_latency_columns'
+down_revision = 'add_model_usage_stats_table'
+branch_labels = None
+depends_on = None
+
+LATENCY_COLUMNS = [
+    'ttft_ms',
+    'total_duration_ms',
+    'tokens_per_second',
+    'load_duration_ms',
+    'prompt_eval_duration_ms',
+    'eval_duration_ms',
+]
+
+
+def upgrade() -> None:
+    # Check if columns already exist
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('chat_messages')]
+
+    for column in LATENCY_COLUMNS:
+        if column not in columns:
+            op.add_column('chat_messages', sa.Column(column, sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    for column in reversed(LATENCY_COLUMNS):
+        op.drop_column('chat_messages', column)
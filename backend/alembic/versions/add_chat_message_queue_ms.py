@@ -0,0 +1,29 @@
+"""Add queue_ms column to chat_messages
+
+Revision ID: add_chat_message_queue_ms
+Revises: add_model_presets_table
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_chat_message_queue_ms'
+down_revision = 'add_model_presets_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if column already exists
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('chat_messages')]
+
+    if 'queue_ms' not in columns:
+        op.add_column('chat_messages', sa.Column('queue_ms', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('chat_messages', 'queue_ms')
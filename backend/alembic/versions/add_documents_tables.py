@@ -0,0 +1,93 @@
+"""Add documents and document_chunks tables
+
+Revision ID: add_documents_tables
+Revises: add_embeddings_table
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_documents_tables'
+down_revision = 'add_embeddings_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if tables already exist
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = inspector.get_table_names()
+
+    documents_exists = 'documents' in tables
+    chunks_exists = 'document_chunks' in tables
+
+    if not documents_exists:
+        op.create_table(
+            'documents',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('file_id', sa.String(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('session_id', sa.String(), nullable=True),
+            sa.Column('filename', sa.String(), nullable=False),
+            sa.Column('status', sa.String(20), nullable=False, server_default='pending'),
+            sa.Column('chunk_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if not chunks_exists:
+        op.create_table(
+            'document_chunks',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('document_id', sa.Integer(), nullable=False),
+            sa.Column('chunk_index', sa.Integer(), nullable=False),
+            sa.Column('page', sa.Integer(), nullable=True),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('model', sa.String(), nullable=False),
+            sa.Column('dim', sa.Integer(), nullable=False),
+            sa.Column('vector', sa.LargeBinary(), nullable=False),
+            sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    # Check if indexes exist before creating them
+    document_indexes = []
+    if documents_exists:
+        document_indexes = [idx['name'] for idx in inspector.get_indexes('documents')]
+
+    for column, unique in [('id', False), ('file_id', True), ('user_id', False), ('session_id', False), ('status', False)]:
+        index_name = f'ix_documents_{column}'
+        if index_name not in document_indexes:
+            try:
+                op.create_index(op.f(index_name), 'documents', [column], unique=unique)
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+    chunk_indexes = []
+    if chunks_exists:
+        chunk_indexes = [idx['name'] for idx in inspector.get_indexes('document_chunks')]
+
+    for column in ['id', 'document_id']:
+        index_name = f'ix_document_chunks_{column}'
+        if index_name not in chunk_indexes:
+            try:
+                op.create_index(op.f(index_name), 'document_chunks', [column], unique=False)
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+
+def downgrade() -> None:
+    for column in ['document_id', 'id']:
+        op.drop_index(op.f(f'ix_document_chunks_{column}'), table_name='document_chunks')
+    op.drop_table('document_chunks')
+    for column in ['status', 'session_id', 'user_id', 'file_id', 'id']:
+        op.drop_index(op.f(f'ix_documents_{column}'), table_name='documents')
+    op.drop_table('documents')
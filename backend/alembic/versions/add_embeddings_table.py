@@ -0,0 +1,62 @@
+"""Add embeddings table
+
+Revision ID: add_embeddings_table
+Revises: add_response_cache_table
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_embeddings_table'
+down_revision = 'add_response_cache_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if table already exists
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = inspector.get_table_names()
+
+    table_exists = 'embeddings' in tables
+
+    if not table_exists:
+        op.create_table(
+            'embeddings',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('source_type', sa.String(20), nullable=False),
+            sa.Column('source_id', sa.Integer(), nullable=False),
+            sa.Column('model', sa.String(), nullable=False),
+            sa.Column('dim', sa.Integer(), nullable=False),
+            sa.Column('vector', sa.LargeBinary(), nullable=False),
+            sa.Column('content_hash', sa.String(64), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('source_type', 'source_id', 'model', name='uq_embeddings_source_model')
+        )
+
+    # Check if indexes exist before creating them
+    indexes = []
+    if table_exists:
+        indexes = [idx['name'] for idx in inspector.get_indexes('embeddings')]
+
+    for column in ['id', 'user_id', 'source_type']:
+        index_name = f'ix_embeddings_{column}'
+        if index_name not in indexes:
+            try:
+                op.create_index(op.f(index_name), 'embeddings', [column], unique=False)
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+
+def downgrade() -> None:
+    for column in ['source_type', 'user_id', 'id']:
+        op.drop_index(op.f(f'ix_embeddings_{column}'), table_name='embeddings')
+    op.drop_table('embeddings')
@@ -0,0 +1,60 @@
+"""Add model_presets table
+
+Revision ID: add_model_presets_table
+Revises: add_chat_message_latency_columns
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_model_presets_table'
+down_revision = 'add_chat_message_latency_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if table already exists
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = inspector.get_table_names()
+
+    table_exists = 'model_presets' in tables
+
+    if not table_exists:
+        op.create_table(
+            'model_presets',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('model', sa.String(), nullable=False),
+            sa.Column('options', sa.JSON(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'model', name='uq_model_presets_user_model')
+        )
+
+    # Check if indexes exist before creating them
+    indexes = []
+    if table_exists:
+        indexes = [idx['name'] for idx in inspector.get_indexes('model_presets')]
+
+    for index_name, columns in [
+        ('ix_model_presets_id', ['id']),
+        ('ix_model_presets_user_id', ['user_id']),
+    ]:
+        if index_name not in indexes:
+            try:
+                op.create_index(index_name, 'model_presets', columns, unique=False)
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+
+def downgrade() -> None:
+    op.drop_index('ix_model_presets_user_id', table_name='model_presets')
+    op.drop_index('ix_model_presets_id', table_name='model_presets')
+    op.drop_table('model_presets')
@@ -0,0 +1,68 @@
+"""Add model_usage_stats rollup table
+
+Revision ID: add_model_usage_stats_table
+Revises: add_notes_listing_index
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_model_usage_stats_table'
+down_revision = 'add_notes_listing_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if table already exists
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = inspector.get_table_names()
+
+    table_exists = 'model_usage_stats' in tables
+
+    if not table_exists:
+        op.create_table(
+            'model_usage_stats',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('model', sa.String(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('chat_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('debate_messages', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('prompt_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('completion_tokens', sa.BigInteger(), nullable=False, server_default='0'),
+            sa.Column('positive_feedback', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('negative_feedback', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'model', 'day', name='uq_model_usage_stats_user_model_day')
+        )
+
+    # Check if indexes exist before creating them
+    indexes = []
+    if table_exists:
+        indexes = [idx['name'] for idx in inspector.get_indexes('model_usage_stats')]
+
+    for index_name, columns in [
+        ('ix_model_usage_stats_id', ['id']),
+        ('ix_model_usage_stats_user_id', ['user_id']),
+    ]:
+        if index_name not in indexes:
+            try:
+                op.create_index(index_name, 'model_usage_stats', columns, unique=False)
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+    # The table is filled from existing messages by the usage_stats_rebuild job,
+    # which the application queues at startup while the table is empty.
+
+
+def downgrade() -> None:
+    op.drop_index('ix_model_usage_stats_user_id', table_name='model_usage_stats')
+    op.drop_index('ix_model_usage_stats_id', table_name='model_usage_stats')
+    op.drop_table('model_usage_stats')
@@ -0,0 +1,74 @@
+"""Add note_labels table and backfill it from notes.labels
+
+Revision ID: add_note_labels_table
+Revises: add_note_search_indexes
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_note_labels_table'
+down_revision = 'add_note_search_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if table already exists
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = inspector.get_table_names()
+
+    table_exists = 'note_labels' in tables
+
+    if not table_exists:
+        op.create_table(
+            'note_labels',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('note_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('label', sa.String(100), nullable=False),
+            sa.Column('is_deleted', sa.Boolean(), nullable=False, server_default=sa.false()),
+            sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('note_id', 'label', name='uq_note_labels_note_label')
+        )
+
+    # Check if indexes exist before creating them
+    indexes = []
+    if table_exists:
+        indexes = [idx['name'] for idx in inspector.get_indexes('note_labels')]
+
+    for index_name, columns in [
+        ('ix_note_labels_id', ['id']),
+        ('ix_note_labels_note_id', ['note_id']),
+        ('ix_note_labels_user_deleted_label', ['user_id', 'is_deleted', 'label']),
+    ]:
+        if index_name not in indexes:
+            try:
+                op.create_index(index_name, 'note_labels', columns, unique=False)
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+    if not table_exists and connection.dialect.name == 'postgresql':
+        # Backfill from the JSON column; trimmed, non-empty, one row per distinct label
+        op.execute("""
+            INSERT INTO note_labels (note_id, user_id, label, is_deleted)
+            SELECT DISTINCT n.id, n.user_id, left(btrim(l.label), 100), COALESCE(n.is_deleted::boolean, false)
+            FROM notes n
+            CROSS JOIN LATERAL json_array_elements_text(
+                CASE WHEN json_typeof(n.labels::json) = 'array' THEN n.labels::json ELSE '[]'::json END
+            ) AS l(label)
+            WHERE n.user_id IS NOT NULL AND btrim(l.label) <> ''
+            ON CONFLICT DO NOTHING
+        """)
+
+
+def downgrade() -> None:
+    for index_name in ['ix_note_labels_user_deleted_label', 'ix_note_labels_note_id', 'ix_note_labels_id']:
+        op.drop_index(index_name, table_name='note_labels')
+    op.drop_table('note_labels')
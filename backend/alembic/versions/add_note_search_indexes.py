@@ -0,0 +1,57 @@
+"""Add full-text and trigram search indexes to notes
+
+Revision ID: add_note_search_indexes
+Revises: add_documents_tables
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_note_search_indexes'
+down_revision = 'add_documents_tables'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        # tsvector and pg_trgm are PostgreSQL features; other databases fall back to LIKE scans
+        return
+
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('notes')]
+    indexes = [idx['name'] for idx in inspector.get_indexes('notes')]
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    if 'search_vector' not in columns:
+        # Title matches weigh more than content matches in ts_rank_cd
+        op.execute(
+            "ALTER TABLE notes ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(content, '')), 'B')"
+            ") STORED"
+        )
+
+    if 'ix_notes_search_vector' not in indexes:
+        op.execute("CREATE INDEX ix_notes_search_vector ON notes USING gin (search_vector)")
+    # Trigram indexes serve ILIKE '%...%' substring matches (also for text without word boundaries, e.g. Japanese)
+    if 'ix_notes_title_trgm' not in indexes:
+        op.execute("CREATE INDEX ix_notes_title_trgm ON notes USING gin (title gin_trgm_ops)")
+    if 'ix_notes_content_trgm' not in indexes:
+        op.execute("CREATE INDEX ix_notes_content_trgm ON notes USING gin (content gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    op.execute("DROP INDEX IF EXISTS ix_notes_content_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_notes_title_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_notes_search_vector")
+    op.execute("ALTER TABLE notes DROP COLUMN IF EXISTS search_vector")
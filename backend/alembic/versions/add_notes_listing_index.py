@@ -0,0 +1,34 @@
+"""Add composite index for keyset pagination of notes
+
+Revision ID: add_notes_listing_index
+Revises: add_note_labels_table
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_notes_listing_index'
+down_revision = 'add_note_labels_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if index exists before creating it
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    indexes = [idx['name'] for idx in inspector.get_indexes('notes')]
+
+    if 'ix_notes_user_deleted_created' not in indexes:
+        op.create_index(
+            'ix_notes_user_deleted_created',
+            'notes',
+            ['user_id', 'is_deleted', 'created_at', 'id'],
+            unique=False
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notes_user_deleted_created', table_name='notes')
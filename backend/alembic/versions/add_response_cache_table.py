@@ -0,0 +1,65 @@
+"""Add response_cache_entries table
+
+Revision ID: add_response_cache_table
+Revises: add_note_status_column
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_response_cache_table'
+down_revision = 'add_note_status_column'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Check if table already exists
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    tables = inspector.get_table_names()
+
+    table_exists = 'response_cache_entries' in tables
+
+    if not table_exists:
+        op.create_table(
+            'response_cache_entries',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('cache_key', sa.String(64), nullable=False),
+            sa.Column('model', sa.String(), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('prompt_tokens', sa.Integer(), nullable=True),
+            sa.Column('completion_tokens', sa.Integer(), nullable=True),
+            sa.Column('hit_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_accessed_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    # Check if indexes exist before creating them
+    indexes = []
+    if table_exists:
+        indexes = [idx['name'] for idx in inspector.get_indexes('response_cache_entries')]
+
+    for column in ['id', 'cache_key', 'model', 'last_accessed_at', 'expires_at']:
+        index_name = f'ix_response_cache_entries_{column}'
+        if index_name not in indexes:
+            try:
+                op.create_index(
+                    op.f(index_name),
+                    'response_cache_entries',
+                    [column],
+                    unique=(column == 'cache_key')
+                )
+            except Exception:
+                # Index might already exist, ignore
+                pass
+
+
+def downgrade() -> None:
+    for column in ['expires_at', 'last_accessed_at', 'model', 'cache_key', 'id']:
+        op.drop_index(op.f(f'ix_response_cache_entries_{column}'), table_name='response_cache_entries')
+    op.drop_table('response_cache_entries')
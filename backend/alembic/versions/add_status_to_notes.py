@@ -0,0 +1,32 @@
+"""Add status column to notes
+
+Revision ID: add_note_status_column
+Revises: add_background_jobs_table
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_note_status_column'
+down_revision = 'add_background_jobs_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Add status column (only if it doesn't exist)
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [col['name'] for col in inspector.get_columns('notes')]
+
+    if 'status' not in columns:
+        op.add_column('notes', sa.Column('status', sa.String(20), nullable=True, server_default='completed'))
+
+    # Notes still showing the placeholder title were interrupted mid-generation
+    op.execute("UPDATE notes SET status = 'generating' WHERE title = '生成中...' AND (content IS NULL OR content = '')")
+
+
+def downgrade() -> None:
+    op.drop_column('notes', 'status')
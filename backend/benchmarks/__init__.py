@@ -0,0 +1 @@
+"""Benchmarks run against local stub servers (not part of the application)"""
@@ -0,0 +1,90 @@
+"""Embedding throughput benchmark against the stub Ollama server
+
+Run from the backend directory:
+
+    python -m benchmarks.embedding_benchmark --texts 2000 --duplicates 0.2
+
+Reports texts/sec for one request per text, sequential batches, concurrent
+batches and a warm on-disk cache.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+# Configure before importing application modules (config is read at import time)
+_cache_dir = tempfile.mkdtemp(prefix="embedding-bench-")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ["EMBEDDING_CACHE_DIR"] = _cache_dir
+
+from benchmarks.stub_ollama import create_app, StubServer  # noqa: E402
+
+WORDS = (
+    "model token prompt cache vector index search note chat session document page "
+    "latency throughput batch queue worker stream memory disk network python ollama"
+).split()
+
+
+def make_texts(count: int, duplicates: float, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    unique_count = max(1, int(count * (1 - duplicates)))
+    unique = [" ".join(rng.choices(WORDS, k=rng.randint(20, 80))) + f" #{i}" for i in range(unique_count)]
+    return [unique[i] if i < unique_count else rng.choice(unique) for i in range(count)]
+
+
+async def run_case(name: str, texts: list, batch_size: int, concurrency: int, use_cache: bool) -> None:
+    from services.embedding_service import EmbeddingService
+
+    EmbeddingService.max_concurrency = concurrency
+    EmbeddingService._semaphore = None
+    service = EmbeddingService(model="nomic-embed-text", batch_size=batch_size, use_cache=use_cache)
+
+    start = time.perf_counter()
+    if batch_size == 1:
+        # Baseline: one request per text, no deduplication
+        for text in texts:
+            await service._embed_batch([text])
+    else:
+        vectors = await service.embed(texts)
+        assert vectors.shape[0] == len(texts)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {elapsed:8.2f}s {len(texts) / elapsed:10.1f} texts/sec")
+
+
+async def run(args) -> None:
+    texts = make_texts(args.texts, args.duplicates)
+    print(f"{len(texts)} texts ({len(set(texts))} unique), stub latency {args.embed_latency}s/request")
+
+    await run_case("one request per text", texts[:args.baseline_texts], 1, 1, False)
+    await run_case("batched, sequential", texts, args.batch_size, 1, False)
+    await run_case(f"batched, {args.concurrency} concurrent", texts, args.batch_size, args.concurrency, False)
+    await run_case("batched, concurrent, cold cache", texts, args.batch_size, args.concurrency, True)
+    await run_case("warm cache", texts, args.batch_size, args.concurrency, True)
+
+    from services.cloud_providers import CompletionProvider
+    await CompletionProvider.close_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmark")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Fraction of texts that repeat earlier ones")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--baseline-texts", type=int, default=200, help="Texts used for the one-per-request baseline")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--embed-per-text", type=float, default=0.002)
+    parser.add_argument("--port", type=int, default=11531)
+    args = parser.parse_args()
+
+    app = create_app(embed_latency=args.embed_latency, embed_per_text=args.embed_per_text)
+    with StubServer(app, args.port) as server:
+        os.environ["OLLAMA_BASE_URL"] = server.url
+        asyncio.run(run(args))
+        print(f"stub served {app.state.embed_requests} requests / {app.state.embedded_texts} texts")
+
+
+if __name__ == "__main__":
+    main()
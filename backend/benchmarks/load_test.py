@@ -0,0 +1,379 @@
+"""End-to-end load test of the backend against the stub Ollama/cloud server
+
+Starts the stub server in-process and the FastAPI app as a uvicorn
+subprocess (so its memory can be measured on its own), then drives
+concurrent workloads over HTTP:
+
+    chat      local model chat with SSE streaming (TTFT measured on the first content event)
+    cloud     chat with the OpenAI/Anthropic/Gemini/xAI providers (non-streaming upstream)
+    compare   one prompt sent to a local and two cloud models at once, like the compare view
+    upload    .txt upload, conversion to page images and document indexing
+    history   chat history of a session
+    search    keyword search over chat history
+
+Run from the backend directory:
+
+    python -m benchmarks.load_test --requests 100 --concurrency 8 --output results.json
+    python -m benchmarks.load_test --compare results.json --tolerance 0.25
+
+The default temporary SQLite database serialises the background job
+workers (upload indexing) against request writes; pass a PostgreSQL
+``--database-url`` for numbers representative of a deployment.
+
+Results are written as JSON; ``--compare`` exits with status 1 when p95
+latency or throughput of any workload regressed beyond the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Awaitable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.stub_ollama import create_app, StubServer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+WORKLOADS = ("chat", "cloud", "compare", "upload", "history", "search")
+LOCAL_MODEL = "stub-chat"
+CLOUD_MODELS = ("gpt-stub", "claude-stub", "gemini-stub", "grok-stub")
+CLOUD_PROVIDERS = ("gpt", "claude", "gemini", "grok")
+
+# (latency seconds, time to first token seconds or None, completion tokens)
+Sample = Tuple[float, Optional[float], int]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Linear interpolation between closest ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/mean/max in milliseconds"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(values, 0.5) * 1000, 2),
+        "p95": round(percentile(values, 0.95) * 1000, 2),
+        "p99": round(percentile(values, 0.99) * 1000, 2),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "max": round(max(values) * 1000, 2),
+    }
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak resident set size of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+async def stream_chat(client: httpx.AsyncClient, payload: dict) -> Tuple[Sample, dict]:
+    """POST /api/chat and read the SSE stream; returns the sample and the final event"""
+    start = time.perf_counter()
+    ttft = None
+    final: dict = {}
+    async with client.stream("POST", "/api/chat", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event.get("error"):
+                raise RuntimeError(event["error"])
+            if event.get("content") and ttft is None:
+                ttft = time.perf_counter() - start
+            if event.get("done"):
+                final = event
+    if not final:
+        raise RuntimeError("stream ended without a done event")
+    return (time.perf_counter() - start, ttft, final.get("completion_tokens") or 0), final
+
+
+class LoadTest:
+    """Drives the workloads against a running backend"""
+
+    def __init__(self, base_url: str, requests: int, concurrency: int):
+        self.base_url = base_url
+        self.requests = requests
+        self.concurrency = concurrency
+        self.user_id: Optional[int] = None
+        self.session_ids: List[str] = []
+
+    async def setup(self, client: httpx.AsyncClient) -> None:
+        response = await client.post("/api/users", json={"username": f"loadtest-{uuid.uuid4().hex[:8]}"})
+        response.raise_for_status()
+        self.user_id = response.json()["id"]
+        for provider in CLOUD_PROVIDERS:
+            # Keys are validated against the stub's /models endpoints
+            response = await client.post(
+                "/api/api-keys",
+                json={"user_id": self.user_id, "provider": provider, "api_key": f"stub-{provider}-key"}
+            )
+            response.raise_for_status()
+
+    async def run_workload(self, name: str, operation: Callable[[httpx.AsyncClient, int], Awaitable[Sample]]) -> dict:
+        samples: List[Sample] = []
+        errors: List[str] = []
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=300.0) as client:
+            async def one(index: int) -> None:
+                async with semaphore:
+                    try:
+                        samples.append(await operation(client, index))
+                    except Exception as e:
+                        errors.append(f"{type(e).__name__}: {e}")
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(self.requests)))
+            duration = time.perf_counter() - start
+
+        latencies = [sample[0] for sample in samples]
+        ttfts = [sample[1] for sample in samples if sample[1] is not None]
+        tokens = sum(sample[2] for sample in samples)
+        result = {
+            "requests": self.requests,
+            "errors": len(errors),
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(samples) / duration, 2) if duration else None,
+            "latency_ms": summarize(latencies),
+            "ttft_ms": summarize(ttfts) if ttfts else None,
+            "tokens_per_second": round(tokens / duration, 1) if tokens and duration else None,
+        }
+        if errors:
+            result["error_samples"] = sorted(set(errors))[:5]
+        return result
+
+    # --- Workloads ---
+
+    async def chat(self, client: httpx.AsyncClient, index: int) -> Sample:
+        sample, final = await stream_chat(client, {
+            "user_id": self.user_id,
+            "model": LOCAL_MODEL,
+            "message": f"load test message {index}: summarize the latency of token streaming",
+        })
+        if final.get("session_id"):
+            self.session_ids.append(final["session_id"])
+        return sample
+
+    async def cloud(self, client: httpx.AsyncClient, index: int) -> Sample:
+        sample, _ = await stream_chat(client, {
+            "user_id": self.user_id,
+            "model": CLOUD_MODELS[index % len(CLOUD_MODELS)],
+            "message": f"cloud load test message {index}",
+        })
+        return sample
+
+    async def compare(self, client: httpx.AsyncClient, index: int) -> Sample:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            stream_chat(client, {
+                "user_id": self.user_id,
+                "model": model,
+                "message": f"compare load test message {index}",
+            })
+            for model in (LOCAL_MODEL, CLOUD_MODELS[0], CLOUD_MODELS[1])
+        ))
+        ttfts = [sample[1] for sample, _ in results if sample[1] is not None]
+        return time.perf_counter() - start, min(ttfts) if ttfts else None, sum(sample[2] for sample, _ in results)
+
+    async def upload(self, client: httpx.AsyncClient, index: int) -> Sample:
+        text = "\n".join(f"Line {line} of load test document {index}: tokens, latency and throughput." for line in range(120))
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/upload",
+            files={"file": (f"loadtest-{index}.txt", text.encode("utf-8"), "text/plain")},
+            data={"user_id": str(self.user_id)}
+        )
+        response.raise_for_status()
+        return time.perf_counter() - start, None, 0
+
+    async def history(self, client: httpx.AsyncClient, index: int) -> Sample:
+        params = {"session_id": self.session_ids[index % len(self.session_ids)]} if self.session_ids else None
+        start = time.perf_counter()
+        response = await client.get(f"/api/chat/history/{self.user_id}", params=params)
+        response.raise_for_status()
+        return time.perf_counter() - start, None, 0
+
+    async def search(self, client: httpx.AsyncClient, index: int) -> Sample:
+        start = time.perf_counter()
+        response = await client.get(f"/api/chat/search/{self.user_id}", params={"q": f"message {index % 10}"})
+        response.raise_for_status()
+        return time.perf_counter() - start, None, 0
+
+
+def start_backend(port: int, stub_url: str, database_url: str) -> subprocess.Popen:
+    """Start the app with uvicorn, pointed at the stub server"""
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "OLLAMA_BASE_URL": stub_url,
+        "OPENAI_API_BASE_URL": f"{stub_url}/v1",
+        "ANTHROPIC_API_BASE_URL": f"{stub_url}/v1",
+        "XAI_API_BASE_URL": f"{stub_url}/v1",
+        "GEMINI_API_BASE_URL": f"{stub_url}/v1beta",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"backend exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("backend did not start within 60s")
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """List workloads whose p95 latency rose or throughput fell by more than ``tolerance``"""
+    regressions = []
+    for name, result in current["workloads"].items():
+        base = baseline.get("workloads", {}).get(name)
+        if not base:
+            continue
+        p95, base_p95 = result["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if p95 and base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 latency {base_p95:.1f}ms -> {p95:.1f}ms")
+        rps, base_rps = result["throughput_rps"], base["throughput_rps"]
+        if rps and base_rps and rps < base_rps * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base_rps:.1f} -> {rps:.1f} req/s")
+    rss, base_rss = current.get("peak_rss_mb"), baseline.get("peak_rss_mb")
+    if rss and base_rss and rss > base_rss * (1 + tolerance):
+        regressions.append(f"peak RSS {base_rss:.1f}MB -> {rss:.1f}MB")
+    return regressions
+
+
+def print_report(results: dict) -> None:
+    print(f"{'workload':<10} {'req':>5} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttft p50':>9} {'tok/s':>8}")
+    for name, result in results["workloads"].items():
+        latency = result["latency_ms"]
+        ttft = (result["ttft_ms"] or {}).get("p50")
+        print(
+            f"{name:<10} {result['requests']:>5} {result['errors']:>4} {result['throughput_rps'] or 0:>8.1f} "
+            f"{latency['p50'] or 0:>9.1f} {latency['p95'] or 0:>9.1f} {latency['p99'] or 0:>9.1f} "
+            f"{ttft or 0:>9.1f} {result['tokens_per_second'] or 0:>8.1f}"
+        )
+        for error in result.get("error_samples", []):
+            print(f"    ! {error}")
+    print(f"peak RSS of the backend: {results['peak_rss_mb']} MB")
+
+
+async def run_workloads(load_test: LoadTest, names: List[str]) -> Dict[str, dict]:
+    async with httpx.AsyncClient(base_url=load_test.base_url, timeout=60.0) as client:
+        await load_test.setup(client)
+
+    results = {}
+    # Chat runs first so history and search have sessions to read
+    for name in sorted(names, key=WORKLOADS.index):
+        results[name] = await load_test.run_workload(name, getattr(load_test, name))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end backend load test")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help=f"Comma-separated subset of {', '.join(WORKLOADS)}")
+    parser.add_argument("--requests", type=int, default=50, help="Operations per workload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=18000, help="Backend port")
+    parser.add_argument("--stub-port", type=int, default=11510)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite database")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="Fraction of cloud requests the stub fails with 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of cloud requests the stub stalls")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression for --compare")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = set(names) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='loadtest-')}/loadtest.db"
+    stub_app = create_app(
+        embed_latency=args.embed_latency,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        first_token_delay=args.first_token_delay,
+        fault_rate=args.fault_rate,
+        stall_rate=args.stall_rate
+    )
+
+    with StubServer(stub_app, args.stub_port) as stub:
+        backend = start_backend(args.port, stub.url, database_url)
+        try:
+            load_test = LoadTest(f"http://127.0.0.1:{args.port}", args.requests, args.concurrency)
+            workloads = asyncio.run(run_workloads(load_test, names))
+            rss = peak_rss_mb(backend.pid)
+        finally:
+            backend.terminate()
+            backend.wait(timeout=10)
+
+    results = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "token_delay": args.token_delay,
+            "tokens": args.tokens,
+            "first_token_delay": args.first_token_delay,
+            "embed_latency": args.embed_latency,
+            "fault_rate": args.fault_rate,
+            "stall_rate": args.stall_rate,
+            "database": database_url.split(":", 1)[0],
+        },
+        "peak_rss_mb": rss,
+        "workloads": workloads,
+    }
+    print_report(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"results written to {args.output}")
+
+    if args.compare:
+        regressions = compare_results(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print(f"regressions beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
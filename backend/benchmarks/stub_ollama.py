@@ -0,0 +1,337 @@
+"""Stub Ollama server for benchmarks
+
+Implements the subset of the Ollama API the backend uses, with configurable
+latency so throughput can be measured without a GPU:
+
+    python -m benchmarks.stub_ollama --port 11500 --embed-latency 0.05
+
+The same server answers OpenAI/xAI (``/v1/chat/completions``), Anthropic
+(``/v1/messages``) and Gemini (``/v1beta/models/...``) requests, so cloud
+models can be exercised by pointing ``*_API_BASE_URL`` at it.
+
+Embeddings are deterministic hashed bag-of-words vectors, so identical texts
+always get identical vectors.
+
+Several stubs on different ports (optionally with different ``--models``)
+exercise multi-backend routing via ``OLLAMA_BASE_URLS``.
+
+Cloud endpoints can inject faults to exercise retries and circuit breakers:
+
+    python -m benchmarks.stub_ollama --fault-rate 0.3 --fault-status 503 --stall-rate 0.1
+
+The settings live in ``app.state.faults`` and may be changed while running.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def _prompt_tokens(messages: list) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            # OpenAI/Anthropic multi-part content
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += len(content.split())
+    return total
+
+
+def create_app(
+    embed_latency: float = 0.05,
+    embed_per_text: float = 0.002,
+    embed_dim: int = 384,
+    token_delay: float = 0.01,
+    tokens: int = 50,
+    first_token_delay: float = 0.0,
+    models: tuple = ("stub-chat:latest", "nomic-embed-text:latest"),
+    fault_rate: float = 0.0,
+    fault_status: int = 503,
+    fault_first: int = 0,
+    retry_after: float = None,
+    stall_rate: float = 0.0,
+    stall_seconds: float = 30.0,
+    seed: int = 0
+) -> FastAPI:
+    """
+    Build the stub application
+
+    Args:
+        embed_latency: Fixed seconds per /api/embed request
+        embed_per_text: Additional seconds per embedded text
+        embed_dim: Embedding dimension
+        token_delay: Seconds between streamed chat tokens
+        tokens: Tokens per chat response
+        first_token_delay: Extra seconds before the first token (simulated prompt processing)
+        models: Model names reported by /api/tags; other models get a 404
+        fault_rate: Fraction of cloud requests answered with ``fault_status``
+        fault_status: Status code of injected faults
+        fault_first: Number of initial cloud requests that always fail
+        retry_after: Retry-After seconds sent with injected faults (None to omit)
+        stall_rate: Fraction of cloud requests delayed by ``stall_seconds`` before answering
+        stall_seconds: Delay of stalled requests
+        seed: Seed of the fault injection RNG
+    """
+    app = FastAPI()
+    app.state.embed_requests = 0
+    app.state.embedded_texts = 0
+    app.state.chat_requests = 0
+    app.state.cloud_requests = 0
+    app.state.loaded_models = set()  # Reported by /api/ps once used
+    app.state.cloud_attempts = 0  # Including injected faults
+    app.state.injected_faults = 0
+    app.state.faults = {
+        "rate": fault_rate,
+        "status": fault_status,
+        "first": fault_first,
+        "retry_after": retry_after,
+        "stall_rate": stall_rate,
+        "stall_seconds": stall_seconds,
+    }
+    rng = random.Random(seed)
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        """Fail or stall cloud provider requests (paths under /v1 and /v1beta)"""
+        if not request.url.path.startswith("/v1"):
+            return await call_next(request)
+        faults = app.state.faults
+        app.state.cloud_attempts += 1
+        if app.state.cloud_attempts <= faults["first"] or rng.random() < faults["rate"]:
+            app.state.injected_faults += 1
+            headers = {"Retry-After": str(faults["retry_after"])} if faults["retry_after"] is not None else {}
+            return JSONResponse(
+                {"error": {"message": "injected fault"}}, status_code=faults["status"], headers=headers
+            )
+        if rng.random() < faults["stall_rate"]:
+            await asyncio.sleep(faults["stall_seconds"])
+        return await call_next(request)
+
+    def model_missing(name: str):
+        if name in models or f"{name}:latest" in models:
+            app.state.loaded_models.add(name if ":" in name else f"{name}:latest")
+            return None
+        return JSONResponse({"error": f"model '{name}' not found"}, status_code=404)
+
+    def embed_text(text: str) -> list:
+        vector = np.zeros(embed_dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % embed_dim] += 1.0
+        return vector.tolist()
+
+    async def token_stream():
+        """Yield response tokens at the configured rate"""
+        await asyncio.sleep(first_token_delay)
+        for i in range(tokens):
+            await asyncio.sleep(token_delay)
+            yield f"tok{i} "
+
+    async def full_text() -> str:
+        await asyncio.sleep(first_token_delay + token_delay * tokens)
+        return " ".join(f"tok{i}" for i in range(tokens))
+
+    def sse(data: dict) -> str:
+        return f"data: {json.dumps(data)}\n\n"
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        missing = model_missing(body.get("model", ""))
+        if missing is not None:
+            return missing
+        app.state.embed_requests += 1
+        app.state.embedded_texts += len(inputs)
+        await asyncio.sleep(embed_latency + embed_per_text * len(inputs))
+        return {"model": body.get("model"), "embeddings": [embed_text(text) for text in inputs]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        missing = model_missing(body.get("model", ""))
+        if missing is not None:
+            return missing
+        app.state.chat_requests += 1
+        prompt_tokens = _prompt_tokens(body.get("messages", []))
+
+        async def generate():
+            start = time.monotonic()
+            async for token in token_stream():
+                yield json.dumps({"message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+            elapsed_ns = int((time.monotonic() - start) * 1e9)
+            prompt_ns = int(first_token_delay * 1e9)
+            yield json.dumps({
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": tokens,
+                "total_duration": elapsed_ns,
+                "load_duration": 0,
+                "prompt_eval_duration": prompt_ns,
+                "eval_duration": max(elapsed_ns - prompt_ns, 0),
+            }) + "\n"
+
+        if body.get("stream", True):
+            return StreamingResponse(generate(), media_type="application/x-ndjson")
+        return {
+            "message": {"role": "assistant", "content": await full_text()},
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": tokens,
+        }
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": name} for name in models]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": name} for name in sorted(app.state.loaded_models)]}
+
+    # --- Cloud providers (point *_API_BASE_URL at this server) ---
+
+    @app.get("/v1/models")
+    async def openai_models():
+        return {"data": [{"id": "gpt-stub"}, {"id": "grok-stub"}]}
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        """OpenAI and xAI chat completions"""
+        body = await request.json()
+        app.state.cloud_requests += 1
+        usage = {"prompt_tokens": _prompt_tokens(body.get("messages", [])), "completion_tokens": tokens}
+
+        async def generate():
+            async for token in token_stream():
+                yield sse({"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+            yield sse({"choices": [], "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        if body.get("stream"):
+            return StreamingResponse(generate(), media_type="text/event-stream")
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": await full_text()}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        """Anthropic messages API"""
+        body = await request.json()
+        app.state.cloud_requests += 1
+        input_tokens = _prompt_tokens(body.get("messages", []))
+
+        async def generate():
+            yield sse({"type": "message_start", "message": {"usage": {"input_tokens": input_tokens}}})
+            async for token in token_stream():
+                yield sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}})
+            yield sse({"type": "message_delta", "usage": {"output_tokens": tokens}})
+            yield sse({"type": "message_stop"})
+
+        if body.get("stream"):
+            return StreamingResponse(generate(), media_type="text/event-stream")
+        return {
+            "content": [{"type": "text", "text": await full_text()}],
+            "usage": {"input_tokens": input_tokens, "output_tokens": tokens},
+            "stop_reason": "end_turn",
+        }
+
+    @app.get("/v1beta/models")
+    async def gemini_models():
+        return {"models": [{"name": "models/gemini-stub"}]}
+
+    @app.post("/v1beta/models/{target}")
+    async def gemini_generate(target: str, request: Request):
+        """Gemini generateContent / streamGenerateContent (``{model}:{method}``)"""
+        body = await request.json()
+        app.state.cloud_requests += 1
+        prompt_tokens = sum(
+            len(part.get("text", "").split())
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+
+        def candidate(text: str, completion_tokens: int) -> dict:
+            return {
+                "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+                "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens},
+            }
+
+        async def generate():
+            count = 0
+            async for token in token_stream():
+                count += 1
+                yield sse(candidate(token, count))
+
+        if target.endswith(":streamGenerateContent"):
+            return StreamingResponse(generate(), media_type="text/event-stream")
+        return candidate(await full_text(), tokens)
+
+    return app
+
+
+class StubServer:
+    """Runs a stub app with uvicorn in a background thread"""
+
+    def __init__(self, app: FastAPI, port: int):
+        self.app = app
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stub Ollama server")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--embed-per-text", type=float, default=0.002)
+    parser.add_argument("--embed-dim", type=int, default=384)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--fault-status", type=int, default=503)
+    parser.add_argument("--fault-first", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--models", default="stub-chat:latest,nomic-embed-text:latest", help="Comma-separated models to serve")
+    args = parser.parse_args()
+
+    app = create_app(
+        args.embed_latency, args.embed_per_text, args.embed_dim,
+        args.token_delay, args.tokens, args.first_token_delay,
+        tuple(name.strip() for name in args.models.split(",") if name.strip()),
+        args.fault_rate, args.fault_status, args.fault_first, args.retry_after,
+        args.stall_rate, args.stall_seconds
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,114 @@ import os
 from pathlib import Path
 
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://host.docker.internal:11434")
+# Several Ollama servers to balance across (comma-separated; defaults to OLLAMA_BASE_URL alone)
+OLLAMA_BASE_URLS = [
+    url.strip().rstrip("/") for url in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if url.strip()
+] or [OLLAMA_BASE_URL]
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))  # Seconds between backend health checks (/api/tags, /api/ps)
+OLLAMA_FAILURE_COOLDOWN = float(os.getenv("OLLAMA_FAILURE_COOLDOWN", "30"))  # Seconds a failed backend is skipped unless nothing else is left
+OLLAMA_STICKY_TTL = float(os.getenv("OLLAMA_STICKY_TTL", "1800"))  # Seconds a session keeps using the backend that holds its KV cache
+
+# Cloud provider endpoints (overridable for proxies and the benchmark stub server)
+OPENAI_API_BASE_URL = os.getenv("OPENAI_API_BASE_URL", "https://api.openai.com/v1")
+ANTHROPIC_API_BASE_URL = os.getenv("ANTHROPIC_API_BASE_URL", "https://api.anthropic.com/v1")
+GEMINI_API_BASE_URL = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+XAI_API_BASE_URL = os.getenv("XAI_API_BASE_URL", "https://api.x.ai/v1")
+
+# Cloud provider resilience
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "10"))  # Seconds to establish a connection
+PROVIDER_READ_TIMEOUT = float(os.getenv("PROVIDER_READ_TIMEOUT", "120"))  # Seconds without receiving data before a request is abandoned
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "2"))  # Retries on 408/429/5xx and connection errors (0 disables)
+PROVIDER_RETRY_BASE_DELAY = float(os.getenv("PROVIDER_RETRY_BASE_DELAY", "0.5"))  # Backoff before the first retry; doubles per attempt, with full jitter
+PROVIDER_RETRY_MAX_DELAY = float(os.getenv("PROVIDER_RETRY_MAX_DELAY", "10"))  # Longest wait between attempts; a longer Retry-After is not retried
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # Consecutive failures that open a provider's circuit
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))  # Seconds an open circuit rejects calls before letting one probe through
+PROVIDER_HEDGE_DELAY = float(os.getenv("PROVIDER_HEDGE_DELAY", "0"))  # Seconds before a duplicate request is sent for short non-streaming prompts (0 disables)
+PROVIDER_HEDGE_MAX_PROMPT_CHARS = int(os.getenv("PROVIDER_HEDGE_MAX_PROMPT_CHARS", "2000"))  # Longer prompts are never hedged
+
+# Client-side rate limits per (user, provider): requests and tokens per minute (0 disables a limit)
+PROVIDER_RATE_LIMITS = {
+    provider: {
+        "rpm": int(os.getenv(f"{provider.upper()}_RPM_LIMIT", rpm)),
+        "tpm": int(os.getenv(f"{provider.upper()}_TPM_LIMIT", tpm)),
+    }
+    for provider, rpm, tpm in (
+        ("gpt", "500", "30000"),
+        ("claude", "50", "40000"),
+        ("gemini", "15", "1000000"),
+        ("grok", "60", "100000"),
+    )
+}
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))  # Seconds a request may queue for budget before it is rejected
+
+# Cloud API key storage
+API_KEY_ENCRYPTION_KEY = os.getenv("API_KEY_ENCRYPTION_KEY", "")  # Fernet key (or passphrase) to encrypt stored API keys (empty stores them as plain text)
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "300"))  # Seconds a decrypted key lookup is cached per process
 UPLOAD_DIR = Path("/app/uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Background job queue
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))  # Worker tasks per process
+JOB_PER_USER_CONCURRENCY = int(os.getenv("JOB_PER_USER_CONCURRENCY", "2"))  # Running jobs allowed per user
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))  # Seconds between polls when the queue is empty
+JOB_LEASE_TIMEOUT = int(os.getenv("JOB_LEASE_TIMEOUT", "900"))  # Seconds without a heartbeat before a running job is considered abandoned
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_LEASE_TIMEOUT / 3)))  # Seconds between lease renewals of a running job
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5.0"))  # Seconds; doubled on every retry
+
+# Observability
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # Expose Prometheus metrics at /metrics
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")  # none, console, otlp (OTEL_EXPORTER_OTLP_* settings) or memory; requires opentelemetry-sdk
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))  # Fraction of new traces recorded
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "ollama-chat-backend")  # service.name resource attribute
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"  # Profile every chat, upload and debate turn request
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")  # Requests sending "X-Profile: <token>" are profiled (disabled when empty)
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", "0.005"))  # Seconds between stack samples
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # Level of the application loggers (DEBUG, INFO, WARNING, ...)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text or json (one JSON object per line, for log shippers)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # Log file size before it is rotated
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))  # Rotated log files kept
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Records buffered for the writer thread; new records are dropped when full
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))  # Fraction of DEBUG records kept (0.0-1.0)
+
+# Chat context
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "20"))  # Stored messages sent with each turn at most
+CHAT_HISTORY_TRUNCATE_BLOCK = int(os.getenv("CHAT_HISTORY_TRUNCATE_BLOCK", "10"))  # Oldest messages dropped at once, so the prompt prefix stays stable for several turns
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # Default keep_alive for chat so the model and its prompt cache stay loaded ("" = Ollama default)
+
+# Chat streaming
+SSE_COALESCE_WINDOW = float(os.getenv("SSE_COALESCE_WINDOW", "0.005"))  # Seconds tokens are held to be sent as one event (0 sends every token)
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "256"))  # Buffered characters that are sent without waiting for the window
+
+# Note generation streaming
+NOTE_STREAM_COMMIT_INTERVAL = float(os.getenv("NOTE_STREAM_COMMIT_INTERVAL", "1.0"))  # Seconds between partial content commits
+
+# Note listing
+NOTE_PREVIEW_LENGTH = int(os.getenv("NOTE_PREVIEW_LENGTH", "160"))  # Characters of content included in summary listings
+NOTE_PAGE_MAX_LIMIT = int(os.getenv("NOTE_PAGE_MAX_LIMIT", "200"))  # Largest page size accepted by note listings
+
+# Response cache for deterministic prompts
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds an entry stays valid
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))  # Least recently used entries are evicted beyond this
+RESPONSE_CACHE_EVICT_EVERY = int(os.getenv("RESPONSE_CACHE_EVICT_EVERY", "100"))  # Stores between eviction passes (per process)
+
+# Embeddings / semantic search
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")  # Local Ollama embedding model
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))  # Texts per /api/embed request
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", "8000"))  # Longer texts are truncated before embedding
+EMBEDDING_AUTO_INDEX = os.getenv("EMBEDDING_AUTO_INDEX", "true").lower() == "true"  # Index new messages/notes in the background
+EMBEDDING_INDEX_DELAY = float(os.getenv("EMBEDDING_INDEX_DELAY", "5.0"))  # Seconds to wait so bursts are indexed in one job
+SEMANTIC_ANN_THRESHOLD = int(os.getenv("SEMANTIC_ANN_THRESHOLD", "20000"))  # Vectors per user before using an HNSW index (requires hnswlib)
+SEMANTIC_CACHE_MAX_MATRICES = int(os.getenv("SEMANTIC_CACHE_MAX_MATRICES", "64"))  # Per-user embedding matrices kept in memory (least recently used are dropped)
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))  # Embedding batches in flight at once (process-wide)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"  # Reuse vectors for texts embedded before
+EMBEDDING_CACHE_DIR = Path(os.getenv("EMBEDDING_CACHE_DIR", str(UPLOAD_DIR / ".embedding_cache")))  # Memory-mapped vector files (kept on the uploads volume)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))  # Per model; new vectors are not cached beyond this
 
+# Retrieval over uploaded documents
+RAG_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1000"))  # Target characters per document chunk
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "150"))  # Characters repeated between neighbouring chunks
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))  # Chunks retrieved into the prompt per turn
+RAG_MAX_CONTEXT_CHARS = int(os.getenv("RAG_MAX_CONTEXT_CHARS", "4000"))  # Upper bound on retrieved text per turn
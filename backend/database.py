@@ -21,6 +21,30 @@ def get_db():
     finally:
         db.close()
 
+# Full-text (tsvector) and trigram indexes for note search (PostgreSQL only)
+NOTE_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(content, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS ix_notes_search_vector ON notes USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_notes_title_trgm ON notes USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_notes_content_trgm ON notes USING gin (content gin_trgm_ops)",
+]
+
+# Generation latency columns on chat_messages
+LATENCY_COLUMNS = [
+    "ttft_ms",
+    "total_duration_ms",
+    "tokens_per_second",
+    "load_duration_ms",
+    "prompt_eval_duration_ms",
+    "eval_duration_ms",
+    "queue_ms",
+]
+
 def ensure_columns_exist():
     """Ensure new columns exist in existing databases"""
     inspector = inspect(engine)
@@ -44,9 +68,49 @@ def ensure_columns_exist():
             except Exception as e:
                 logger.warning(f"Could not add column labels to notes table: {e}")
 
+        if 'status' not in columns:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("ALTER TABLE notes ADD COLUMN status VARCHAR(20) DEFAULT 'completed'"))
+                    conn.commit()
+            except Exception as e:
+                logger.warning(f"Could not add column status to notes table: {e}")
+
+        indexes = [idx['name'] for idx in inspector.get_indexes('notes')]
+        if 'ix_notes_user_deleted_created' not in indexes:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_notes_user_deleted_created "
+                        "ON notes(user_id, is_deleted, created_at, id)"
+                    ))
+                    conn.commit()
+            except Exception as e:
+                logger.warning(f"Could not create index: {e}")
+
+        if engine.dialect.name == "postgresql":
+            search_indexes = {'ix_notes_search_vector', 'ix_notes_title_trgm', 'ix_notes_content_trgm'}
+            if 'search_vector' not in columns or not search_indexes.issubset(indexes):
+                try:
+                    with engine.connect() as conn:
+                        for statement in NOTE_SEARCH_DDL:
+                            conn.execute(text(statement))
+                        conn.commit()
+                except Exception as e:
+                    logger.warning(f"Could not create note search indexes: {e}")
+
     # Check if chat_messages table exists
     if 'chat_messages' in inspector.get_table_names():
         columns = [col['name'] for col in inspector.get_columns('chat_messages')]
+
+        for column in LATENCY_COLUMNS:
+            if column not in columns:
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(text(f"ALTER TABLE chat_messages ADD COLUMN {column} FLOAT"))
+                        conn.commit()
+                except Exception as e:
+                    logger.warning(f"Could not add column {column} to chat_messages table: {e}")
         
         # Check if index exists
         indexes = [idx['name'] for idx in inspector.get_indexes('chat_messages')]
@@ -6,14 +6,24 @@ import io
 import subprocess
 import shutil
 from logging_config import get_logger
+from metrics import FILE_CONVERSION_DURATION
+from tracing import start_span, traced
 
 logger = get_logger(__name__)
 
 UPLOAD_DIR = Path("/app/uploads")
 
+SUPPORTED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg", ".txt", ".xlsx", ".docx"}
+
 async def convert_file_to_images(file_path: Path) -> list[str]:
     """Convert file (PDF, image, txt, xlsx, docx) to list of image paths"""
     file_ext = file_path.suffix.lower()
+    file_type = file_ext.lstrip(".") if file_ext in SUPPORTED_EXTENSIONS else "other"
+    with start_span("file_converter.convert", {"file_type": file_type}), \
+            FILE_CONVERSION_DURATION.labels(file_type=file_type).time():
+        return await _convert_file_to_images(file_path, file_ext)
+
+async def _convert_file_to_images(file_path: Path, file_ext: str) -> list[str]:
     file_id = file_path.stem
     
     if file_ext == ".pdf":
@@ -29,6 +39,7 @@ async def convert_file_to_images(file_path: Path) -> list[str]:
     else:
         raise ValueError(f"Unsupported file type: {file_ext}")
 
+@traced("file_converter.convert_pdf_to_images")
 async def convert_pdf_to_images(pdf_path: Path, file_id: str) -> list[str]:
     """Convert PDF to images using pdf2image"""
     output_dir = UPLOAD_DIR / file_id
@@ -54,6 +65,7 @@ async def convert_pdf_to_images(pdf_path: Path, file_id: str) -> list[str]:
     
     return image_paths if image_paths else []
 
+@traced("file_converter.convert_image_to_images")
 async def convert_image_to_images(image_path: Path, file_id: str) -> list[str]:
     """Process image file (just return the path)"""
     # For images, we can return them as-is or create a copy
@@ -71,6 +83,7 @@ async def convert_image_to_images(image_path: Path, file_id: str) -> list[str]:
     
     return [str(output_path)]
 
+@traced("file_converter.convert_txt_to_images")
 async def convert_txt_to_images(txt_path: Path, file_id: str) -> list[str]:
     """Convert text file to image"""
     output_dir = UPLOAD_DIR / file_id
@@ -116,6 +129,7 @@ async def convert_txt_to_images(txt_path: Path, file_id: str) -> list[str]:
     
     return images if images else []
 
+@traced("file_converter.convert_office_to_pdf")
 async def convert_office_to_pdf(file_path: Path, file_id: str) -> Path:
     """Convert Office files (xlsx, docx) to PDF using LibreOffice"""
     output_dir = UPLOAD_DIR / file_id
@@ -165,3 +179,54 @@ async def convert_office_to_pdf(file_path: Path, file_id: str) -> Path:
     
     return pdf_path
 
+@traced("file_converter.extract_text")
+async def extract_text(file_path: Path) -> list[str]:
+    """Extract plain text from a file, one entry per page
+
+    Images have no text layer and return an empty list.
+    """
+    file_ext = file_path.suffix.lower()
+    file_id = file_path.stem
+
+    if file_ext == ".pdf":
+        return await extract_pdf_text(file_path)
+    elif file_ext == ".txt":
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+            return [f.read()]
+    elif file_ext in {".xlsx", ".docx"}:
+        # Reuse the PDF rendered for the page images when it exists
+        pdf_path = UPLOAD_DIR / file_id / f"{file_path.stem}.pdf"
+        if not pdf_path.exists():
+            pdf_path = await convert_office_to_pdf(file_path, file_id)
+        return await extract_pdf_text(pdf_path)
+    elif file_ext in {".png", ".jpg", ".jpeg"}:
+        return []
+    else:
+        raise ValueError(f"Unsupported file type: {file_ext}")
+
+@traced("file_converter.extract_pdf_text")
+async def extract_pdf_text(pdf_path: Path) -> list[str]:
+    """Extract the text layer of a PDF using pdftotext (poppler-utils)"""
+    pdftotext_cmd = shutil.which("pdftotext")
+    if not pdftotext_cmd:
+        raise RuntimeError("pdftotext not found. Please ensure poppler-utils is installed.")
+
+    loop = asyncio.get_event_loop()
+
+    def run_pdftotext():
+        result = subprocess.run(
+            [pdftotext_cmd, "-layout", "-enc", "UTF-8", str(pdf_path), "-"],
+            capture_output=True,
+            timeout=120
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"pdftotext failed: {result.stderr.decode('utf-8', errors='replace')}")
+        return result.stdout.decode("utf-8", errors="replace")
+
+    text = await loop.run_in_executor(None, run_pdftotext)
+
+    # pdftotext separates pages with form feeds
+    pages = text.split("\f")
+    if pages and not pages[-1].strip():
+        pages = pages[:-1]
+    return pages
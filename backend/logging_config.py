@@ -1,7 +1,27 @@
-"""Centralized logging configuration for the application"""
+"""Centralized logging configuration for the application
+
+Records are handed to a queue on the calling thread and written to stdout and
+the rotating log file by a ``QueueListener`` thread, so logging never does
+console or disk I/O on the event loop.
+"""
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
 import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Optional
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE, LOG_DEBUG_SAMPLE_RATE
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # Optional: log lines show "-" as trace ID without it
+    otel_trace = None
 
 # Create logs directory
 LOGS_DIR = Path("/app/logs")
@@ -13,53 +33,183 @@ except (PermissionError, OSError):
     LOGS_DIR.mkdir(exist_ok=True)
 
 
+class TraceContextFilter(logging.Filter):
+    """Adds ``trace_id`` and ``span_id`` of the active span to every record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = "-"
+        record.span_id = "-"
+        if otel_trace is not None:
+            context = otel_trace.get_current_span().get_span_context()
+            if context.is_valid:
+                record.trace_id = format(context.trace_id, "032x")
+                record.span_id = format(context.span_id, "016x")
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps only a fraction of DEBUG records; INFO and above always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f"{record.filename}:{record.lineno}",
+            "thread": record.threadName,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "span_id": getattr(record, "span_id", "-"),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full
+
+    The message and traceback are rendered on the calling thread (arguments
+    may not be safe to read later), but formatting into the final line is
+    left to the listener's handlers.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = message
+        record.message = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Loggers of libraries that log every request at INFO/DEBUG
+NOISY_LOGGERS = ("httpx", "httpcore", "multipart", "PIL", "urllib3")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
 def setup_logging(
-    log_level: str = "INFO",
-    log_file: str = "app.log"
+    log_level: str = LOG_LEVEL,
+    log_file: str = "app.log",
+    log_format: str = LOG_FORMAT
 ) -> logging.Logger:
     """
     Configure application logging with both file and console handlers
 
+    The handlers sit behind a queue on the root logger, so module loggers
+    (``get_logger(__name__)``) reach them as well as "ollama_chat".
+
     Args:
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-        log_file: Name of the log file
+        log_file: Name of the log file (rotated at ``LOG_MAX_BYTES``)
+        log_format: "text" or "json"
 
     Returns:
         Configured logger instance
     """
-    # Create logger
+    global _listener, _queue_handler
+
     logger = logging.getLogger("ollama_chat")
-    logger.setLevel(getattr(logging, log_level.upper()))
 
     # Prevent duplicate handlers
-    if logger.handlers:
+    if _listener is not None:
         return logger
 
+    if log_format.lower() == "json":
+        console_format = file_format = JsonFormatter()
+    else:
+        console_format = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [trace=%(trace_id)s] - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        file_format = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - [trace=%(trace_id)s span=%(span_id)s] - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+
     # Console handler - INFO and above
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
-    console_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
     console_handler.setFormatter(console_format)
 
     # File handler - DEBUG and above
-    file_handler = logging.FileHandler(LOGS_DIR / log_file)
-    file_handler.setLevel(logging.DEBUG)
-    file_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+    file_handler = RotatingFileHandler(
+        LOGS_DIR / log_file,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8"
     )
+    file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(file_format)
 
-    # Add handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Filters run on the calling thread, where the active span is visible
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+    _queue_handler.addFilter(TraceContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, log_level.upper()))
+    root.addHandler(_queue_handler)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = QueueListener(_queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
     return logger
 
 
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        if _queue_handler.dropped:
+            print(f"Logging queue was full; {_queue_handler.dropped} records were dropped", file=sys.stderr)
+
+
+def dropped_log_records() -> int:
+    """Records dropped because the logging queue was full"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
 def get_logger(name: str = "ollama_chat") -> logging.Logger:
     """
     Get a logger instance
@@ -1,14 +1,27 @@
 """Main FastAPI application"""
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from database import Base, engine, ensure_columns_exist
-from routers import models, users, chat, upload, feedback, notes, api_keys, scrape, news, prompts, debates
+from database import Base, engine, SessionLocal, ensure_columns_exist
+from models import NoteLabel, ChatMessage, ModelUsageStat
+from routers import models, users, chat, upload, feedback, notes, api_keys, scrape, news, prompts, debates, jobs, cache, search, presets
+from services.job_worker import JobWorkerPool
+from services.cloud_providers import CompletionProvider
+from services.ollama_pool import ollama_pool
+from services.job_handlers import register_default_handlers
+from services.note_labels import NoteLabelIndex
+from services.usage_stats import schedule_usage_stats_rebuild
+from services.api_key_store import encrypt_existing_keys
 from logging_config import setup_logging, get_logger
+from config import METRICS_ENABLED
+from metrics import PrometheusMiddleware, render_metrics
+from tracing import setup_tracing, TracingMiddleware
+from profiling import ProfilingMiddleware
 
 # Initialize logging
-setup_logging(log_level="INFO")
+setup_logging()
 logger = get_logger(__name__)
+setup_tracing()
 
 # Create tables
 Base.metadata.create_all(bind=engine)
@@ -19,6 +32,29 @@ try:
 except Exception as e:
     logger.warning(f"Could not ensure columns exist: {e}")
 
+# Index labels of notes created before the note_labels table existed
+try:
+    with SessionLocal() as db:
+        if db.query(NoteLabel.id).first() is None:
+            NoteLabelIndex(db).backfill()
+except Exception as e:
+    logger.warning(f"Could not backfill note label index: {e}")
+
+# Build the usage stats rollup for messages written before it existed
+try:
+    with SessionLocal() as db:
+        if db.query(ModelUsageStat.id).first() is None and db.query(ChatMessage.id).first() is not None:
+            schedule_usage_stats_rebuild(db)
+except Exception as e:
+    logger.warning(f"Could not schedule usage stats rebuild: {e}")
+
+# Encrypt API keys stored before API_KEY_ENCRYPTION_KEY was set
+try:
+    with SessionLocal() as db:
+        encrypt_existing_keys(db)
+except Exception as e:
+    logger.warning(f"Could not encrypt stored API keys: {e}")
+
 app = FastAPI(title="Ollama Chat API")
 
 # CORS middleware
@@ -30,6 +66,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 app.include_router(models.router)
 app.include_router(users.router)
@@ -42,11 +83,37 @@ app.include_router(api_keys.router)
 app.include_router(scrape.router)
 app.include_router(news.router)
 app.include_router(debates.router)
+app.include_router(jobs.router)
+app.include_router(cache.router)
+app.include_router(search.router)
+app.include_router(presets.router)
+
+# Background job workers (note generation etc.)
+register_default_handlers()
+job_workers = JobWorkerPool()
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_workers.start()
+    ollama_pool.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_workers.stop()
+    await ollama_pool.stop()
+    await CompletionProvider.close_clients()
 
 @app.get("/")
 async def root():
     return {"message": "Ollama Chat API"}
 
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Prometheus scrape endpoint"""
+        body, content_type = render_metrics()
+        return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,272 @@
+"""Prometheus metrics for the backend
+
+Collectors are module-level singletons in the default registry and are
+exposed by ``GET /metrics`` (see main.py). Values are per process.
+"""
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, Tuple
+
+import httpx
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+from logging_config import get_logger, dropped_log_records
+from tracing import start_span
+
+logger = get_logger(__name__)
+
+# Seconds; generation requests can take minutes on CPU-only hosts
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts (headers sent), per route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+SSE_ACTIVE_STREAMS = Gauge(
+    "sse_active_streams",
+    "Server-sent event streams currently open",
+    ["endpoint"]
+)
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "upstream_request_duration_seconds",
+    "Duration of requests to Ollama and cloud providers (streams: until the last chunk)",
+    ["provider", "operation"],
+    buckets=LATENCY_BUCKETS
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total",
+    "Failed requests to Ollama and cloud providers",
+    ["provider", "operation", "reason"]
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Retried requests to cloud providers",
+    ["provider", "reason"]
+)
+UPSTREAM_HEDGES = Counter(
+    "upstream_hedged_requests_total",
+    "Hedged (duplicate) requests to cloud providers by which request answered first",
+    ["provider", "winner"]
+)
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state per provider (0 closed, 1 half-open, 2 open)",
+    ["provider"]
+)
+RATE_LIMIT_WAIT = Histogram(
+    "rate_limit_wait_seconds",
+    "Time cloud requests queued for client-side rate limit budget",
+    ["provider"],
+    buckets=LATENCY_BUCKETS
+)
+RATE_LIMIT_REJECTED = Counter(
+    "rate_limit_rejected_total",
+    "Cloud requests rejected because the budget would not free up within RATE_LIMIT_MAX_WAIT",
+    ["provider"]
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "SQLAlchemy connection pool usage",
+    ["state"]
+)
+FILE_CONVERSION_DURATION = Histogram(
+    "file_conversion_duration_seconds",
+    "Time to convert an uploaded file to page images",
+    ["file_type"],
+    buckets=LATENCY_BUCKETS
+)
+BACKGROUND_JOBS = Gauge(
+    "background_jobs",
+    "Background jobs per status (queue depth is status=\"queued\")",
+    ["status"]
+)
+CHAT_CONTEXT_PREFIX = Counter(
+    "chat_context_prefix_total",
+    "Ollama chat turns by how their context relates to the previous turn (stable prefixes can reuse the KV cache)",
+    ["outcome"]
+)
+PROMPT_EVAL_DURATION = Histogram(
+    "ollama_prompt_eval_duration_seconds",
+    "Prompt evaluation (prefill) time reported by Ollama per chat turn",
+    ["prefix"],
+    buckets=LATENCY_BUCKETS
+)
+OLLAMA_BACKEND_UP = Gauge(
+    "ollama_backend_up",
+    "Whether an Ollama backend is routed to (1) or skipped after failing (0)",
+    ["backend"]
+)
+OLLAMA_BACKEND_IN_FLIGHT = Gauge(
+    "ollama_backend_in_flight",
+    "Requests in flight per Ollama backend",
+    ["backend"]
+)
+LOG_RECORDS_DROPPED = Gauge(
+    "log_records_dropped",
+    "Log records dropped since startup because the logging queue was full"
+)
+
+
+def error_reason(error: BaseException) -> str:
+    """Low-cardinality label for a failed upstream call"""
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "connection"
+    status_code = getattr(error, "status_code", None)
+    if status_code:
+        return str(status_code)
+    return type(error).__name__
+
+
+@contextmanager
+def track_upstream(provider: str, operation: str) -> Iterator[None]:
+    """
+    Time an upstream call and count its failures
+
+    Closing a stream early (the consumer stops after the final chunk) or a
+    client disconnect is recorded as a duration, not as an error.
+
+    Args:
+        provider: Provider name ("ollama", "gpt", "claude", ...)
+        operation: "complete", "stream" or "embed"
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(provider=provider, operation=operation, reason=error_reason(e)).inc()
+        raise
+    finally:
+        UPSTREAM_REQUEST_DURATION.labels(provider=provider, operation=operation).observe(
+            time.perf_counter() - start_time
+        )
+
+
+async def track_sse(stream: AsyncIterator[str], endpoint: str) -> AsyncIterator[str]:
+    """
+    Wrap an SSE generator so it is counted in ``sse_active_streams`` while open
+
+    The stream is also traced as an ``sse.stream`` span with a ``first_event``
+    event and the number of events sent.
+
+    Args:
+        stream: Event generator passed to StreamingResponse
+        endpoint: Label for the stream ("chat", "debate", "note", "model_pull")
+    """
+    gauge = SSE_ACTIVE_STREAMS.labels(endpoint=endpoint)
+    gauge.inc()
+    events = 0
+    with start_span("sse.stream", {"sse.endpoint": endpoint}, current=False) as span:
+        try:
+            async for event in stream:
+                if events == 0:
+                    span.add_event("first_event")
+                events += 1
+                yield event
+        finally:
+            span.set_attribute("sse.events", events)
+            gauge.dec()
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording ``http_request_duration_seconds``
+
+    The duration ends when the response starts, so long-lived SSE responses
+    report their time to first byte instead of the stream length. Routes are
+    labelled with their path template to keep cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        recorded = False
+
+        def observe(status_code: int) -> None:
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status_code)
+            ).observe(time.perf_counter() - start_time)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            observe(500)
+            raise
+
+
+def _collect_db_pool() -> None:
+    from database import engine
+
+    pool = engine.pool
+    for state, reader in (
+        ("size", "size"),
+        ("checked_out", "checkedout"),
+        ("checked_in", "checkedin"),
+        ("overflow", "overflow"),
+    ):
+        method = getattr(pool, reader, None)
+        if method is not None:
+            try:
+                value = method()
+                # QueuePool reports overflow as negative while below pool_size
+                DB_POOL_CONNECTIONS.labels(state=state).set(max(value, 0) if state == "overflow" else value)
+            except Exception:
+                # Pools without sizing (e.g. SQLite's) do not support every reader
+                pass
+
+
+def _collect_job_queue() -> None:
+    from database import SessionLocal
+    from services.job_queue import JobQueue
+
+    with SessionLocal() as db:
+        depth = JobQueue(db).queue_depth()
+    for status in (JobQueue.STATUS_QUEUED, JobQueue.STATUS_RUNNING, JobQueue.STATUS_SUCCEEDED, JobQueue.STATUS_FAILED):
+        BACKGROUND_JOBS.labels(status=status).set(depth.get(status, 0))
+
+
+def _collect_ollama_pool() -> None:
+    from services.ollama_pool import ollama_pool
+
+    for backend in ollama_pool.status():
+        OLLAMA_BACKEND_UP.labels(backend=backend["url"]).set(1 if backend["healthy"] else 0)
+        OLLAMA_BACKEND_IN_FLIGHT.labels(backend=backend["url"]).set(backend["in_flight"])
+
+
+def _collect_logging() -> None:
+    LOG_RECORDS_DROPPED.set(dropped_log_records())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Refresh scrape-time gauges and render the registry
+
+    Returns:
+        Tuple of (body, content type) in the Prometheus text format
+    """
+    for collect in (_collect_db_pool, _collect_job_queue, _collect_ollama_pool, _collect_logging):
+        try:
+            collect()
+        except Exception as e:
+            logger.warning(f"Could not collect {collect.__name__[9:]} metrics: {e}")
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean, Float, LargeBinary, UniqueConstraint, Index, Date, BigInteger
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -25,6 +25,14 @@ class ChatMessage(Base):
     is_cancelled = Column(Boolean, default=False)  # Flag to indicate if generation was cancelled
     prompt_tokens = Column(Integer, nullable=True)  # Number of prompt tokens
     completion_tokens = Column(Integer, nullable=True)  # Number of completion tokens
+    # Generation latency (assistant messages; null for cache hits and cancelled replies)
+    ttft_ms = Column(Float, nullable=True)  # Time from request to first content token
+    total_duration_ms = Column(Float, nullable=True)  # Wall-clock time of the whole generation
+    tokens_per_second = Column(Float, nullable=True)  # Decode rate
+    load_duration_ms = Column(Float, nullable=True)  # Ollama model load time
+    prompt_eval_duration_ms = Column(Float, nullable=True)  # Ollama prompt processing time
+    eval_duration_ms = Column(Float, nullable=True)  # Ollama token generation time
+    queue_ms = Column(Float, nullable=True)  # Time queued for the provider's rate limit budget (cloud models)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="messages")
@@ -45,6 +53,10 @@ class MessageFeedback(Base):
 
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        # Keyset pagination of a user's note list: (created_at, id) descending
+        Index("ix_notes_user_deleted_created", "user_id", "is_deleted", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
@@ -55,9 +67,27 @@ class Note(Base):
     prompt = Column(Text)  # User's prompt/instruction for note generation
     labels = Column(JSON, nullable=True) # Array of labels for the note
     is_deleted = Column(Boolean, default=False) # Flag to indicate if note is in trash
+    status = Column(String(20), default='completed') # generating, completed, failed
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User")
+    label_rows = relationship("NoteLabel", back_populates="note", cascade="all, delete-orphan", passive_deletes=True)
+
+class NoteLabel(Base):
+    __tablename__ = "note_labels"  # Normalized copy of Note.labels for label filters and facet counts
+    __table_args__ = (
+        UniqueConstraint("note_id", "label", name="uq_note_labels_note_label"),
+        # Facet counts are answered from this index without touching notes
+        Index("ix_note_labels_user_deleted_label", "user_id", "is_deleted", "label"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # Denormalized from notes.user_id
+    label = Column(String(100), nullable=False)
+    is_deleted = Column(Boolean, nullable=False, default=False)  # Mirrors notes.is_deleted so trashed notes drop out of facets
+
+    note = relationship("Note", back_populates="label_rows")
 
 class CloudApiKey(Base):
     __tablename__ = "cloud_api_keys"
@@ -170,3 +200,123 @@ class DebateVote(Base):
     user = relationship("User")
     winner_participant = relationship("DebateParticipant", back_populates="votes_received", foreign_keys=[winner_participant_id])
 
+
+class BackgroundJob(Base):
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False, index=True)  # e.g. "note_generation"
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # Owner used for per-user concurrency caps
+    payload = Column(JSON, nullable=True)  # Handler-specific arguments
+    dedupe_key = Column(String(200), nullable=True, index=True)  # Prevents duplicate queued jobs for the same work
+    status = Column(String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, default=datetime.utcnow, index=True)  # Earliest time the job may be claimed (backoff)
+    locked_by = Column(String(100), nullable=True)  # Worker identifier holding the job
+    locked_at = Column(DateTime, nullable=True)  # Last heartbeat of the lease; stale leases are requeued
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    user = relationship("User")
+
+
+class ResponseCacheEntry(Base):
+    __tablename__ = "response_cache_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), nullable=False, unique=True, index=True)  # sha256 of (model, normalized messages, options)
+    model = Column(String, nullable=False, index=True)
+    content = Column(Text, nullable=False)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)  # Used for LRU eviction
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class Embedding(Base):
+    __tablename__ = "embeddings"
+    __table_args__ = (
+        UniqueConstraint("source_type", "source_id", "model", name="uq_embeddings_source_model"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    source_type = Column(String(20), nullable=False, index=True)  # "message" or "note"
+    source_id = Column(Integer, nullable=False)
+    model = Column(String, nullable=False)  # Embedding model name
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # float32 array bytes
+    content_hash = Column(String(64), nullable=False)  # sha256 of the embedded text, used to detect edits
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Document(Base):
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(String, nullable=False, unique=True, index=True)  # Upload id (file stored as UPLOAD_DIR/{file_id}{ext})
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(String, nullable=True, index=True)  # Chat session the document is attached to
+    filename = Column(String, nullable=False)
+    status = Column(String(20), nullable=False, default='pending', index=True)  # pending, indexing, ready, empty, failed
+    chunk_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = relationship("User")
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)  # Position within the document
+    page = Column(Integer, nullable=True)  # 1-based page the chunk starts on
+    content = Column(Text, nullable=False)
+    model = Column(String, nullable=False)  # Embedding model name
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # float32 array bytes
+
+    document = relationship("Document", back_populates="chunks")
+
+
+class ModelUsageStat(Base):
+    __tablename__ = "model_usage_stats"  # Per user/model/day rollup maintained on every message, debate message and feedback write
+    __table_args__ = (
+        UniqueConstraint("user_id", "model", "day", name="uq_model_usage_stats_user_model_day"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    model = Column(String, nullable=False)
+    day = Column(Date, nullable=False)  # UTC date the counted rows were created
+    chat_messages = Column(Integer, nullable=False, default=0)  # User and assistant chat messages
+    debate_messages = Column(Integer, nullable=False, default=0)  # Participant messages in debates created by the user
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    positive_feedback = Column(Integer, nullable=False, default=0)
+    negative_feedback = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ModelPreset(Base):
+    __tablename__ = "model_presets"  # Generation options applied to every request a user sends to a model
+    __table_args__ = (
+        UniqueConstraint("user_id", "model", name="uq_model_presets_user_model"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    model = Column(String, nullable=False)
+    options = Column(JSON, nullable=False)  # GenerationOptions fields that are set (temperature, num_ctx, keep_alive, ...)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,151 @@
+"""On-demand sampling profiler for hot endpoints
+
+Profiles are written per request as folded stacks (``frame;frame;frame count``)
+to ``LOGS_DIR/profiles``. They open directly in speedscope and convert to SVG
+with ``flamegraph.pl``.
+"""
+import hmac
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import PROFILING_ENABLED, PROFILING_ADMIN_TOKEN, PROFILING_INTERVAL
+from logging_config import LOGS_DIR, get_logger
+
+logger = get_logger(__name__)
+
+PROFILES_DIR = LOGS_DIR / "profiles"
+PROFILE_HEADER = "x-profile"
+
+# (method, path pattern) of the endpoints that can be profiled
+PROFILED_ENDPOINTS = [
+    ("POST", re.compile(r"^/api/chat$")),
+    ("POST", re.compile(r"^/api/upload$")),
+    ("POST", re.compile(r"^/api/debates/\d+/turn$")),
+]
+
+# Only one request is profiled at a time; sampling every thread is not free
+_active_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads at a fixed interval
+
+    The event loop thread runs every request, so concurrent requests appear in
+    the profile too; executor threads (PDF rendering, LibreOffice calls) are
+    included under their thread names.
+    """
+
+    def __init__(self, interval: float = PROFILING_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+    def write(self, path: Path) -> None:
+        """Write the samples as folded stacks, most frequent first"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _profiled_endpoint(method: str, path: str) -> bool:
+    return any(method == m and pattern.match(path) for m, pattern in PROFILED_ENDPOINTS)
+
+
+def _header_requests_profile(scope) -> bool:
+    if not PROFILING_ADMIN_TOKEN:
+        return False
+    for key, value in scope.get("headers", []):
+        if key == PROFILE_HEADER.encode():
+            return hmac.compare_digest(value.decode("latin-1"), PROFILING_ADMIN_TOKEN)
+    return False
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling ``PROFILED_ENDPOINTS``
+
+    Active for every matching request with ``PROFILING_ENABLED``, or per
+    request when the ``X-Profile`` header carries ``PROFILING_ADMIN_TOKEN``.
+    The profile covers the whole response including streamed bodies; its ID
+    is returned in the ``X-Profile-Id`` header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not _profiled_endpoint(scope["method"], scope["path"])
+            or not (PROFILING_ENABLED or _header_requests_profile(scope))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if not _active_lock.acquire(blocking=False):
+            logger.info(f"Skipping profile of {scope['method']} {scope['path']}: another request is being profiled")
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        endpoint = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")
+        path = PROFILES_DIR / f"{profile_id}_{scope['method'].lower()}_{endpoint}.folded"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            _active_lock.release()
+            try:
+                profiler.write(path)
+                logger.info(
+                    f"Profiled {scope['method']} {scope['path']} for {profiler.duration:.2f}s "
+                    f"({profiler.samples} samples) -> {path}"
+                )
+            except OSError as e:
+                logger.warning(f"Could not write profile {path}: {e}")
@@ -5,8 +5,10 @@ from typing import List, Optional
 
 from database import get_db
 from models import User, CloudApiKey
-from schemas import CloudApiKeyCreate, CloudApiKeyResponse, CloudApiKeyTestRequest
+from schemas import CloudApiKeyCreate, CloudApiKeyResponse, CloudApiKeyTestRequest, ProviderBudgetResponse
 from services.api_key_validator import ApiKeyValidator
+from services.api_key_store import ApiKeyStore
+from services.rate_limiter import rate_limiter
 
 router = APIRouter(prefix="/api/api-keys", tags=["api-keys"])
 
@@ -47,29 +49,24 @@ async def create_api_key(
     if not is_valid:
         raise HTTPException(status_code=400, detail=message)
     
-    # Check if API key already exists for this user and provider
-    existing_key = db.query(CloudApiKey).filter(
-        CloudApiKey.user_id == request.user_id,
-        CloudApiKey.provider == request.provider
-    ).first()
-    
-    if existing_key:
-        # Update existing key
-        existing_key.api_key = request.api_key
-        db.commit()
-        db.refresh(existing_key)
-        return existing_key
-    else:
-        # Create new key
-        api_key = CloudApiKey(
-            user_id=request.user_id,
-            provider=request.provider,
-            api_key=request.api_key
-        )
-        db.add(api_key)
-        db.commit()
-        db.refresh(api_key)
-        return api_key
+    # Create or update (stored encrypted when API_KEY_ENCRYPTION_KEY is set)
+    return ApiKeyStore(db).save(request.user_id, request.provider, request.api_key)
+
+@router.get("/budget/{user_id}", response_model=List[ProviderBudgetResponse])
+async def get_rate_limit_budget(user_id: int, db: Session = Depends(get_db)):
+    """Get the remaining per-minute request and token budget for each cloud provider"""
+    # Verify user exists
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    providers_with_key = {
+        provider for (provider,) in db.query(CloudApiKey.provider).filter(CloudApiKey.user_id == user_id)
+    }
+    return [
+        {**budget, "has_key": budget["provider"] in providers_with_key}
+        for budget in rate_limiter.status(user_id)
+    ]
 
 @router.get("/{user_id}", response_model=List[CloudApiKeyResponse])
 async def get_api_keys(user_id: int, db: Session = Depends(get_db)):
@@ -105,15 +102,7 @@ async def delete_api_key(user_id: int, provider: str, db: Session = Depends(get_
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    api_key = db.query(CloudApiKey).filter(
-        CloudApiKey.user_id == user_id,
-        CloudApiKey.provider == provider
-    ).first()
-    
-    if not api_key:
+    if not ApiKeyStore(db).delete(user_id, provider):
         raise HTTPException(status_code=404, detail="API key not found")
     
-    db.delete(api_key)
-    db.commit()
-    
     return {"message": "API key deleted successfully"}
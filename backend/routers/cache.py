@@ -0,0 +1,22 @@
+"""Router for response cache endpoints"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from services.response_cache import ResponseCache
+
+router = APIRouter(prefix="/api/cache", tags=["cache"])
+
+
+@router.get("/stats")
+async def get_cache_stats(db: Session = Depends(get_db)):
+    """Get response cache hit/miss counters and size"""
+    return ResponseCache(db).stats()
+
+
+@router.delete("")
+async def clear_cache(model: Optional[str] = None, db: Session = Depends(get_db)):
+    """Clear cached responses, optionally only for one model"""
+    deleted = ResponseCache(db).clear(model)
+    return {"message": "Cache cleared", "deleted": deleted}
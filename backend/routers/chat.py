@@ -9,8 +9,12 @@ from collections import defaultdict
 from database import get_db
 from models import User, ChatMessage
 from schemas import ChatRequest
-from utils.text_utils import truncate_with_ellipsis
+from utils.text_utils import truncate_with_ellipsis, build_snippet
 from services.chat_service import ChatService
+from services.cloud_providers import ProviderError
+from services.sse import encode_chat_events
+from services.semantic_search import SemanticSearch, SEARCH_MODES, SOURCE_MESSAGE
+from metrics import track_sse
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
@@ -23,7 +27,7 @@ async def chat(
     """Send a chat message and get streaming response"""
     chat_service = ChatService(db)
     return StreamingResponse(
-        chat_service.process_message(request),
+        track_sse(encode_chat_events(chat_service.stream_events(request)), "chat"),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -103,11 +107,19 @@ async def get_chat_sessions(user_id: int, db: Session = Depends(get_db)):
     return {"sessions": session_list}
 
 @router.get("/search/{user_id}")
-async def search_chat_history(user_id: int, q: str, db: Session = Depends(get_db)):
-    """Search chat history for a user - Optimized to avoid N+1 queries"""
+async def search_chat_history(user_id: int, q: str, mode: str = "keyword", db: Session = Depends(get_db)):
+    """Search chat history for a user - Optimized to avoid N+1 queries
+
+    ``mode`` selects keyword (substring), semantic or hybrid ranking.
+    """
     if not q or len(q.strip()) == 0:
         return {"results": []}
 
+    if mode != "keyword":
+        if mode not in SEARCH_MODES:
+            raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+        return {"results": await _semantic_session_results(user_id, q.strip(), mode, db)}
+
     search_query = f"%{q.strip()}%"
 
     # Single query to get all matching messages with session info
@@ -199,3 +211,38 @@ async def get_user_files(user_id: int, db: Session = Depends(get_db)):
     
     return {"files": files}
 
+
+async def _semantic_session_results(user_id: int, query: str, mode: str, db: Session) -> list:
+    """Rank messages semantically and group them into session results (best match first)"""
+    try:
+        hits = await SemanticSearch(db).search(user_id, query, (SOURCE_MESSAGE,), mode, limit=100)
+    except ProviderError as e:
+        raise HTTPException(status_code=502, detail=e.message)
+
+    results = []
+    results_by_session = {}
+    for hit in hits:
+        message = hit.record
+        if not message.session_id:
+            continue
+        result = results_by_session.get(message.session_id)
+        if result is None:
+            result = {
+                "session_id": message.session_id,
+                "title": truncate_with_ellipsis(message.content, 50) if message.role == "user" else "New Chat",
+                "snippet": build_snippet(message.content, query),
+                "created_at": message.created_at.isoformat(),
+                "updated_at": message.created_at.isoformat(),
+                "message_count": 0,
+                "model": message.model,
+                "score": hit.score
+            }
+            results_by_session[message.session_id] = result
+            results.append(result)
+        elif result["title"] == "New Chat" and message.role == "user":
+            result["title"] = truncate_with_ellipsis(message.content, 50)
+        result["message_count"] += 1
+        result["created_at"] = min(result["created_at"], message.created_at.isoformat())
+        result["updated_at"] = max(result["updated_at"], message.created_at.isoformat())
+
+    return results
@@ -14,6 +14,9 @@ from schemas import (
     DebateEvaluationResponse,
     DebateVoteCreate, DebateVoteResponse
 )
+from services.usage_stats import UsageStats
+from services.sse import encode_events
+from metrics import track_sse
 
 router = APIRouter(prefix="/api/debates", tags=["debates"])
 
@@ -231,7 +234,7 @@ async def send_debate_turn(
     # Use DebateService to generate streaming response
     debate_service = DebateService(db)
     return StreamingResponse(
-        debate_service.process_turn(request),
+        track_sse(encode_events(debate_service.process_turn(request)), "debate"),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -279,6 +282,8 @@ async def send_moderator_message(
 async def evaluate_debate(
     debate_id: int,
     model: Optional[str] = None,
+    use_cache: bool = False,
+    force_cache: bool = False,
     db: Session = Depends(get_db)
 ):
     """Trigger AI evaluation of the debate.
@@ -286,6 +291,8 @@ async def evaluate_debate(
     Args:
         debate_id: Debate session ID
         model: Optional evaluation model name (cloud model such as GPT / Claude / Gemini)
+        use_cache: Reuse a cached evaluation of an identical transcript
+        force_cache: Cache even though evaluation samples with temperature > 0
     """
     from services.debate_evaluator import DebateEvaluator
 
@@ -305,7 +312,7 @@ async def evaluate_debate(
         raise HTTPException(status_code=400, detail="Debate already evaluated")
 
     # Run evaluation
-    evaluator = DebateEvaluator(db)
+    evaluator = DebateEvaluator(db, use_cache=use_cache, force_cache=force_cache)
     try:
         await evaluator.evaluate_debate(debate_id, model)
         return {"message": "Evaluation completed", "debate_id": debate_id}
@@ -388,6 +395,7 @@ async def delete_debate(debate_id: int, db: Session = Depends(get_db)):
     if not debate:
         raise HTTPException(status_code=404, detail="Debate not found")
 
+    UsageStats(db).remove_debate(debate_id)
     db.delete(debate)
     db.commit()
 
@@ -0,0 +1,55 @@
+"""Router for background job status endpoints"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from database import get_db
+from models import BackgroundJob
+from services.job_queue import JobQueue
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+@router.get("/detail/{job_id}")
+async def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Get the status of a background job"""
+    job = JobQueue(db).get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return _format_job_response(job)
+
+
+@router.get("/{user_id}")
+async def get_user_jobs(
+    user_id: int,
+    status: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db)
+):
+    """Get recent background jobs for a user, optionally filtered by status"""
+    jobs = JobQueue(db).list_jobs(user_id, status=status, limit=min(max(limit, 1), 200))
+    return {"jobs": [_format_job_response(job) for job in jobs]}
+
+
+@router.get("")
+async def get_queue_stats(db: Session = Depends(get_db)):
+    """Get the number of jobs per status"""
+    return {"queue": JobQueue(db).queue_depth()}
+
+
+def _format_job_response(job: BackgroundJob) -> dict:
+    """Format background job for response"""
+    return {
+        "id": job.id,
+        "job_type": job.job_type,
+        "user_id": job.user_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "run_after": job.run_after.isoformat() if job.run_after else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
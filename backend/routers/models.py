@@ -5,9 +5,11 @@ import httpx
 import json
 import urllib.parse
 
-from config import OLLAMA_BASE_URL
 from utils.model_utils import detect_family, detect_type, get_model_description, get_popular_models
+from services.sse import encode_event
+from services.ollama_pool import ollama_pool
 from logging_config import get_logger
+from metrics import track_sse
 
 logger = get_logger(__name__)
 
@@ -18,15 +20,10 @@ async def get_models():
     """Get available Ollama models with download status"""
     popular_models = get_popular_models()
     
-    # Try to get downloaded models from Ollama
+    # Try to get downloaded models from Ollama (pulled on any backend)
     downloaded_models = []
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{OLLAMA_BASE_URL}/api/tags")
-            if response.status_code == 200:
-                downloaded_models = response.json().get("models", [])
-            else:
-                logger.error(f"Ollama API returned status {response.status_code}: {response.text}")
+        downloaded_models = await ollama_pool.list_models()
     except Exception as e:
         logger.exception(f"Error fetching downloaded models from Ollama")
         downloaded_models = []
@@ -86,17 +83,24 @@ async def get_models():
     
     return {"models": all_models}
 
+@router.get("/backends")
+async def get_backends():
+    """Health, pulled and loaded models, and in-flight requests of each Ollama backend"""
+    return {"backends": ollama_pool.status()}
+
 @router.post("/pull")
 async def pull_model(model_name: str):
-    """Download a model from Ollama"""
+    """Download a model from Ollama (to the least busy backend that lacks it)"""
+    backend = ollama_pool.backend_for_pull(model_name)
     try:
         async with httpx.AsyncClient(timeout=600.0) as client:
             response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/pull",
+                f"{backend.url}/api/pull",
                 json={"name": model_name},
                 timeout=600.0
             )
             if response.status_code == 200:
+                ollama_pool.model_pulled(backend, model_name)
                 return {"status": "success", "message": f"Model {model_name} is being downloaded"}
             else:
                 raise HTTPException(status_code=response.status_code, detail=f"Failed to download model: {response.text}")
@@ -108,18 +112,20 @@ async def pull_model(model_name: str):
 @router.get("/pull/{model_name}")
 async def get_pull_status(model_name: str):
     """Get download status for a model (streaming)"""
+    backend = ollama_pool.backend_for_pull(model_name)
+
     async def generate_pull_stream():
         try:
             async with httpx.AsyncClient(timeout=600.0) as client:
                 async with client.stream(
                     "POST",
-                    f"{OLLAMA_BASE_URL}/api/pull",
+                    f"{backend.url}/api/pull",
                     json={"name": model_name},
                     timeout=600.0
                 ) as response:
                     if response.status_code != 200:
                         error_text = await response.aread()
-                        yield f"data: {json.dumps({'error': f'Failed to download model: {error_text.decode()}'})}\n\n"
+                        yield encode_event({'error': f'Failed to download model: {error_text.decode()}'})
                         return
                     
                     async for line in response.aiter_lines():
@@ -127,19 +133,20 @@ async def get_pull_status(model_name: str):
                             continue
                         try:
                             chunk_data = json.loads(line)
-                            yield f"data: {json.dumps(chunk_data)}\n\n"
+                            yield encode_event(chunk_data)
                             
                             if chunk_data.get("status") == "success":
+                                ollama_pool.model_pulled(backend, model_name)
                                 break
                         except json.JSONDecodeError:
                             continue
         except httpx.TimeoutException:
-            yield f"data: {json.dumps({'error': 'Download timeout'})}\n\n"
+            yield encode_event({'error': 'Download timeout'})
         except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield encode_event({'error': str(e)})
     
     return StreamingResponse(
-        generate_pull_stream(),
+        track_sse(generate_pull_stream(), "model_pull"),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -155,22 +162,36 @@ async def delete_model(model_name: str):
         # Decode URL-encoded model name
         decoded_name = urllib.parse.unquote(model_name)
         
+        # Delete from every backend that has the model
+        deleted = False
+        response = None
         async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.request(
-                "DELETE",
-                f"{OLLAMA_BASE_URL}/api/delete",
-                json={"name": decoded_name},
-                timeout=60.0
-            )
-            if response.status_code == 200:
-                return {"status": "success", "message": f"Model {decoded_name} has been deleted"}
-            else:
+            for backend in ollama_pool.backends_with_model(decoded_name):
                 try:
-                    error_text = await response.aread()
-                    error_msg = error_text.decode() if error_text else response.text
-                except:
-                    error_msg = f"HTTP {response.status_code}"
-                raise HTTPException(status_code=response.status_code, detail=f"Failed to delete model: {error_msg}")
+                    response = await client.request(
+                        "DELETE",
+                        f"{backend.url}/api/delete",
+                        json={"name": decoded_name},
+                        timeout=60.0
+                    )
+                except httpx.TransportError as e:
+                    if len(ollama_pool.backends) == 1:
+                        raise
+                    logger.warning(f"Could not delete {decoded_name} from {backend.url}: {e}")
+                    continue
+                if response.status_code == 200:
+                    ollama_pool.model_deleted(backend, decoded_name)
+                    deleted = True
+        if deleted:
+            return {"status": "success", "message": f"Model {decoded_name} has been deleted"}
+        if response is None:
+            raise HTTPException(status_code=503, detail="Failed to delete model: no Ollama backend is reachable")
+        try:
+            error_text = await response.aread()
+            error_msg = error_text.decode() if error_text else response.text
+        except:
+            error_msg = f"HTTP {response.status_code}"
+        raise HTTPException(status_code=response.status_code, detail=f"Failed to delete model: {error_msg}")
     except HTTPException:
         raise
     except httpx.TimeoutException:
@@ -6,7 +6,7 @@ import os
 from typing import List, Optional
 
 from database import get_db
-from models import CloudApiKey
+from services.api_key_store import ApiKeyStore
 from logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -44,12 +44,7 @@ async def get_top_headlines(
     Get top headlines from Japan. Optionally filter by search query.
     """
     # 1. Try to get API key from user's settings
-    api_key_entry = db.query(CloudApiKey).filter(
-        CloudApiKey.user_id == user_id,
-        CloudApiKey.provider == "newsapi"
-    ).first()
-    
-    api_key = api_key_entry.api_key if api_key_entry else None
+    api_key = ApiKeyStore(db).get(user_id, "newsapi")
 
     logger.debug(f"News API request - user_id={user_id}, api_key_found={bool(api_key)}")
 
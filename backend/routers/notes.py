@@ -1,17 +1,60 @@
 """Router for note-related endpoints"""
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+import asyncio
+import base64
+import json
+import time
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, or_, and_
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Optional, List, Tuple, Dict, Any
 
 from database import get_db, SessionLocal
 from models import User, ChatMessage, Note, CloudApiKey
 from schemas import NoteCreateRequest, NoteResponse, NoteLabelsUpdateRequest
-from config import OLLAMA_BASE_URL
-from services.note_generator import NoteGenerator
+from config import OLLAMA_BASE_URL, NOTE_PREVIEW_LENGTH, NOTE_PAGE_MAX_LIMIT
+from services.job_queue import JobQueue
+from services.job_handlers import NOTE_GENERATION_JOB
+from services.note_stream import note_stream_broker
+from services.semantic_search import SemanticSearch, SEARCH_MODES, SOURCE_NOTE
+from services.note_search import NoteSearch
+from services.note_labels import NoteLabelIndex, LABEL_MATCH_MODES
+from services.cloud_providers import ProviderError
+from services.sse import encode_event
+from utils.text_utils import build_snippet
+from metrics import track_sse
 
 router = APIRouter(prefix="/api/notes", tags=["notes"])
 
 
+def build_note_summary(row) -> dict:
+    """
+    Build a note list entry without the full content
+
+    Args:
+        row: Row selected by the summary listing (includes ``preview``)
+
+    Returns:
+        Dictionary with note metadata and a short content preview
+    """
+    preview = " ".join((row.preview or "").split())
+    if len(row.preview or "") > NOTE_PREVIEW_LENGTH:
+        preview = preview[:NOTE_PREVIEW_LENGTH].rstrip() + "..."
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "session_id": row.session_id,
+        "title": row.title,
+        "model": row.model,
+        "labels": row.labels or [],
+        "is_deleted": row.is_deleted,
+        "status": row.status or "completed",
+        "created_at": row.created_at.isoformat(),
+        "preview": preview
+    }
+
+
 def build_note_response(note: Note) -> dict:
     """
     Build standardized note response dictionary
@@ -32,33 +75,17 @@ def build_note_response(note: Note) -> dict:
         "prompt": note.prompt,
         "labels": note.labels or [],
         "is_deleted": note.is_deleted,
+        "status": note.status or "completed",
         "created_at": note.created_at.isoformat()
     }
 
 
-async def generate_note_content(
-    user_id: int,
-    session_id: str,
-    model: str,
-    prompt: str,
-    note_id: int
-):
-    """Generate note content in the background using NoteGenerator service"""
-    db = SessionLocal()
-    try:
-        generator = NoteGenerator(db)
-        await generator.generate(user_id, session_id, model, prompt, note_id)
-    finally:
-        db.close()
-
-
 @router.post("")
 async def create_note(
     request: NoteCreateRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
-    """Create a new note and generate content in background"""
+    """Create a new note and queue a background job to generate its content"""
     # Verify user exists
     user = db.query(User).filter(User.id == request.user_id).first()
     if not user:
@@ -78,61 +105,191 @@ async def create_note(
         session_id=request.session_id,
         model=request.model,
         prompt=request.prompt,
-        labels=request.labels or [],
         title="生成中...",
-        content=""
+        content="",
+        status="generating"
     )
     db.add(note)
+    db.flush()
+    NoteLabelIndex(db).set_labels(note, request.labels)
     db.commit()
     db.refresh(note)
     
-    # Start background task to generate content
-    background_tasks.add_task(
-        generate_note_content,
-        request.user_id,
-        request.session_id,
-        request.model,
-        request.prompt,
-        note.id
+    # Queue generation; the job survives restarts and is retried on failure
+    job = JobQueue(db).enqueue(
+        NOTE_GENERATION_JOB,
+        payload={
+            "user_id": request.user_id,
+            "session_id": request.session_id,
+            "model": request.model,
+            "prompt": request.prompt,
+            "note_id": note.id,
+            "use_cache": request.use_cache,
+            "force_cache": request.force_cache
+        },
+        user_id=request.user_id,
+        dedupe_key=f"note:{note.id}"
     )
-    
-    return {
-        "id": note.id,
-        "user_id": note.user_id,
-        "session_id": note.session_id,
-        "title": note.title,
-        "content": note.content,
-        "model": note.model,
-        "prompt": note.prompt,
-        "labels": note.labels or [], "is_deleted": note.is_deleted,
-        "created_at": note.created_at.isoformat()
-    }
 
+    note_data = build_note_response(note)
+    note_data["job_id"] = job.id
+    return note_data
 
-@router.get("/{user_id}")
-async def get_notes(user_id: int, db: Session = Depends(get_db)):
-    """Get all non-deleted notes for a user"""
-    notes = db.query(Note).filter(
+
+def _validate_label_match(match: str) -> None:
+    if match not in LABEL_MATCH_MODES:
+        raise HTTPException(status_code=400, detail=f"match must be one of: {', '.join(LABEL_MATCH_MODES)}")
+
+
+@router.get("/labels/{user_id}")
+async def get_label_facets(
+    user_id: int,
+    labels: Optional[List[str]] = Query(None),
+    match: str = "all",
+    include_deleted: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Get note counts per label
+
+    With ``labels`` the counts are limited to notes matching that selection,
+    so a client can narrow a label filter step by step.
+    """
+    _validate_label_match(match)
+    return {"labels": NoteLabelIndex(db).facets(user_id, labels, match, include_deleted)}
+
+
+NOTE_LIST_VIEWS = ("summary", "full")
+
+
+def _encode_cursor(created_at: datetime, note_id: int) -> str:
+    payload = json.dumps({"c": created_at.isoformat(), "i": note_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["c"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_notes(
+    db: Session,
+    user_id: int,
+    is_deleted: bool,
+    view: str,
+    limit: Optional[int],
+    cursor: Optional[str],
+    labels: Optional[List[str]] = None,
+    match: str = "any"
+) -> dict:
+    """
+    List a user's notes newest first with keyset pagination
+
+    Pages are cut on (created_at, id), so later pages cost the same as the
+    first and stay stable while notes are added. The summary view selects
+    only light columns plus a content preview computed in SQL.
+
+    Args:
+        db: Database session
+        user_id: User ID
+        is_deleted: List trashed (True) or active (False) notes
+        view: "summary" or "full"
+        limit: Page size (all notes when omitted and no cursor is given)
+        cursor: ``next_cursor`` from the previous page
+        labels: Only notes with these labels
+        match: How labels combine ("any" or "all")
+
+    Returns:
+        Dict with notes and next_cursor (None on the last page)
+    """
+    if view not in NOTE_LIST_VIEWS:
+        raise HTTPException(status_code=400, detail=f"view must be one of: {', '.join(NOTE_LIST_VIEWS)}")
+    _validate_label_match(match)
+
+    if view == "summary":
+        query = db.query(
+            Note.id,
+            Note.user_id,
+            Note.session_id,
+            Note.title,
+            Note.model,
+            Note.labels,
+            Note.is_deleted,
+            Note.status,
+            Note.created_at,
+            func.substr(Note.content, 1, NOTE_PREVIEW_LENGTH + 1).label("preview"),
+        )
+    else:
+        query = db.query(Note)
+
+    query = query.filter(
         Note.user_id == user_id,
-        Note.is_deleted == False
-    ).order_by(Note.created_at.desc()).all()
-    
-    return {
-        "notes": [build_note_response(note) for note in notes]
-    }
+        Note.is_deleted == is_deleted
+    )
+    if labels:
+        query = NoteLabelIndex(db).filter_notes(query, user_id, labels, match)
+
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            Note.created_at < cursor_created_at,
+            and_(Note.created_at == cursor_created_at, Note.id < cursor_id)
+        ))
+        if limit is None:
+            limit = NOTE_PAGE_MAX_LIMIT
+
+    query = query.order_by(Note.created_at.desc(), Note.id.desc())
+    if limit is not None:
+        limit = max(1, min(limit, NOTE_PAGE_MAX_LIMIT))
+        # Fetch one extra row to know whether another page exists
+        rows = query.limit(limit + 1).all()
+    else:
+        rows = query.all()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    if view == "summary":
+        notes = [build_note_summary(row) for row in rows]
+    else:
+        notes = [build_note_response(note) for note in rows]
+    return {"notes": notes, "next_cursor": next_cursor}
+
+
+@router.get("/{user_id}")
+async def get_notes(
+    user_id: int,
+    labels: Optional[List[str]] = Query(None),
+    match: str = "any",
+    view: str = "summary",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get non-deleted notes for a user, newest first
+
+    Returns summaries (no full content) unless ``view=full``; load a note's
+    content with ``/detail/{note_id}``. Pass ``limit`` to paginate and follow
+    ``next_cursor``. ``labels``/``match`` (any or all) filter by label.
+    """
+    return _list_notes(db, user_id, False, view, limit, cursor, labels, match)
 
 
 @router.get("/trash/{user_id}")
-async def get_trash_notes(user_id: int, db: Session = Depends(get_db)):
-    """Get all deleted notes for a user"""
-    notes = db.query(Note).filter(
-        Note.user_id == user_id,
-        Note.is_deleted == True
-    ).order_by(Note.created_at.desc()).all()
-    
-    return {
-        "notes": [build_note_response(note) for note in notes]
-    }
+async def get_trash_notes(
+    user_id: int,
+    view: str = "summary",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get deleted notes for a user, newest first (same paging and views as the note list)"""
+    return _list_notes(db, user_id, True, view, limit, cursor)
 
 
 @router.get("/detail/{note_id}")
@@ -145,51 +302,177 @@ async def get_note_detail(note_id: int, db: Session = Depends(get_db)):
     return build_note_response(note)
 
 
+@router.get("/{note_id}/stream")
+async def stream_note(note_id: int, db: Session = Depends(get_db)):
+    """Stream note content as it is generated (server-sent events)
+
+    Emits the current content first, then ``content`` deltas until the note
+    reaches a final status. Events come from the in-process broker when the
+    generating worker runs in this process; otherwise the note row is polled.
+    """
+    note = db.query(Note).filter(Note.id == note_id).first()
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    return StreamingResponse(
+        track_sse(_note_event_stream(note_id), "note"),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+def _content_update(sent: str, content: str) -> Optional[Dict[str, Any]]:
+    """Event bringing a client that has ``sent`` up to ``content`` (None if it already has it)"""
+    if content == sent:
+        return None
+    if content.startswith(sent):
+        return {'content': content[len(sent):]}
+    return {'content': content, 'snapshot': True}
+
+
+async def _note_event_stream(note_id: int):
+    """Yield SSE events for a note until generation finishes
+
+    The snapshot is read after subscribing and is up to
+    ``NOTE_STREAM_COMMIT_INTERVAL`` behind the generator. Live chunks carry
+    their character offset in the note, so chunks the snapshot already holds
+    are skipped, and a gap (chunks published before subscribing or dropped
+    by a full queue) is filled from the database, at most once per poll
+    interval; the ``done`` event carries the final content.
+    """
+    # Seconds to wait for a broker event before re-reading the note row
+    poll_interval = 1.0
+
+    queue = note_stream_broker.subscribe(note_id)
+    db = SessionLocal()
+
+    def read_note():
+        db.expire_all()
+        return db.query(Note.title, Note.content, Note.status).filter(Note.id == note_id).first()
+
+    try:
+        row = read_note()
+        if not row:
+            yield encode_event({'error': 'Note not found'})
+            return
+
+        sent = row.content or ""
+        yield encode_event({'content': sent, 'snapshot': True, 'status': row.status})
+        last_read = time.monotonic()
+
+        status = row.status or "completed"
+        while status == "generating":
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                event = None
+
+            if event is not None:
+                if event.get("reset"):
+                    sent = ""
+                    yield encode_event(event)
+                    continue
+
+                if "offset" in event:
+                    offset, chunk = event["offset"], event["content"]
+                    if offset > len(sent) and time.monotonic() - last_read >= poll_interval:
+                        # Chunks were missed: catch up with the last committed content
+                        row = read_note()
+                        last_read = time.monotonic()
+                        content = row.content if row else None
+                        if content and len(content) > len(sent) and content.startswith(sent):
+                            yield encode_event({'content': content[len(sent):]})
+                            sent = content
+                    # Still a gap: drop the chunk, a later read or the done event fills it
+                    if offset <= len(sent) < offset + len(chunk):
+                        delta = chunk[len(sent) - offset:]
+                        sent += delta
+                        yield encode_event({'content': delta})
+                    continue
+
+                if event.get("done"):
+                    final = event.get("content", sent)
+                    update = _content_update(sent, final)
+                    if update:
+                        yield encode_event(update)
+                    sent = final
+                    event = {key: value for key, value in event.items() if key != "content"}
+                if "status" in event:
+                    status = event["status"]
+                yield encode_event(event)
+                continue
+
+            # No live events: resynchronize from the database
+            row = read_note()
+            last_read = time.monotonic()
+            if not row:
+                yield encode_event({'error': 'Note not found'})
+                return
+
+            content = row.content or ""
+            update = _content_update(sent, content)
+            if update:
+                yield encode_event(update)
+                sent = content
+
+            status = row.status or "completed"
+            if status == "completed":
+                yield encode_event({'done': True, 'title': row.title, 'status': status})
+            elif status == "failed":
+                yield encode_event({'error': content, 'status': status})
+    finally:
+        note_stream_broker.unsubscribe(note_id, queue)
+        db.close()
+
+
 @router.get("/search/{user_id}")
-async def search_notes(user_id: int, q: str, db: Session = Depends(get_db)):
-    """Search notes for a user"""
+async def search_notes(
+    user_id: int,
+    q: str,
+    mode: str = "keyword",
+    limit: int = 50,
+    offset: int = 0,
+    db: Session = Depends(get_db)
+):
+    """Search notes for a user (mode: keyword, semantic or hybrid)
+
+    Keyword results are ranked and paginated in the database and carry a
+    snippet instead of the full note content.
+    """
     if not q or len(q.strip()) == 0:
         return {"results": []}
-    
-    search_query = f"%{q.strip()}%"
-    
-    # Search in note title and content
-    matching_notes = db.query(Note).filter(
-        Note.user_id == user_id,
-        Note.is_deleted == False,
-        (Note.title.ilike(search_query) | Note.content.ilike(search_query))
-    ).order_by(Note.created_at.desc()).all()
-    
-    results = []
-    for note in matching_notes:
-        # Get matching snippet from content
-        snippet = ""
-        content_lower = note.content.lower()
-        query_lower = q.lower()
-        
-        # Try to find query in content
-        index = content_lower.find(query_lower)
-        if index >= 0:
-            start = max(0, index - 50)
-            end = min(len(note.content), index + len(q) + 50)
-            snippet = note.content[start:end]
-            if start > 0:
-                snippet = "..." + snippet
-            if end < len(note.content):
-                snippet = snippet + "..."
-        elif note.title.lower().find(query_lower) >= 0:
-            # If query found in title, use first part of content as snippet
-            snippet = note.content[:100] + "..." if len(note.content) > 100 else note.content
-        else:
-            # Fallback: use first part of content
-            snippet = note.content[:100] + "..." if len(note.content) > 100 else note.content
-
-        # Use base response and add snippet
-        note_data = build_note_response(note)
-        note_data["snippet"] = snippet
-        results.append(note_data)
-    
-    return {"results": results}
+
+    limit = max(1, min(limit, 200))
+    offset = max(0, offset)
+
+    if mode != "keyword":
+        if mode not in SEARCH_MODES:
+            raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+        try:
+            hits = await SemanticSearch(db).search(user_id, q.strip(), (SOURCE_NOTE,), mode, limit=limit)
+        except ProviderError as e:
+            raise HTTPException(status_code=502, detail=e.message)
+
+        results = []
+        for hit in hits:
+            note_data = build_note_response(hit.record)
+            note_data["snippet"] = build_snippet(hit.record.content, q.strip())
+            note_data["score"] = hit.score
+            results.append(note_data)
+        return {"results": results}
+
+    # Fetch one extra row to know whether another page exists
+    results = NoteSearch(db).search(user_id, q, limit=limit + 1, offset=offset)
+    return {
+        "results": results[:limit],
+        "limit": limit,
+        "offset": offset,
+        "has_more": len(results) > limit
+    }
 
 
 @router.delete("/{note_id}")
@@ -200,6 +483,7 @@ async def delete_note(note_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Note not found")
 
     note.is_deleted = True
+    NoteLabelIndex(db).set_deleted([note.id], True)
     db.commit()
 
     return {"status": "success", "message": "Note moved to trash successfully"}
@@ -213,6 +497,7 @@ async def restore_note(note_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Note not found")
 
     note.is_deleted = False
+    NoteLabelIndex(db).set_deleted([note.id], False)
     db.commit()
 
     return {"status": "success", "message": "Note restored successfully"}
@@ -225,6 +510,7 @@ async def permanent_delete_note(note_id: int, db: Session = Depends(get_db)):
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
+    NoteLabelIndex(db).delete_notes([note.id])
     db.delete(note)
     db.commit()
     
@@ -242,7 +528,7 @@ async def update_note_labels(
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    note.labels = request.labels
+    NoteLabelIndex(db).set_labels(note, request.labels)
     db.commit()
     
     return {"status": "success", "message": "Labels updated successfully"}
@@ -251,6 +537,7 @@ async def update_note_labels(
 async def bulk_restore_notes(note_ids: List[int], db: Session = Depends(get_db)):
     """Bulk restore notes from trash"""
     db.query(Note).filter(Note.id.in_(note_ids)).update({Note.is_deleted: 0}, synchronize_session=False)
+    NoteLabelIndex(db).set_deleted(note_ids, False)
     db.commit()
     return {"status": "success", "message": f"{len(note_ids)} notes restored"}
 
@@ -259,6 +546,7 @@ async def bulk_restore_notes(note_ids: List[int], db: Session = Depends(get_db))
 @router.post("/bulk-permanent")
 async def bulk_permanent_delete_notes(note_ids: List[int], db: Session = Depends(get_db)):
     """Bulk permanently delete notes"""
+    NoteLabelIndex(db).delete_notes(note_ids)
     db.query(Note).filter(Note.id.in_(note_ids)).delete(synchronize_session=False)
     db.commit()
     return {"status": "success", "message": f"{len(note_ids)} notes permanently deleted"}
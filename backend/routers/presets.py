@@ -0,0 +1,47 @@
+"""Router for per-model generation presets"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+
+from database import get_db
+from models import User, ModelPreset
+from schemas import ModelPresetRequest, ModelPresetResponse
+from services.model_presets import ModelPresets
+
+router = APIRouter(prefix="/api/model-presets", tags=["model-presets"])
+
+
+@router.put("", response_model=ModelPresetResponse)
+async def save_model_preset(
+    request: ModelPresetRequest,
+    db: Session = Depends(get_db)
+):
+    """Create or replace the generation options used for a model"""
+    user = db.query(User).filter(User.id == request.user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    model = request.model.strip()
+    if not model:
+        raise HTTPException(status_code=400, detail="Model name is required")
+
+    return ModelPresets(db).save(request.user_id, model, request.options)
+
+
+@router.get("/{user_id}", response_model=List[ModelPresetResponse])
+async def list_model_presets(user_id: int, db: Session = Depends(get_db)):
+    """Get all presets of a user"""
+    return ModelPresets(db).for_user(user_id)
+
+
+@router.delete("/{preset_id}")
+async def delete_model_preset(preset_id: int, db: Session = Depends(get_db)):
+    """Delete a preset; the model goes back to provider defaults"""
+    preset = db.query(ModelPreset).filter(ModelPreset.id == preset_id).first()
+    if not preset:
+        raise HTTPException(status_code=404, detail="Preset not found")
+
+    db.delete(preset)
+    db.commit()
+
+    return {"status": "success", "message": "Preset deleted successfully"}
@@ -0,0 +1,95 @@
+"""Router for semantic search endpoints"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import User
+from utils.text_utils import truncate_with_ellipsis, build_snippet
+from services.job_queue import JobQueue
+from services.cloud_providers import ProviderError
+from services.semantic_search import (
+    SemanticSearch,
+    SearchHit,
+    EMBEDDING_INDEX_JOB,
+    SEARCH_MODES,
+    SOURCE_MESSAGE,
+    SOURCE_NOTE,
+)
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+SCOPES = {
+    "all": (SOURCE_MESSAGE, SOURCE_NOTE),
+    "chats": (SOURCE_MESSAGE,),
+    "notes": (SOURCE_NOTE,),
+}
+
+
+def _format_hit_response(hit: SearchHit, query: str) -> dict:
+    """Format a search hit for API response"""
+    record = hit.record
+    if hit.source_type == SOURCE_NOTE:
+        title = record.title
+        text = record.content
+    else:
+        title = truncate_with_ellipsis(record.content, 50)
+        text = record.content
+
+    return {
+        "type": hit.source_type,
+        "id": hit.source_id,
+        "session_id": record.session_id,
+        "title": title,
+        "snippet": build_snippet(text, query),
+        "model": record.model,
+        "score": hit.score,
+        "created_at": record.created_at.isoformat() if record.created_at else None
+    }
+
+
+@router.get("/{user_id}")
+async def search(
+    user_id: int,
+    q: str,
+    scope: str = "all",
+    mode: str = "hybrid",
+    limit: int = 20,
+    db: Session = Depends(get_db)
+):
+    """Search chats and notes by keyword, meaning, or both (hybrid)"""
+    if not q or len(q.strip()) == 0:
+        return {"results": []}
+    if scope not in SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of: {', '.join(SCOPES)}")
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+
+    query = q.strip()
+    try:
+        hits = await SemanticSearch(db).search(user_id, query, SCOPES[scope], mode, min(max(limit, 1), 100))
+    except ProviderError as e:
+        raise HTTPException(status_code=502, detail=e.message)
+
+    return {"results": [_format_hit_response(hit, query) for hit in hits]}
+
+
+@router.get("/status/{user_id}")
+async def get_index_status(user_id: int, db: Session = Depends(get_db)):
+    """Get how many messages and notes are indexed for semantic search"""
+    return SemanticSearch(db).index_status(user_id)
+
+
+@router.post("/reindex/{user_id}")
+async def reindex(user_id: int, db: Session = Depends(get_db)):
+    """Queue embedding of all messages and notes that are not indexed yet"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    job = JobQueue(db).enqueue(
+        EMBEDDING_INDEX_JOB,
+        payload={"user_id": user_id},
+        user_id=user_id,
+        dedupe_key=f"embed:{user_id}"
+    )
+    return {"message": "Indexing queued", "job_id": job.id}
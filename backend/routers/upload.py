@@ -1,17 +1,34 @@
 """Router for file upload endpoints"""
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from sqlalchemy.orm import Session
 from pathlib import Path
+from typing import Optional
 import uuid
 import base64
 
 from config import UPLOAD_DIR
+from database import get_db
 from file_converter import convert_file_to_images
+from models import Document
+from services.document_index import DocumentIndex
+from logging_config import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter(prefix="/api", tags=["upload"])
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload and convert file to images"""
+async def upload_file(
+    file: UploadFile = File(...),
+    user_id: Optional[int] = Form(None),
+    session_id: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """Upload and convert file to images
+
+    When ``user_id`` is given the file's text is also indexed in the background
+    so chat turns can retrieve relevant passages via ``document_ids``.
+    """
     if not file.filename:
         raise HTTPException(status_code=400, detail="Filename is required")
     
@@ -45,12 +62,24 @@ async def upload_file(file: UploadFile = File(...)):
                 img_base64 = base64.b64encode(img_data).decode('utf-8')
                 images_base64.append(img_base64)
         
-        return {
+        response = {
             "file_id": file_id,
             "images": images_base64,
             "image_paths": image_paths,  # Keep paths for reference
             "filename": file.filename
         }
+
+        # Queue text extraction and embedding for retrieval
+        if user_id is not None:
+            try:
+                document, job_id = DocumentIndex(db).register_upload(file_id, file.filename, user_id, session_id)
+                response["document_id"] = document.id
+                response["index_job_id"] = job_id
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Could not queue document indexing for {file.filename}: {e}")
+
+        return response
     except Exception as e:
         # Clean up on error
         if file_path.exists():
@@ -58,3 +87,24 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"File conversion error: {str(e)}")
 
 
+
+@router.get("/documents/{document_id}")
+async def get_document_status(document_id: int, user_id: int, db: Session = Depends(get_db)):
+    """Get the indexing status of an uploaded document"""
+    document = db.query(Document).filter(
+        Document.id == document_id,
+        Document.user_id == user_id
+    ).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    return {
+        "id": document.id,
+        "file_id": document.file_id,
+        "filename": document.filename,
+        "session_id": document.session_id,
+        "status": document.status,
+        "chunk_count": document.chunk_count,
+        "error": document.error,
+        "created_at": document.created_at.isoformat() if document.created_at else None
+    }
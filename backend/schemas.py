@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -19,6 +19,20 @@ class Message(BaseModel):
     created_at: Optional[str] = None
     model: Optional[str] = None
 
+class GenerationOptions(BaseModel):
+    """Generation options; each provider maps the ones its API supports"""
+    temperature: Optional[float] = Field(None, ge=0.0, le=2.0)
+    top_p: Optional[float] = Field(None, gt=0.0, le=1.0)
+    top_k: Optional[int] = Field(None, ge=1)  # Ollama, Anthropic and Gemini only
+    num_predict: Optional[int] = Field(None, ge=1)  # Maximum tokens to generate
+    num_ctx: Optional[int] = Field(None, ge=256, le=1048576)  # Ollama context window (sizes the KV cache)
+    keep_alive: Optional[Union[int, str]] = None  # Ollama: how long the model stays loaded ("10m", seconds, -1 = forever)
+    seed: Optional[int] = None
+
+    def as_options(self) -> Dict[str, Any]:
+        """Options that are set, as passed to the providers"""
+        return self.model_dump(exclude_none=True)
+
 class ChatRequest(BaseModel):
     user_id: int
     message: str
@@ -26,6 +40,23 @@ class ChatRequest(BaseModel):
     session_id: Optional[str] = None  # Session ID for grouping conversations
     images: Optional[List[str]] = None  # Base64 encoded images
     skip_history: bool = False  # If True, do not persist messages to chat history (used for debates etc.)
+    use_cache: bool = False  # Reuse a cached response for identical deterministic requests
+    force_cache: bool = False  # Cache even when sampling (temperature > 0) is enabled
+    document_ids: Optional[List[int]] = None  # Uploaded documents to retrieve context from (bound to the session)
+    options: Optional[GenerationOptions] = None  # Overrides the user's preset for the model
+
+    # Retrieved document passages; prepended to the message sent to the model but never persisted
+    _retrieved_context: Optional[str] = PrivateAttr(default=None)
+
+    def set_retrieved_context(self, context: Optional[str]) -> None:
+        self._retrieved_context = context
+
+    @property
+    def prompt_message(self) -> str:
+        """Message text sent to the model, including any retrieved document context"""
+        if not self._retrieved_context:
+            return self.message
+        return f"{self._retrieved_context}\n\n質問: {self.message}"
 
 class ChatResponse(BaseModel):
     message: str
@@ -47,6 +78,8 @@ class NoteCreateRequest(BaseModel):
     model: str
     prompt: str
     labels: Optional[List[str]] = []
+    use_cache: bool = False  # Reuse a cached note for an unchanged session and prompt
+    force_cache: bool = False  # Cache even when sampling (temperature > 0) is enabled
 
 class NoteLabelsUpdateRequest(BaseModel):
     labels: List[str]
@@ -83,6 +116,18 @@ class CloudApiKeyTestRequest(BaseModel):
     provider: str
     api_key: str
 
+class ProviderBudgetResponse(BaseModel):
+    """Client-side rate limit budget of a provider (None = not limited)"""
+    provider: str
+    has_key: bool
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
+    requests_remaining: Optional[int] = None
+    tokens_remaining: Optional[int] = None
+    queued: int = 0  # Requests waiting for budget
+    requests_used: int = 0  # Since the server started
+    tokens_used: int = 0  # Reported by the provider, since the server started
+
 class ScrapeUrlRequest(BaseModel):
     url: str
 
@@ -238,3 +283,18 @@ class DebateVoteResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ModelPresetRequest(BaseModel):
+    user_id: int
+    model: str
+    options: GenerationOptions
+
+class ModelPresetResponse(BaseModel):
+    id: int
+    user_id: int
+    model: str
+    options: GenerationOptions
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
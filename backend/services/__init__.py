@@ -1,11 +1,13 @@
 """Services package"""
 from .model_detector import ModelDetector
 from .message_repository import MessageRepository
-from .cloud_providers import CloudProviderBase, GeminiProvider
+from .cloud_providers import CompletionProvider, CloudProviderBase, GeminiProvider, get_completion_provider
 
 __all__ = [
     'ModelDetector',
     'MessageRepository',
+    'CompletionProvider',
     'CloudProviderBase',
     'GeminiProvider',
+    'get_completion_provider',
 ]
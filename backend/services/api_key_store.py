@@ -0,0 +1,185 @@
+"""Cloud API key storage with encryption at rest and a lookup cache
+
+Keys are encrypted with Fernet when ``API_KEY_ENCRYPTION_KEY`` is set and
+stored as ``enc:v1:<token>``; rows written before encryption was enabled
+(plain text) are still read and are encrypted by ``encrypt_existing_keys``
+at startup. Decrypted keys are cached per (user_id, provider) for
+``API_KEY_CACHE_TTL`` seconds, including "no key registered", so chat turns
+skip both the query and the decryption. The cache is per process: the
+api_keys router invalidates it on every change, other workers catch up when
+the TTL expires.
+"""
+import base64
+import hashlib
+import time
+from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from config import API_KEY_ENCRYPTION_KEY, API_KEY_CACHE_TTL
+from models import CloudApiKey
+from logging_config import get_logger
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # Optional: keys are stored as plain text without it
+    Fernet = None
+    InvalidToken = Exception
+
+logger = get_logger(__name__)
+
+ENCRYPTED_PREFIX = "enc:v1:"
+# Cached lookups kept at most (the cache is cleared when it grows past this)
+CACHE_MAX_ENTRIES = 10000
+
+_cache: Dict[Tuple[int, str], Tuple[Optional[str], float]] = {}
+
+
+def _build_cipher() -> Optional["Fernet"]:
+    if not API_KEY_ENCRYPTION_KEY:
+        return None
+    if Fernet is None:
+        logger.error("API_KEY_ENCRYPTION_KEY is set but the cryptography package is not installed; API keys are stored unencrypted")
+        return None
+    secret = API_KEY_ENCRYPTION_KEY.encode("utf-8")
+    try:
+        return Fernet(secret)
+    except ValueError:
+        # Not a Fernet key: derive one from the passphrase
+        return Fernet(base64.urlsafe_b64encode(hashlib.sha256(secret).digest()))
+
+
+_cipher = _build_cipher()
+
+
+def encrypt_api_key(api_key: str) -> str:
+    """Value to store for a key (unchanged when encryption is disabled)"""
+    if _cipher is None:
+        return api_key
+    return ENCRYPTED_PREFIX + _cipher.encrypt(api_key.encode("utf-8")).decode("ascii")
+
+
+def decrypt_api_key(stored: str) -> str:
+    """
+    Key from a stored value
+
+    Raises:
+        ValueError: If the value is encrypted and cannot be decrypted with the configured key
+    """
+    if not stored.startswith(ENCRYPTED_PREFIX):
+        return stored
+    if _cipher is None:
+        raise ValueError("API key is encrypted but API_KEY_ENCRYPTION_KEY is not set")
+    try:
+        return _cipher.decrypt(stored[len(ENCRYPTED_PREFIX):].encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        raise ValueError("API key cannot be decrypted with the configured API_KEY_ENCRYPTION_KEY")
+
+
+class ApiKeyStore:
+    """Reads and writes users' cloud API keys"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, user_id: int, provider: str) -> Optional[str]:
+        """
+        Decrypted API key of a user for a provider
+
+        Args:
+            user_id: ID of the user
+            provider: Provider name ("gpt", "claude", "gemini", "grok", "newsapi")
+
+        Returns:
+            The key, or None if none is registered (or it cannot be decrypted)
+        """
+        key = (user_id, provider)
+        cached = _cache.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        row = self.db.query(CloudApiKey.api_key).filter(
+            CloudApiKey.user_id == user_id,
+            CloudApiKey.provider == provider
+        ).first()
+        api_key = None
+        if row is not None and row.api_key:
+            try:
+                api_key = decrypt_api_key(row.api_key)
+            except ValueError as e:
+                logger.error(f"Could not read {provider} API key of user {user_id}: {e}")
+
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[key] = (api_key, now + API_KEY_CACHE_TTL)
+        return api_key
+
+    def save(self, user_id: int, provider: str, api_key: str) -> CloudApiKey:
+        """
+        Create or replace a user's key for a provider
+
+        Returns:
+            Saved CloudApiKey row
+        """
+        row = self.db.query(CloudApiKey).filter(
+            CloudApiKey.user_id == user_id,
+            CloudApiKey.provider == provider
+        ).first()
+        if row is None:
+            row = CloudApiKey(user_id=user_id, provider=provider)
+            self.db.add(row)
+        row.api_key = encrypt_api_key(api_key)
+        self.db.commit()
+        self.db.refresh(row)
+        self.invalidate(user_id, provider)
+        return row
+
+    def delete(self, user_id: int, provider: str) -> bool:
+        """
+        Delete a user's key for a provider
+
+        Returns:
+            False if no key was registered
+        """
+        row = self.db.query(CloudApiKey).filter(
+            CloudApiKey.user_id == user_id,
+            CloudApiKey.provider == provider
+        ).first()
+        if row is None:
+            return False
+        self.db.delete(row)
+        self.db.commit()
+        self.invalidate(user_id, provider)
+        return True
+
+    @staticmethod
+    def invalidate(user_id: int, provider: Optional[str] = None) -> None:
+        """Drop cached lookups of a user (one provider or all)"""
+        for key in [key for key in _cache if key[0] == user_id and (provider is None or key[1] == provider)]:
+            _cache.pop(key, None)
+
+
+def encrypt_existing_keys(db: Session) -> int:
+    """
+    Encrypt keys stored as plain text (called on startup when encryption is enabled)
+
+    Returns:
+        Number of keys encrypted
+    """
+    if _cipher is None:
+        return 0
+    rows = db.query(CloudApiKey.id, CloudApiKey.api_key, CloudApiKey.updated_at).filter(
+        CloudApiKey.api_key.isnot(None),
+        ~CloudApiKey.api_key.startswith(ENCRYPTED_PREFIX)
+    ).all()
+    for row in rows:
+        # Keep updated_at: the key itself did not change
+        db.query(CloudApiKey).filter(CloudApiKey.id == row.id).update(
+            {"api_key": encrypt_api_key(row.api_key), "updated_at": row.updated_at},
+            synchronize_session=False
+        )
+    if rows:
+        db.commit()
+        _cache.clear()
+        logger.info(f"Encrypted {len(rows)} stored API keys")
+    return len(rows)
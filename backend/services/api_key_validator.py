@@ -1,6 +1,14 @@
 """API key validation service for cloud providers"""
 from typing import Tuple
 import httpx
+from config import (
+    OPENAI_API_BASE_URL,
+    ANTHROPIC_API_BASE_URL,
+    GEMINI_API_BASE_URL,
+    XAI_API_BASE_URL,
+    PROVIDER_CONNECT_TIMEOUT,
+)
+from services.resilience import send_with_resilience, circuit_breaker, CircuitOpenError
 from logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -11,7 +19,7 @@ class ApiKeyValidator:
 
     PROVIDER_CONFIGS = {
         "gemini": {
-            "url": "https://generativelanguage.googleapis.com/v1beta/models",
+            "url": f"{GEMINI_API_BASE_URL}/models",
             "method": "GET",
             "headers_factory": None,
             "params_factory": lambda key: {"key": key},
@@ -19,7 +27,7 @@ class ApiKeyValidator:
             "timeout": 10.0
         },
         "gpt": {
-            "url": "https://api.openai.com/v1/models",
+            "url": f"{OPENAI_API_BASE_URL}/models",
             "method": "GET",
             "headers_factory": lambda key: {
                 "Authorization": f"Bearer {key}",
@@ -30,7 +38,7 @@ class ApiKeyValidator:
             "timeout": 10.0
         },
         "claude": {
-            "url": "https://api.anthropic.com/v1/messages",
+            "url": f"{ANTHROPIC_API_BASE_URL}/messages",
             "method": "POST",
             "headers_factory": lambda key: {
                 "x-api-key": key,
@@ -46,7 +54,7 @@ class ApiKeyValidator:
             "timeout": 10.0
         },
         "grok": {
-            "url": "https://api.x.ai/v1/models",
+            "url": f"{XAI_API_BASE_URL}/models",
             "method": "GET",
             "headers_factory": lambda key: {
                 "Authorization": f"Bearer {key}",
@@ -89,13 +97,14 @@ class ApiKeyValidator:
         config = cls.PROVIDER_CONFIGS[provider]
 
         try:
-            async with httpx.AsyncClient(timeout=config["timeout"]) as client:
+            timeout = httpx.Timeout(config["timeout"], connect=min(PROVIDER_CONNECT_TIMEOUT, config["timeout"]))
+            async with httpx.AsyncClient(timeout=timeout) as client:
                 # Prepare request parameters
                 headers = config["headers_factory"](api_key) if config["headers_factory"] else None
                 params = config["params_factory"](api_key) if config["params_factory"] else None
                 body = config["body_factory"]() if config["body_factory"] else None
 
-                # Make request
+                # Make request (retried on 429/5xx, shares the provider's circuit breaker)
                 request_kwargs = {
                     "url": config["url"],
                     "headers": headers,
@@ -106,14 +115,18 @@ class ApiKeyValidator:
                 if body:
                     request_kwargs["json"] = body
 
-                if config["method"] == "GET":
-                    response = await client.get(**request_kwargs)
-                else:
-                    response = await client.post(**request_kwargs)
+                response = await send_with_resilience(
+                    lambda: client.request(config["method"], **request_kwargs),
+                    provider,
+                    circuit_breaker(provider)
+                )
 
                 # Handle response
                 return cls._handle_response(provider, response)
 
+        except CircuitOpenError as e:
+            logger.warning(f"API key validation skipped for provider {provider}: {e}")
+            return False, f"プロバイダーが一時的に利用できません。{e.retry_after:.0f}秒後に再試行してください"
         except httpx.TimeoutException:
             logger.warning(f"API key validation timeout for provider: {provider}")
             return False, "APIキーの検証がタイムアウトしました"
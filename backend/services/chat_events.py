@@ -0,0 +1,67 @@
+"""Typed events produced by ChatService.stream_events
+
+Internal consumers (debates) iterate these directly; HTTP endpoints turn them
+into SSE payloads with ``to_payload`` (see ``services.sse.encode_chat_events``).
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+
+
+@dataclass(slots=True)
+class TokenEvent:
+    """A chunk of generated text"""
+    content: str
+    session_id: Optional[str] = None  # Set on the first chunk of a response only
+
+    def to_payload(self) -> Optional[Dict[str, Any]]:
+        if self.session_id is None:
+            return {"content": self.content}
+        return {"content": self.content, "session_id": self.session_id}
+
+
+@dataclass(slots=True)
+class UsageEvent:
+    """Token counts reported by the provider, emitted before the done event"""
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+    def to_payload(self) -> Optional[Dict[str, Any]]:
+        # Not sent to HTTP clients: the done event carries the same counts
+        return None
+
+
+@dataclass(slots=True)
+class DoneEvent:
+    """End of a successful response"""
+    session_id: str
+    message_id: Optional[int] = None  # None when history is skipped
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    metrics: Optional[Dict[str, float]] = None
+    content: Optional[str] = None  # Whole response for non-streaming (cloud) providers
+
+    def to_payload(self) -> Optional[Dict[str, Any]]:
+        payload: Dict[str, Any] = {"done": True, "session_id": self.session_id}
+        if self.content is not None:
+            payload["content"] = self.content
+        if self.message_id is not None:
+            payload["message_id"] = self.message_id
+        if self.prompt_tokens is not None:
+            payload["prompt_tokens"] = self.prompt_tokens
+        if self.completion_tokens is not None:
+            payload["completion_tokens"] = self.completion_tokens
+        if self.metrics:
+            payload["metrics"] = self.metrics
+        return payload
+
+
+@dataclass(slots=True)
+class ErrorEvent:
+    """Generation failed; no done event follows"""
+    message: str
+
+    def to_payload(self) -> Optional[Dict[str, Any]]:
+        return {"error": self.message}
+
+
+ChatEvent = Union[TokenEvent, UsageEvent, DoneEvent, ErrorEvent]
@@ -1,17 +1,26 @@
 """Chat service for handling both Ollama and cloud providers"""
 import httpx
-import json
 import uuid
 import asyncio
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict
 from sqlalchemy.orm import Session
 
-from config import OLLAMA_BASE_URL
-from models import User, CloudApiKey
+from models import User
 from schemas import ChatRequest
 from .model_detector import ModelDetector
 from .message_repository import MessageRepository
-from .cloud_providers import GeminiProvider, GPTProvider, ClaudeProvider, GrokProvider
+from .response_cache import ResponseCache
+from .semantic_search import schedule_embedding_index
+from .document_index import DocumentIndex
+from .model_presets import ModelPresets
+from .api_key_store import ApiKeyStore
+from .context_builder import ContextBuilder
+from .cloud_providers import CLOUD_PROVIDERS, CloudProviderBase, OllamaProvider
+from .generation_metrics import GenerationTimer
+from .sse import coalesce_chunks
+from .chat_events import ChatEvent, TokenEvent, UsageEvent, DoneEvent, ErrorEvent
+from config import OLLAMA_KEEP_ALIVE
+from metrics import CHAT_CONTEXT_PREFIX, PROMPT_EVAL_DURATION
 from logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -20,155 +29,133 @@ logger = get_logger(__name__)
 class ChatService:
     """Main chat service orchestrator"""
 
-    # Provider handler method names
-    PROVIDER_HANDLERS = {
-        "gemini": "_handle_gemini",
-        "gpt": "_handle_gpt",
-        "claude": "_handle_claude",
-        "grok": "_handle_grok",
-    }
-
     def __init__(self, db: Session):
         self.db = db
         self.model_detector = ModelDetector()
         self.message_repo = MessageRepository(db)
+        self.ollama = OllamaProvider()
 
-    async def process_message(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+    async def stream_events(self, request: ChatRequest) -> AsyncGenerator[ChatEvent, None]:
         """
-        Process chat message and generate streaming response
+        Process chat message and generate the response as typed events
+
+        HTTP endpoints encode the events with ``encode_chat_events``; internal
+        consumers (debates) use them directly.
 
         Args:
             request: Chat request
 
         Yields:
-            Server-sent events (SSE) formatted strings
+            TokenEvents (the first one carries the session ID), a UsageEvent
+            when token counts are known and a DoneEvent, or an ErrorEvent
         """
+        await self._attach_document_context(request)
+        options = ModelPresets(self.db).resolve(request.user_id, request.model, request.options)
+
         is_cloud, provider = self.model_detector.is_cloud_model(request.model)
 
-        # Use dispatch pattern for provider routing
-        if is_cloud and provider in self.PROVIDER_HANDLERS:
-            handler_method = getattr(self, self.PROVIDER_HANDLERS[provider])
-            async for event in handler_method(request):
+        if is_cloud and provider in CLOUD_PROVIDERS:
+            async for event in self._handle_cloud(request, CLOUD_PROVIDERS[provider](request.user_id), options):
                 yield event
         else:
             # Default to Ollama for local models
-            async for event in self._handle_ollama(request):
+            async for event in self._handle_ollama(request, options):
                 yield event
 
-    async def _handle_gemini(self, request: ChatRequest) -> AsyncGenerator[str, None]:
-        """
-        Handle Gemini cloud provider
-
-        Args:
-            request: Chat request
+        # Index the new messages for semantic search in the background
+        if not request.skip_history:
+            schedule_embedding_index(self.db, request.user_id)
 
-        Yields:
-            Server-sent events for Gemini responses
+    async def _attach_document_context(self, request: ChatRequest) -> None:
         """
-        # Check for API key
-        api_key_obj = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == request.user_id,
-            CloudApiKey.provider == "gemini"
-        ).first()
-
-        if not api_key_obj:
-            yield f"data: {json.dumps({'error': 'Gemini APIキーが登録されていません。モデル管理ページでAPIキーを登録してください。'})}\n\n"
-            return
-
-        # Generate response
-        provider = GeminiProvider()
-        response_data = await provider.generate_response(request, self.db, api_key_obj.api_key)
-        yield f"data: {json.dumps(response_data)}\n\n"
+        Retrieve passages from the session's uploaded documents into the prompt
 
-    async def _handle_gpt(self, request: ChatRequest) -> AsyncGenerator[str, None]:
-        """
-        Handle OpenAI GPT cloud provider
+        Only the top-k chunks relevant to this message are sent, so large
+        documents cost a few hundred tokens per turn instead of page images.
+        Once the attached documents are indexed the passages replace the page
+        images, which are then neither sent nor stored (later turns would
+        resend them with the history); image files, scanned PDFs and documents
+        still being indexed keep their images. Retrieval failures are logged
+        and the turn proceeds without context.
 
         Args:
-            request: Chat request
-
-        Yields:
-            Server-sent events for GPT responses
+            request: Chat request (session_id is assigned when documents are attached to a new chat)
         """
-        # Check for API key
-        api_key_obj = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == request.user_id,
-            CloudApiKey.provider == "gpt"
-        ).first()
-
-        if not api_key_obj:
-            yield f"data: {json.dumps({'error': 'OpenAI APIキーが登録されていません。モデル管理ページでAPIキーを登録してください。'})}\n\n"
+        if request.document_ids and not request.session_id and not request.skip_history:
+            # Bind the documents to the session the reply will be stored under
+            request.session_id = str(uuid.uuid4())
+        if not request.document_ids and not request.session_id:
             return
 
-        # Generate response
-        provider = GPTProvider()
-        response_data = await provider.generate_response(request, self.db, api_key_obj.api_key)
-        yield f"data: {json.dumps(response_data)}\n\n"
-
-    async def _handle_claude(self, request: ChatRequest) -> AsyncGenerator[str, None]:
-        """
-        Handle Anthropic Claude cloud provider
-
-        Args:
-            request: Chat request
-
-        Yields:
-            Server-sent events for Claude responses
-        """
-        # Check for API key
-        api_key_obj = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == request.user_id,
-            CloudApiKey.provider == "claude"
-        ).first()
-
-        if not api_key_obj:
-            yield f"data: {json.dumps({'error': 'Anthropic APIキーが登録されていません。モデル管理ページでAPIキーを登録してください。'})}\n\n"
-            return
-
-        # Generate response
-        provider = ClaudeProvider()
-        response_data = await provider.generate_response(request, self.db, api_key_obj.api_key)
-        yield f"data: {json.dumps(response_data)}\n\n"
-
-    async def _handle_grok(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+        try:
+            index = DocumentIndex(self.db)
+            documents = index.session_documents(request.user_id, request.session_id, request.document_ids)
+            if not documents:
+                return
+            chunks = await index.retrieve(documents, request.message)
+            request.set_retrieved_context(index.build_context(chunks))
+            if chunks:
+                logger.debug(f"Retrieved {len(chunks)} document chunks for session {request.session_id}")
+                if request.images and index.is_searchable(documents, request.document_ids or []):
+                    # The passages stand in for the page images
+                    request.images = None
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"Document retrieval failed, continuing without context: {e}")
+
+    async def _handle_cloud(
+        self,
+        request: ChatRequest,
+        provider: CloudProviderBase,
+        options: Dict[str, Any]
+    ) -> AsyncGenerator[ChatEvent, None]:
         """
-        Handle xAI Grok cloud provider
+        Handle a cloud provider (Gemini, OpenAI, Anthropic, xAI)
 
         Args:
             request: Chat request
+            provider: Provider serving the requested model
+            options: Generation options (preset merged with request overrides)
 
         Yields:
-            Server-sent events for Grok responses
+            Events of the cloud response
         """
         # Check for API key
-        api_key_obj = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == request.user_id,
-            CloudApiKey.provider == "grok"
-        ).first()
+        api_key = ApiKeyStore(self.db).get(request.user_id, provider.name)
 
-        if not api_key_obj:
-            yield f"data: {json.dumps({'error': 'xAI APIキーが登録されていません。モデル管理ページでAPIキーを登録してください。'})}\n\n"
+        if not api_key:
+            error_message = f"{provider.display_name} APIキーが登録されていません。モデル管理ページでAPIキーを登録してください。"
+            yield ErrorEvent(error_message)
             return
 
         # Generate response
-        provider = GrokProvider()
-        response_data = await provider.generate_response(request, self.db, api_key_obj.api_key)
-        yield f"data: {json.dumps(response_data)}\n\n"
-
-    async def _handle_ollama(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+        event = await provider.generate_response(
+            request,
+            self.db,
+            api_key,
+            options,
+            context_builder=ContextBuilder(self.db),
+            cache=ResponseCache(self.db) if request.use_cache else None
+        )
+        if isinstance(event, DoneEvent) and (event.prompt_tokens is not None or event.completion_tokens is not None):
+            yield UsageEvent(event.prompt_tokens, event.completion_tokens)
+        yield event
+
+    async def _handle_ollama(self, request: ChatRequest, options: Dict[str, Any]) -> AsyncGenerator[ChatEvent, None]:
         """
         Handle Ollama streaming
 
         Args:
             request: Chat request
+            options: Generation options (preset merged with request overrides)
 
         Yields:
-            Server-sent events for Ollama streaming responses
+            Events of the Ollama streaming response
         """
         # Verify user exists
         user = self.db.query(User).filter(User.id == request.user_id).first()
         if not user:
-            yield f"data: {json.dumps({'error': 'User not found'})}\n\n"
+            yield ErrorEvent('User not found')
             return
 
         skip_history = getattr(request, "skip_history", False)
@@ -176,18 +163,8 @@ class ChatService:
         # Generate session_id if not provided
         session_id = request.session_id or str(uuid.uuid4())
 
-        # Prepare messages for Ollama
-        messages = []
-
+        user_message = None
         if not skip_history:
-            # Check if this is a new chat
-            existing_messages_count = len(self.message_repo.get_session_history(
-                user_id=request.user_id,
-                session_id=session_id,
-                limit=1
-            ))
-            is_new_chat = existing_messages_count == 0
-
             # Save user message
             user_message = self.message_repo.save_user_message(
                 user_id=request.user_id,
@@ -197,32 +174,21 @@ class ChatService:
                 images=request.images
             )
 
-            if not is_new_chat:
-                # Include history for existing chats
-                history = self.message_repo.get_session_history(
-                    user_id=request.user_id,
-                    session_id=session_id,
-                    exclude_message_id=user_message.id,
-                    limit=20
-                )
-
-                for msg in history:
-                    msg_dict = {
-                        "role": msg.role,
-                        "content": msg.content
-                    }
-                    if msg.images and len(msg.images) > 0:
-                        msg_dict["images"] = msg.images
-                    messages.append(msg_dict)
-
-        # Add current message (always sent to model)
-        current_message = {
-            "role": "user",
-            "content": request.message
-        }
-        if request.images and len(request.images) > 0:
-            current_message["images"] = request.images
-        messages.append(current_message)
+        # History (when kept) followed by the current message, with a prefix stable across turns
+        context = ContextBuilder(self.db).build(
+            user_id=request.user_id,
+            session_id=None if skip_history else session_id,
+            model=request.model,
+            content=request.prompt_message,
+            images=request.images,
+            exclude_message_id=user_message.id if user_message is not None else None
+        )
+        messages = context.messages
+        CHAT_CONTEXT_PREFIX.labels(outcome=context.prefix).inc()
+
+        # Keep the model (and its cached prompt) loaded between turns
+        if OLLAMA_KEEP_ALIVE and options.get("keep_alive") is None:
+            options = {**options, "keep_alive": OLLAMA_KEEP_ALIVE}
 
         # Stream from Ollama
         full_message = ""
@@ -230,89 +196,75 @@ class ChatService:
         was_cancelled = False
 
         try:
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                ollama_request = {
-                    "model": request.model,
-                    "messages": messages,
-                    "stream": True
-                }
-
-                async with client.stream(
-                    "POST",
-                    f"{OLLAMA_BASE_URL}/api/chat",
-                    json=ollama_request
-                ) as response:
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        self.message_repo.delete_message(user_message.id)
-                        yield f"data: {json.dumps({'error': f'Ollama API error: {error_text.decode()}'})}\n\n"
-                        return
-
-                    try:
-                        prompt_tokens = None
-                        completion_tokens = None
-
-                        async for line in response.aiter_lines():
-                            if not line:
-                                continue
-                            try:
-                                chunk_data = json.loads(line)
-                                if "message" in chunk_data and "content" in chunk_data["message"]:
-                                    content = chunk_data["message"]["content"]
-                                    full_message += content
-                                    yield f"data: {json.dumps({'content': content, 'session_id': session_id})}\n\n"
-
-                                # Extract token counts
-                                if "prompt_eval_count" in chunk_data:
-                                    prompt_tokens = chunk_data.get("prompt_eval_count")
-                                if "eval_count" in chunk_data:
-                                    completion_tokens = chunk_data.get("eval_count")
-
-                                if chunk_data.get("done", False):
-                                    # Include token counts and session in response
-                                    done_data = {
-                                        'done': True,
-                                        'session_id': session_id
-                                    }
-
-                                    if not skip_history:
-                                        # Save assistant response
-                                        assistant_msg = self.message_repo.save_assistant_message(
-                                            user_id=request.user_id,
-                                            session_id=session_id,
-                                            content=full_message,
-                                            model=request.model,
-                                            prompt_tokens=prompt_tokens,
-                                            completion_tokens=completion_tokens
-                                        )
-                                        message_saved = True
-                                        done_data['message_id'] = assistant_msg.id
-
-                                    if prompt_tokens is not None:
-                                        done_data['prompt_tokens'] = prompt_tokens
-                                    if completion_tokens is not None:
-                                        done_data['completion_tokens'] = completion_tokens
-                                    yield f"data: {json.dumps(done_data)}\n\n"
-                                    break
-                            except json.JSONDecodeError:
-                                continue
-
-                    except (asyncio.CancelledError, ConnectionError):
-                        was_cancelled = True
-                        if not skip_history and not message_saved:
-                            try:
-                                cancelled_content = full_message.strip() if full_message.strip() else "生成途中でキャンセルされました。"
-                                self.message_repo.save_assistant_message(
-                                    user_id=request.user_id,
-                                    session_id=session_id,
-                                    content=cancelled_content,
-                                    model=request.model,
-                                    is_cancelled=True
-                                )
-                                message_saved = True
-                            except Exception as e:
-                                logger.error(f"Error saving cancelled message: {e}", exc_info=True)
-                        raise
+            prompt_tokens = None
+            completion_tokens = None
+
+            timer = GenerationTimer()
+            # Later turns of the session go to the backend holding its KV cache
+            ollama = self.ollama.for_session(session_id)
+            if request.use_cache:
+                chunks = ResponseCache(self.db).stream(
+                    ollama, request.model, messages, options=options, force=request.force_cache
+                )
+            else:
+                chunks = ollama.stream(request.model, messages, options=options)
+
+            session_sent = False
+            async for chunk in coalesce_chunks(chunks):
+                timer.observe(chunk)
+                if chunk.content:
+                    full_message += chunk.content
+                    if session_sent:
+                        yield TokenEvent(chunk.content)
+                    else:
+                        # The session only needs to reach the client once
+                        session_sent = True
+                        yield TokenEvent(chunk.content, session_id)
+
+                # Extract token counts
+                if chunk.prompt_tokens is not None:
+                    prompt_tokens = chunk.prompt_tokens
+                if chunk.completion_tokens is not None:
+                    completion_tokens = chunk.completion_tokens
+
+                if chunk.done:
+                    metrics = timer.finish(completion_tokens)
+                    metrics_data = metrics.as_dict() if metrics else None
+                    if metrics_data:
+                        logger.debug(
+                            f"Ollama generation ({request.model}, {context.history_messages} history messages, "
+                            f"prefix {context.prefix}) metrics: {metrics_data}"
+                        )
+                        if metrics_data.get("prompt_eval_duration_ms") is not None:
+                            PROMPT_EVAL_DURATION.labels(prefix=context.prefix).observe(
+                                metrics_data["prompt_eval_duration_ms"] / 1000
+                            )
+
+                    done = DoneEvent(
+                        session_id=session_id,
+                        prompt_tokens=prompt_tokens,
+                        completion_tokens=completion_tokens,
+                        metrics=metrics_data
+                    )
+
+                    if not skip_history:
+                        # Save assistant response
+                        assistant_msg = self.message_repo.save_assistant_message(
+                            user_id=request.user_id,
+                            session_id=session_id,
+                            content=full_message,
+                            model=request.model,
+                            prompt_tokens=prompt_tokens,
+                            completion_tokens=completion_tokens,
+                            metrics=metrics_data
+                        )
+                        message_saved = True
+                        done.message_id = assistant_msg.id
+
+                    if prompt_tokens is not None or completion_tokens is not None:
+                        yield UsageEvent(prompt_tokens, completion_tokens)
+                    yield done
+                    break
 
         except (asyncio.CancelledError, ConnectionError):
             was_cancelled = True
@@ -330,13 +282,13 @@ class ChatService:
                 except Exception as e:
                     logger.error(f"Error saving cancelled message on disconnect: {e}", exc_info=True)
         except httpx.TimeoutException:
-            if not message_saved:
+            if not message_saved and user_message is not None:
                 self.message_repo.delete_message(user_message.id)
-            yield f"data: {json.dumps({'error': 'Request timeout'})}\n\n"
+            yield ErrorEvent('Request timeout')
         except Exception as e:
-            if not message_saved:
+            if not message_saved and user_message is not None:
                 self.message_repo.delete_message(user_message.id)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield ErrorEvent(str(e))
         finally:
             # Save cancelled message if not already saved (only when keeping history)
             if not skip_history and not message_saved and was_cancelled:
@@ -1,8 +1,48 @@
 """Cloud provider implementations"""
-from .base import CloudProviderBase
+from typing import Dict, Optional, Type
+
+from ..model_detector import ModelDetector
+from .base import (
+    CompletionProvider,
+    CloudProviderBase,
+    CompletionResult,
+    CompletionChunk,
+    ProviderError,
+)
 from .gemini import GeminiProvider
 from .gpt import GPTProvider
 from .claude import ClaudeProvider
 from .grok import GrokProvider
+from .ollama import OllamaProvider
+
+# Cloud providers keyed by the provider name returned by ModelDetector
+CLOUD_PROVIDERS: Dict[str, Type[CloudProviderBase]] = {
+    "gemini": GeminiProvider,
+    "gpt": GPTProvider,
+    "claude": ClaudeProvider,
+    "grok": GrokProvider,
+}
+
+
+def get_completion_provider(model_name: str, user_id: Optional[int] = None) -> CompletionProvider:
+    """
+    Get the provider that serves a model
+
+    Args:
+        model_name: Model name
+        user_id: User whose rate limit budget cloud calls use
+
+    Returns:
+        Cloud provider for cloud models, OllamaProvider otherwise
+    """
+    is_cloud, provider = ModelDetector.is_cloud_model(model_name)
+    if is_cloud and provider in CLOUD_PROVIDERS:
+        return CLOUD_PROVIDERS[provider](user_id)
+    return OllamaProvider()
+
 
-__all__ = ['CloudProviderBase', 'GeminiProvider', 'GPTProvider', 'ClaudeProvider', 'GrokProvider']
+__all__ = [
+    'CompletionProvider', 'CloudProviderBase', 'CompletionResult', 'CompletionChunk', 'ProviderError',
+    'GeminiProvider', 'GPTProvider', 'ClaudeProvider', 'GrokProvider', 'OllamaProvider',
+    'CLOUD_PROVIDERS', 'get_completion_provider',
+]
@@ -1,29 +1,506 @@
-"""Base class for cloud providers"""
+"""Base classes for model providers"""
+import asyncio
+import json
+import time
+import uuid
 from abc import ABC, abstractmethod
-from typing import Optional
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, AsyncGenerator, Tuple, Union, TYPE_CHECKING
+import httpx
 from sqlalchemy.orm import Session
+
 from schemas import ChatRequest
+from models import User
+from services.message_repository import MessageRepository
+from services.generation_metrics import GenerationTimer
+from services.chat_events import DoneEvent, ErrorEvent
+from services.resilience import send_with_resilience, circuit_breaker, CircuitOpenError
+from services.rate_limiter import rate_limiter, estimate_tokens, RateLimitExceeded
+from config import (
+    PROVIDER_CONNECT_TIMEOUT,
+    PROVIDER_READ_TIMEOUT,
+    PROVIDER_HEDGE_DELAY,
+    PROVIDER_HEDGE_MAX_PROMPT_CHARS,
+)
+from metrics import track_upstream
+from tracing import start_span
+from logging_config import get_logger
+
+if TYPE_CHECKING:
+    # Imported for annotations only: both modules import this one
+    from services.context_builder import ContextBuilder
+    from services.response_cache import ResponseCache
+
+logger = get_logger(__name__)
+
+# Provider-neutral message: {"role": "system" | "user" | "assistant", "content": str, "images": [base64, ...]}
+NeutralMessage = Dict[str, Any]
+
+
+@dataclass
+class CompletionResult:
+    """Result of a non-streaming completion"""
+    content: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
+    # Server-side timings, reported by Ollama only
+    load_duration_ms: Optional[float] = None
+    prompt_eval_duration_ms: Optional[float] = None
+    eval_duration_ms: Optional[float] = None
+    # Time queued for the rate limit budget, reported by cloud providers
+    queue_ms: Optional[float] = None
+
+
+@dataclass
+class CompletionChunk:
+    """Incremental piece of a streaming completion"""
+    content: str = ""
+    done: bool = False
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Server-side timings, reported by Ollama on the final chunk
+    load_duration_ms: Optional[float] = None
+    prompt_eval_duration_ms: Optional[float] = None
+    eval_duration_ms: Optional[float] = None
+    # Time queued for the rate limit budget, reported by cloud providers on the first chunk
+    queue_ms: Optional[float] = None
+    cached: bool = False  # Replayed from the response cache
+
+
+class ProviderError(Exception):
+    """Raised when a provider returns an error; ``message`` is user-facing"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class CompletionProvider(ABC):
+    """Common completion interface shared by Ollama and the cloud providers
+
+    Subclasses only describe how to build a request and parse a response.
+    HTTP calls go through one pooled ``httpx.AsyncClient`` per provider class.
+    """
+
+    # Provider key as returned by ModelDetector (None for local Ollama)
+    name: Optional[str] = None
+    # Name shown in user-facing error messages
+    display_name: str = ""
+    timeout: float = 300.0
+
+    @property
+    def metrics_label(self) -> str:
+        """Provider label used in upstream metrics"""
+        return self.name or "ollama"
+
+    _clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+
+    @classmethod
+    def get_http_client(cls) -> httpx.AsyncClient:
+        """
+        Get the pooled HTTP client for this provider
+
+        Clients are bound to the event loop they were created on, so a new
+        client is created if the loop changed (e.g. in scripts calling asyncio.run repeatedly).
+        """
+        loop = asyncio.get_running_loop()
+        cached = CompletionProvider._clients.get(cls.__name__)
+        if cached:
+            client, client_loop = cached
+            if client_loop is loop and not client.is_closed:
+                return client
+
+        client = httpx.AsyncClient(
+            timeout=cls.http_timeout(),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+        CompletionProvider._clients[cls.__name__] = (client, loop)
+        return client
 
+    @classmethod
+    def http_timeout(cls) -> httpx.Timeout:
+        """Timeouts of the pooled client"""
+        return httpx.Timeout(cls.timeout)
 
-class CloudProviderBase(ABC):
-    """Base class for cloud model providers"""
+    @classmethod
+    async def close_clients(cls) -> None:
+        """Close all pooled clients (called on application shutdown)"""
+        for client, _ in list(CompletionProvider._clients.values()):
+            await client.aclose()
+        CompletionProvider._clients.clear()
 
     @abstractmethod
+    def build_request(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str],
+        options: Dict[str, Any],
+        stream: bool
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """
+        Build the provider HTTP request
+
+        Args:
+            model: Model name
+            messages: Provider-neutral messages
+            api_key: API key (None for local providers)
+            options: Generation options (``GenerationOptions`` fields plus json_mode);
+                options the provider's API does not support are ignored
+            stream: Whether to request a streaming response
+
+        Returns:
+            Tuple of (url, headers, json body)
+        """
+        pass
+
+    @abstractmethod
+    def parse_response(self, data: Dict[str, Any]) -> CompletionResult:
+        """Parse a non-streaming JSON response"""
+        pass
+
+    @abstractmethod
+    def parse_stream_line(self, line: str) -> Optional[CompletionChunk]:
+        """Parse one line of a streaming response; return None to skip it"""
+        pass
+
+    def map_error(self, status_code: int, message: str) -> str:
+        """Convert an HTTP error into a user-facing message"""
+        return f"{self.display_name} API error ({status_code}): {message}"
+
+    async def send(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        headers: Dict[str, str],
+        body: Dict[str, Any],
+        messages: List[NeutralMessage],
+        stream: bool
+    ) -> httpx.Response:
+        """
+        Send a built request
+
+        Streaming responses are returned before the body is read; the caller
+        closes them. Cloud providers add retries and circuit breaking.
+        """
+        return await client.send(client.build_request("POST", url, json=body, headers=headers), stream=stream)
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> CompletionResult:
+        """
+        Run a non-streaming completion
+
+        Raises:
+            ProviderError: If the provider returns an error or no content
+        """
+        url, headers, body = self.build_request(model, messages, api_key, options or {}, stream=False)
+        client = self.get_http_client()
+
+        span_attributes = {"provider": self.metrics_label, "model": model, "messages": len(messages)}
+        with start_span("provider.complete", span_attributes) as span, track_upstream(self.metrics_label, "complete"):
+            start_time = time.monotonic()
+            response = await self.send(client, url, headers, body, messages, stream=False)
+            span.set_attribute("http.status_code", response.status_code)
+            logger.debug(f"{self.display_name} completion ({model}) took {time.monotonic() - start_time:.2f}s")
+
+            if response.status_code != 200:
+                raise ProviderError(
+                    self.map_error(response.status_code, self._extract_error_message(response)),
+                    response.status_code
+                )
+
+            return self.parse_response(response.json())
+
+    async def stream(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[CompletionChunk, None]:
+        """
+        Run a streaming completion
+
+        Yields:
+            CompletionChunk objects; token counts arrive on whichever chunk the provider reports them
+
+        Raises:
+            ProviderError: If the provider returns an error
+        """
+        url, headers, body = self.build_request(model, messages, api_key, options or {}, stream=True)
+        client = self.get_http_client()
+
+        start_time = time.monotonic()
+        first_chunk = True
+        span_attributes = {"provider": self.metrics_label, "model": model, "messages": len(messages)}
+        # Not the current span: it stays open while the consumer handles each chunk
+        with start_span("provider.stream", span_attributes, current=False) as span, track_upstream(self.metrics_label, "stream"):
+            response = await self.send(client, url, headers, body, messages, stream=True)
+            try:
+                span.set_attribute("http.status_code", response.status_code)
+                if response.status_code != 200:
+                    await response.aread()
+                    raise ProviderError(
+                        self.map_error(response.status_code, self._extract_error_message(response)),
+                        response.status_code
+                    )
+
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = self.parse_stream_line(line)
+                    if chunk is None:
+                        continue
+                    if first_chunk:
+                        first_chunk = False
+                        span.add_event("first_chunk")
+                        logger.debug(f"{self.display_name} stream ({model}) first chunk after {time.monotonic() - start_time:.2f}s")
+                    yield chunk
+                    if chunk.done:
+                        break
+            finally:
+                await response.aclose()
+
+    @staticmethod
+    def _extract_error_message(response: httpx.Response) -> str:
+        """Extract error message from API response"""
+        try:
+            error_json = response.json()
+        except (ValueError, json.JSONDecodeError):
+            return response.text
+        error = error_json.get("error", error_json) if isinstance(error_json, dict) else error_json
+        if isinstance(error, dict):
+            return error.get("message", str(error_json))
+        return str(error)
+
+    @staticmethod
+    def split_data_uri(image: str, default_mime: str) -> Tuple[str, str]:
+        """Split a base64 image (optionally a data URI) into (mime_type, data)"""
+        if image.startswith("data:") and ";base64," in image:
+            header, data = image.split(",", 1)
+            return header[5:].split(";", 1)[0], data
+        return default_mime, image
+
+
+class CloudProviderBase(CompletionProvider):
+    """Base class for cloud model providers used by chat
+
+    Requests are retried on 429/5xx and connection errors, rejected while the
+    provider's circuit breaker is open, and short non-streaming prompts may be
+    hedged (see ``services.resilience``). Calls are queued while the user's
+    request/token budget for the provider is spent (see ``services.rate_limiter``).
+    """
+
+    def __init__(self, user_id: Optional[int] = None):
+        self.user_id = user_id  # Whose rate limit budget the calls use
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> CompletionResult:
+        try:
+            async with self._rate_limited(messages, options) as reservation:
+                try:
+                    result = await super().complete(model, messages, api_key, options)
+                except ProviderError as e:
+                    self._on_provider_error(e)
+                    raise
+                reservation.settle(result.prompt_tokens, result.completion_tokens)
+                result.queue_ms = reservation.wait * 1000
+                return result
+        except RateLimitExceeded as e:
+            raise self._budget_error(e)
+
+    async def stream(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[CompletionChunk, None]:
+        try:
+            async with self._rate_limited(messages, options) as reservation:
+                prompt_tokens = None
+                completion_tokens = None
+                first = True
+                try:
+                    async for chunk in super().stream(model, messages, api_key, options):
+                        if first:
+                            first = False
+                            chunk.queue_ms = reservation.wait * 1000
+                        if chunk.prompt_tokens is not None:
+                            prompt_tokens = chunk.prompt_tokens
+                        if chunk.completion_tokens is not None:
+                            completion_tokens = chunk.completion_tokens
+                        yield chunk
+                except ProviderError as e:
+                    self._on_provider_error(e)
+                    raise
+                finally:
+                    reservation.settle(prompt_tokens, completion_tokens)
+        except RateLimitExceeded as e:
+            raise self._budget_error(e)
+
+    def _rate_limited(self, messages: List[NeutralMessage], options: Optional[Dict[str, Any]]):
+        """Queue for the user's request/token budget (raises RateLimitExceeded on entry)"""
+        return rate_limiter.acquire(self.user_id, self.metrics_label, estimate_tokens(messages, options))
+
+    def _budget_error(self, error: RateLimitExceeded) -> ProviderError:
+        return ProviderError(
+            f"{self.display_name} APIの利用上限（1分あたりのリクエスト数/トークン数）に達しました。"
+            f"{error.retry_after:.0f}秒後に再試行してください",
+            429
+        )
+
+    def _on_provider_error(self, error: ProviderError) -> None:
+        if error.status_code == 429:
+            # Our budget is above the account's real limit: hold back queued requests
+            rate_limiter.budget(self.user_id, self.metrics_label).exhaust()
+
+    @classmethod
+    def http_timeout(cls) -> httpx.Timeout:
+        # A hung upstream is abandoned after PROVIDER_READ_TIMEOUT without data
+        return httpx.Timeout(cls.timeout, connect=PROVIDER_CONNECT_TIMEOUT, read=PROVIDER_READ_TIMEOUT)
+
+    async def send(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        headers: Dict[str, str],
+        body: Dict[str, Any],
+        messages: List[NeutralMessage],
+        stream: bool
+    ) -> httpx.Response:
+        hedge_delay = 0.0
+        if not stream and PROVIDER_HEDGE_DELAY > 0:
+            prompt_chars = sum(len(msg.get("content") or "") for msg in messages)
+            if prompt_chars <= PROVIDER_HEDGE_MAX_PROMPT_CHARS:
+                hedge_delay = PROVIDER_HEDGE_DELAY
+
+        try:
+            return await send_with_resilience(
+                lambda: super(CloudProviderBase, self).send(client, url, headers, body, messages, stream),
+                self.metrics_label,
+                circuit_breaker(self.metrics_label),
+                hedge_delay=hedge_delay
+            )
+        except CircuitOpenError as e:
+            raise ProviderError(
+                f"{self.display_name} APIは一時的に利用できません。{e.retry_after:.0f}秒後に再試行してください",
+                503
+            )
+
     async def generate_response(
         self,
         request: ChatRequest,
         db: Session,
-        api_key: str
-    ) -> Optional[dict]:
+        api_key: str,
+        options: Optional[Dict[str, Any]] = None,
+        *,
+        context_builder: "ContextBuilder",
+        cache: Optional["ResponseCache"] = None
+    ) -> Union[DoneEvent, ErrorEvent]:
         """
-        Generate response from cloud provider
+        Generate a chat response, persisting the exchange unless skip_history is set
 
         Args:
             request: Chat request
             db: Database session
             api_key: API key for the provider
+            options: Generation options (see ``build_request``)
+            context_builder: Builds the history and current message sent to the model
+            cache: Response cache to serve the completion through (None to call the provider directly)
 
         Returns:
-            Dict with response data or error
+            DoneEvent carrying the whole response, or ErrorEvent
         """
-        pass
+        # Verify user exists
+        user = db.query(User).filter(User.id == request.user_id).first()
+        if not user:
+            return ErrorEvent("User not found")
+
+        skip_history = getattr(request, "skip_history", False)
+
+        session_id = request.session_id or str(uuid.uuid4())
+        repo = MessageRepository(db) if not skip_history else None
+
+        # Save user message only when keeping history
+        user_message = None
+        if repo is not None:
+            user_message = repo.save_user_message(
+                user_id=request.user_id,
+                session_id=session_id,
+                content=request.message,
+                model=request.model,
+                images=request.images
+            )
+
+        def rollback_user_message():
+            if repo is not None and user_message is not None:
+                repo.delete_message(user_message.id)
+
+        try:
+            # Conversation history (only when we use stored chat history) and the current message
+            messages = context_builder.build(
+                user_id=request.user_id,
+                session_id=session_id if user_message is not None else None,
+                model=request.model,
+                content=request.prompt_message,
+                images=request.images,
+                exclude_message_id=user_message.id if user_message is not None else None
+            ).messages
+
+            timer = GenerationTimer()
+            if cache is not None:
+                result = await cache.complete(
+                    self, request.model, messages, api_key, options, force=request.force_cache
+                )
+            else:
+                result = await self.complete(request.model, messages, api_key, options)
+            timer.observe_result(result)
+            metrics = timer.finish(result.completion_tokens)
+            metrics_data = metrics.as_dict() if metrics else None
+            if metrics_data:
+                logger.debug(f"{self.display_name} generation ({request.model}) metrics: {metrics_data}")
+
+            # Save assistant message only when keeping history
+            assistant_msg = None
+            if repo is not None:
+                assistant_msg = repo.save_assistant_message(
+                    user_id=request.user_id,
+                    session_id=session_id,
+                    content=result.content,
+                    model=request.model,
+                    prompt_tokens=result.prompt_tokens,
+                    completion_tokens=result.completion_tokens,
+                    metrics=metrics_data
+                )
+
+            return DoneEvent(
+                session_id=session_id,
+                message_id=assistant_msg.id if assistant_msg is not None else None,
+                prompt_tokens=result.prompt_tokens,
+                completion_tokens=result.completion_tokens,
+                metrics=metrics_data,
+                content=result.content
+            )
+
+        except ProviderError as e:
+            rollback_user_message()
+            return ErrorEvent(e.message)
+        except httpx.TimeoutException:
+            rollback_user_message()
+            return ErrorEvent("Request timeout")
+        except Exception as e:
+            rollback_user_message()
+            return ErrorEvent(f"An unexpected error occurred: {str(e)}")
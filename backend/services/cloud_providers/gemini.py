@@ -1,20 +1,18 @@
 """Gemini API provider implementation"""
-import httpx
 import json
-import uuid
-from typing import Optional
-from google import genai
-from sqlalchemy.orm import Session
+from typing import Optional, List, Dict, Any, Tuple
 
-from .base import CloudProviderBase
-from schemas import ChatRequest
-from models import User
-from services.message_repository import MessageRepository
+from config import GEMINI_API_BASE_URL
+from .base import CloudProviderBase, CompletionResult, CompletionChunk, ProviderError, NeutralMessage
 
 
 class GeminiProvider(CloudProviderBase):
     """Gemini API provider"""
 
+    name = "gemini"
+    display_name = "Gemini"
+    api_base_url = GEMINI_API_BASE_URL
+
     @staticmethod
     def get_model_name(model_name: str) -> str:
         """
@@ -30,133 +28,113 @@ class GeminiProvider(CloudProviderBase):
         # This function is kept for backward compatibility
         return model_name
 
-    async def generate_response(
-        self,
-        request: ChatRequest,
-        db: Session,
-        api_key: str
-    ) -> Optional[dict]:
+    def _format_messages(self, messages: List[NeutralMessage]) -> Tuple[str, List[Dict[str, Any]]]:
         """
-        Generate response from Gemini API
-
-        Args:
-            request: Chat request
-            db: Database session
-            api_key: Gemini API key
+        Format messages for the Gemini generateContent API
 
         Returns:
-            Dict with response data or error
+            Tuple of (system instruction, contents)
         """
-        # Verify user exists
-        user = db.query(User).filter(User.id == request.user_id).first()
-        if not user:
-            return {"error": "User not found"}
-
-        skip_history = getattr(request, "skip_history", False)
-
-        session_id = request.session_id or str(uuid.uuid4())
-        repo = MessageRepository(db) if not skip_history else None
-
-        # Save user message only when keeping history
-        user_message = None
-        if not skip_history and repo is not None:
-            user_message = repo.save_user_message(
-                user_id=request.user_id,
-                session_id=session_id,
-                content=request.message,
-                model=request.model,
-                images=request.images
-            )
+        system_instruction = ""
+        contents = []
 
-        try:
+        for msg in messages:
+            if msg["role"] == "system":
+                system_instruction += msg["content"] + "\n"
+                continue
+
+            # テキスト部分
+            parts: List[Dict[str, Any]] = [{"text": msg["content"]}]
+            # 画像部分
+            for img_base64 in msg.get("images") or []:
+                mime_type, data = self.split_data_uri(img_base64, "image/jpeg")
+                parts.append({"inline_data": {"mime_type": mime_type, "data": data}})
 
-            import base64
-            from google.genai import types
-
-            contents = []
-
-            if not skip_history and repo is not None and user_message is not None:
-                history = repo.get_session_history(
-                    user_id=request.user_id,
-                    session_id=session_id,
-                    exclude_message_id=user_message.id,
-                    limit=20
-                )
-
-                for msg in history:
-                    # テキスト部分
-                    parts = [msg.content]
-                    # 画像部分
-                    if msg.images:
-                        for img_base64 in msg.images:
-                            img_data = img_base64.split(",", 1)[1] if "," in img_base64 else img_base64
-                            img_bytes = base64.b64decode(img_data)
-                            parts.append(types.Part.from_bytes(data=img_bytes, mime_type="image/jpeg"))
-                    contents.extend(parts)
-
-            # 現在のメッセージ
-            current_parts = [request.message]
-            if request.images:
-                for img_base64 in request.images:
-                    img_data = img_base64.split(",", 1)[1] if "," in img_base64 else img_base64
-                    img_bytes = base64.b64decode(img_data)
-                    current_parts.append(types.Part.from_bytes(data=img_bytes, mime_type="image/jpeg"))
-            contents.extend(current_parts)
-
-            gemini_model = self.get_model_name(request.model)
-            client = genai.Client(api_key=api_key)
-
-            response = await client.aio.models.generate_content(
-                model=gemini_model,
-                contents=contents,
-            )
-
-            # Check for empty response or candidates
-            if not response.candidates:
-                 # In new SDK, prompt_feedback usually on response or similar
-                 # But usually text is None if blocked.
-                 # Let's rely on candidates check.
-                 repo.delete_message(user_message.id)
-                 return {"error": "Gemini API returned no content (possibly blocked)."}
-
-            # Get text from the first candidate
-            full_message = response.text
-             
-            # Extract token counts
-            usage = response.usage_metadata
-            prompt_tokens = usage.prompt_token_count if usage else 0
-            completion_tokens = usage.candidates_token_count if usage else 0
-
-            # Save assistant message only when keeping history
-            assistant_msg = None
-            if not skip_history and repo is not None:
-                assistant_msg = repo.save_assistant_message(
-                    user_id=request.user_id,
-                    session_id=session_id,
-                    content=full_message,
-                    model=request.model,
-                    prompt_tokens=prompt_tokens,
-                    completion_tokens=completion_tokens
-                )
-
-            response_data = {
-                "content": full_message,
-                "session_id": session_id,
-                "done": True,
-            }
-            if assistant_msg is not None:
-                response_data["message_id"] = assistant_msg.id
-            if prompt_tokens is not None:
-                response_data["prompt_tokens"] = prompt_tokens
-            if completion_tokens is not None:
-                response_data["completion_tokens"] = completion_tokens
-            return response_data
-
-        except httpx.TimeoutException:
-            if not skip_history and repo is not None and user_message is not None:
-                repo.delete_message(user_message.id)
-            return {"error": "Request timeout"}
-        except Exception as e:
-            if not skip_history and repo is not None and user_message is not None:
-                repo.delete_message(user_message.id)
-            return {"error": f"An unexpected error occurred: {str(e)}"}
+            role = "user" if msg["role"] == "user" else "model"
+            contents.append({"role": role, "parts": parts})
+
+        return system_instruction.strip(), contents
+
+    def build_request(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str],
+        options: Dict[str, Any],
+        stream: bool
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        system_instruction, contents = self._format_messages(messages)
+        body: Dict[str, Any] = {"contents": contents}
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+
+        generation_config: Dict[str, Any] = {}
+        option_names = {
+            "temperature": "temperature",
+            "top_p": "topP",
+            "top_k": "topK",
+            "num_predict": "maxOutputTokens",
+            "seed": "seed",
+        }
+        for option, config_name in option_names.items():
+            if options.get(option) is not None:
+                generation_config[config_name] = options[option]
+        if options.get("json_mode"):
+            generation_config["responseMimeType"] = "application/json"
+        if generation_config:
+            body["generationConfig"] = generation_config
+
+        gemini_model = self.get_model_name(model)
+        if stream:
+            url = f"{self.api_base_url}/models/{gemini_model}:streamGenerateContent?alt=sse&key={api_key}"
+        else:
+            url = f"{self.api_base_url}/models/{gemini_model}:generateContent?key={api_key}"
+        return url, {"Content-Type": "application/json"}, body
+
+    @staticmethod
+    def _candidate_text(data: Dict[str, Any]) -> str:
+        candidate = data["candidates"][0]
+        return "".join(
+            part.get("text", "")
+            for part in candidate.get("content", {}).get("parts", [])
+        )
+
+    def parse_response(self, data: Dict[str, Any]) -> CompletionResult:
+        if not data.get("candidates"):
+            raise ProviderError("Gemini API returned no content (possibly blocked).")
+
+        usage = data.get("usageMetadata") or {}
+        return CompletionResult(
+            content=self._candidate_text(data),
+            prompt_tokens=usage.get("promptTokenCount"),
+            completion_tokens=usage.get("candidatesTokenCount"),
+            finish_reason=data["candidates"][0].get("finishReason")
+        )
+
+    def parse_stream_line(self, line: str) -> Optional[CompletionChunk]:
+        if not line.startswith("data:"):
+            return None
+        try:
+            data = json.loads(line[5:].strip())
+        except json.JSONDecodeError:
+            return None
+
+        # Check for safety blocks
+        if not data.get("candidates"):
+            block_reason = (data.get("promptFeedback") or {}).get("blockReason")
+            if block_reason:
+                raise ProviderError(f"Request blocked by Gemini: {block_reason}")
+            return None
+
+        # usageMetadata is cumulative, so the last chunk carries the totals
+        usage = data.get("usageMetadata") or {}
+        return CompletionChunk(
+            content=self._candidate_text(data),
+            prompt_tokens=usage.get("promptTokenCount"),
+            completion_tokens=usage.get("candidatesTokenCount")
+        )
+
+    def map_error(self, status_code: int, message: str) -> str:
+        if status_code == 429:
+            return "Gemini APIのレート制限に達しました。しばらく待ってから再試行してください。"
+        return super().map_error(status_code, message)
@@ -1,19 +1,18 @@
 """OpenAI GPT API provider implementation"""
-import httpx
 import json
-import uuid
-from typing import Optional
-from sqlalchemy.orm import Session
+from typing import Optional, List, Dict, Any, Tuple
 
-from .base import CloudProviderBase
-from schemas import ChatRequest
-from models import User
-from services.message_repository import MessageRepository
+from config import OPENAI_API_BASE_URL
+from .base import CloudProviderBase, CompletionResult, CompletionChunk, ProviderError, NeutralMessage
 
 
 class GPTProvider(CloudProviderBase):
     """OpenAI GPT API provider"""
 
+    name = "gpt"
+    display_name = "OpenAI"
+    api_url = f"{OPENAI_API_BASE_URL}/chat/completions"
+
     @staticmethod
     def get_model_name(model_name: str) -> str:
         """
@@ -29,186 +28,109 @@ class GPTProvider(CloudProviderBase):
         # This function is kept for backward compatibility
         return model_name
 
-    async def generate_response(
-        self,
-        request: ChatRequest,
-        db: Session,
-        api_key: str
-    ) -> Optional[dict]:
-        """
-        Generate response from OpenAI GPT API
-
-        Args:
-            request: Chat request
-            db: Database session
-            api_key: OpenAI API key
-
-        Returns:
-            Dict with response data or error
-        """
-        # Verify user exists
-        user = db.query(User).filter(User.id == request.user_id).first()
-        if not user:
-            return {"error": "User not found"}
-
-        skip_history = getattr(request, "skip_history", False)
-
-        session_id = request.session_id or str(uuid.uuid4())
-        repo = MessageRepository(db) if not skip_history else None
-
-        # Save user message only when keeping history
-        user_message = None
-        if not skip_history and repo is not None:
-            user_message = repo.save_user_message(
-                user_id=request.user_id,
-                session_id=session_id,
-                content=request.message,
-                model=request.model,
-                images=request.images
-            )
-
-        try:
-            # Build conversation history (only when we use stored chat history)
-            messages = []
-            if not skip_history and repo is not None and user_message is not None:
-                history = repo.get_session_history(
-                    user_id=request.user_id,
-                    session_id=session_id,
-                    exclude_message_id=user_message.id,
-                    limit=20
-                )
-
-                # Format messages for OpenAI API
-                for msg in history:
-                    # OpenAI format: {"role": "user/assistant", "content": "text" or [{"type": "text/image_url", ...}]}
-                    if msg.images:
-                        # Multi-modal message with images
-                        content = [{"type": "text", "text": msg.content}]
-                        for img_base64 in msg.images:
-                            # OpenAI expects full data URL
-                            if not img_base64.startswith("data:"):
-                                img_base64 = f"data:image/jpeg;base64,{img_base64}"
-                            content.append({
-                                "type": "image_url",
-                                "image_url": {"url": img_base64}
-                            })
-                        messages.append({"role": msg.role, "content": content})
-                    else:
-                        # Text-only message
-                        messages.append({"role": msg.role, "content": msg.content})
-
-            # Add current message
-            if request.images:
-                # Multi-modal message with images
-                current_content = [{"type": "text", "text": request.message}]
-                for img_base64 in request.images:
+    def _format_messages(self, messages: List[NeutralMessage]) -> List[Dict[str, Any]]:
+        """Format messages for the OpenAI chat completions API"""
+        formatted = []
+        for msg in messages:
+            # OpenAI format: {"role": "user/assistant", "content": "text" or [{"type": "text/image_url", ...}]}
+            if msg.get("images"):
+                content = [{"type": "text", "text": msg["content"]}]
+                for img_base64 in msg["images"]:
+                    # OpenAI expects full data URL
                     if not img_base64.startswith("data:"):
                         img_base64 = f"data:image/jpeg;base64,{img_base64}"
-                    current_content.append({
+                    content.append({
                         "type": "image_url",
                         "image_url": {"url": img_base64}
                     })
-                messages.append({"role": "user", "content": current_content})
+                formatted.append({"role": msg["role"], "content": content})
             else:
-                # Text-only message
-                messages.append({"role": "user", "content": request.message})
-
-            # Prepare OpenAI request
-            gpt_model = self.get_model_name(request.model)
-            openai_request = {
-                "model": gpt_model,
-                "messages": messages
-            }
-            # Note: temperature, max_tokens, and other optional params not specified
-            # to ensure compatibility with all models (some models don't support custom values)
-
-            url = "https://api.openai.com/v1/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-
-            # Call OpenAI API
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                response = await client.post(url, json=openai_request, headers=headers)
-
-                if response.status_code != 200:
-                    error_text = response.text
-
-                    try:
-                        error_json = response.json()
-                        error_message = error_json.get("error", {}).get("message", str(error_json))
-                    except json.JSONDecodeError:
-                        error_message = error_text
-
-                    # Special handling for common error codes
-                    if response.status_code == 429:
-                        error_message = "OpenAI APIのレート制限に達しました。しばらく待ってから再試行するか、APIキーの使用制限を確認してください。"
-                    elif response.status_code == 401:
-                        error_message = "OpenAI APIキーが無効です。正しいAPIキーを登録してください。"
-                    elif response.status_code == 403:
-                        error_message = "OpenAI APIへのアクセスが拒否されました。APIキーの権限を確認してください。"
-                    else:
-                        error_message = f"OpenAI API error ({response.status_code}): {error_message}"
-
-                    # Rollback user message
-                    if not skip_history and repo is not None and user_message is not None:
-                        repo.delete_message(user_message.id)
-                    return {"error": error_message}
-
-                response_json = response.json()
-
-                # Check for valid response
-                if not response_json.get("choices"):
-                    if not skip_history and repo is not None and user_message is not None:
-                        repo.delete_message(user_message.id)
-                    return {"error": "OpenAI API returned no content."}
-
-                # Extract response content
-                choice = response_json["choices"][0]
-                full_message = choice.get("message", {}).get("content", "")
-
-                # Check for content filtering
-                finish_reason = choice.get("finish_reason")
-                if finish_reason == "content_filter":
-                    repo.delete_message(user_message.id)
-                    return {"error": "Request was blocked by OpenAI's content filter."}
-
-                # Extract token counts
-                usage = response_json.get("usage", {})
-                prompt_tokens = usage.get("prompt_tokens")
-                completion_tokens = usage.get("completion_tokens")
-
-                # Save assistant message only when keeping history
-                assistant_msg = None
-                if not skip_history and repo is not None:
-                    assistant_msg = repo.save_assistant_message(
-                        user_id=request.user_id,
-                        session_id=session_id,
-                        content=full_message,
-                        model=request.model,
-                        prompt_tokens=prompt_tokens,
-                        completion_tokens=completion_tokens
-                    )
-
-                response_data = {
-                    "content": full_message,
-                    "session_id": session_id,
-                    "done": True,
-                }
-                if assistant_msg is not None:
-                    response_data["message_id"] = assistant_msg.id
-                if prompt_tokens is not None:
-                    response_data["prompt_tokens"] = prompt_tokens
-                if completion_tokens is not None:
-                    response_data["completion_tokens"] = completion_tokens
-                return response_data
-
-        except httpx.TimeoutException:
-            if not skip_history and repo is not None and user_message is not None:
-                repo.delete_message(user_message.id)
-            return {"error": "Request timeout"}
-        except Exception as e:
-            if not skip_history and repo is not None and user_message is not None:
-                repo.delete_message(user_message.id)
-            return {"error": f"An unexpected error occurred: {str(e)}"}
+                formatted.append({"role": msg["role"], "content": msg["content"]})
+        return formatted
+
+    def build_request(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str],
+        options: Dict[str, Any],
+        stream: bool
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        body: Dict[str, Any] = {
+            "model": self.get_model_name(model),
+            "messages": self._format_messages(messages),
+            "stream": stream
+        }
+        if stream:
+            body["stream_options"] = {"include_usage": True}
+
+        # Optional params are only sent when explicitly requested, since some
+        # models reject custom values
+        if options.get("temperature") is not None:
+            body["temperature"] = options["temperature"]
+        if options.get("top_p") is not None:
+            body["top_p"] = options["top_p"]
+        if options.get("num_predict") is not None:
+            body["max_tokens"] = options["num_predict"]
+        if options.get("seed") is not None:
+            body["seed"] = options["seed"]
+        if options.get("json_mode"):
+            body["response_format"] = {"type": "json_object"}
+
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        return self.api_url, headers, body
+
+    def parse_response(self, data: Dict[str, Any]) -> CompletionResult:
+        if not data.get("choices"):
+            raise ProviderError(f"{self.display_name} API returned no content.")
+
+        choice = data["choices"][0]
+        finish_reason = choice.get("finish_reason")
+        if finish_reason == "content_filter":
+            raise ProviderError(f"Request was blocked by {self.display_name}'s content filter.")
+
+        usage = data.get("usage") or {}
+        return CompletionResult(
+            content=choice.get("message", {}).get("content") or "",
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            finish_reason=finish_reason
+        )
+
+    def parse_stream_line(self, line: str) -> Optional[CompletionChunk]:
+        if not line.startswith("data:"):
+            return None
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return CompletionChunk(done=True)
+
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            return None
+
+        chunk = CompletionChunk()
+        choices = data.get("choices") or []
+        if choices:
+            chunk.content = (choices[0].get("delta") or {}).get("content") or ""
+            if choices[0].get("finish_reason") == "content_filter":
+                raise ProviderError(f"Request was blocked by {self.display_name}'s content filter.")
+
+        # With include_usage the final chunk carries usage and no choices
+        usage = data.get("usage")
+        if usage:
+            chunk.prompt_tokens = usage.get("prompt_tokens")
+            chunk.completion_tokens = usage.get("completion_tokens")
+        return chunk
+
+    def map_error(self, status_code: int, message: str) -> str:
+        if status_code == 429:
+            return "OpenAI APIのレート制限に達しました。しばらく待ってから再試行するか、APIキーの使用制限を確認してください。"
+        if status_code == 401:
+            return "OpenAI APIキーが無効です。正しいAPIキーを登録してください。"
+        if status_code == 403:
+            return "OpenAI APIへのアクセスが拒否されました。APIキーの権限を確認してください。"
+        return super().map_error(status_code, message)
@@ -0,0 +1,177 @@
+"""Local Ollama provider implementation"""
+import copy
+import json
+from typing import Optional, List, Dict, Any, Tuple, AsyncGenerator
+
+from config import OLLAMA_BASE_URL
+from logging_config import get_logger
+from ..ollama_pool import ollama_pool, OllamaBackend
+from .base import CompletionProvider, CompletionResult, CompletionChunk, ProviderError, NeutralMessage
+
+logger = get_logger(__name__)
+
+
+def _ns_to_ms(value: Optional[int]) -> Optional[float]:
+    """Ollama reports durations in nanoseconds"""
+    return value / 1_000_000 if value is not None else None
+
+
+class OllamaProvider(CompletionProvider):
+    """Ollama /api/chat provider for local models
+
+    Requests are routed across the backends of ``ollama_pool`` and fail over
+    to the next backend on connection errors, server errors or a missing model.
+    """
+
+    name = None
+    display_name = "Ollama"
+
+    def __init__(self, base_url: Optional[str] = None, affinity_key: Optional[str] = None):
+        self.base_url = base_url  # Fixed backend for this call (set while routing)
+        self.affinity_key = affinity_key
+
+    def for_session(self, session_id: Optional[str]) -> "OllamaProvider":
+        """Provider that keeps a session on the backend holding its KV cache"""
+        return OllamaProvider(self.base_url, session_id)
+
+    def _at(self, backend: OllamaBackend) -> "OllamaProvider":
+        provider = copy.copy(self)
+        provider.base_url = backend.url
+        return provider
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> CompletionResult:
+        if self.base_url is not None:
+            return await super().complete(model, messages, api_key, options)
+
+        last_error: Optional[BaseException] = None
+        for backend in ollama_pool.route(model, self.affinity_key):
+            with ollama_pool.track(backend):
+                try:
+                    result = await self._at(backend).complete(model, messages, api_key, options)
+                except Exception as e:
+                    if not ollama_pool.should_fail_over(backend, model, e):
+                        raise
+                    logger.warning(f"Ollama completion ({model}) failed on {backend.url}, trying the next backend: {e}")
+                    last_error = e
+                    continue
+            ollama_pool.pin(self.affinity_key, backend)
+            return result
+        raise self._exhausted(model, last_error)
+
+    async def stream(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[CompletionChunk, None]:
+        if self.base_url is not None:
+            async for chunk in super().stream(model, messages, api_key, options):
+                yield chunk
+            return
+
+        last_error: Optional[BaseException] = None
+        for backend in ollama_pool.route(model, self.affinity_key):
+            started = False
+            with ollama_pool.track(backend):
+                chunks = self._at(backend).stream(model, messages, api_key, options)
+                try:
+                    async for chunk in chunks:
+                        if not started:
+                            started = True
+                            ollama_pool.pin(self.affinity_key, backend)
+                        yield chunk
+                except Exception as e:
+                    # Once tokens were sent the response cannot be restarted elsewhere
+                    if started or not ollama_pool.should_fail_over(backend, model, e):
+                        raise
+                    logger.warning(f"Ollama stream ({model}) failed on {backend.url}, trying the next backend: {e}")
+                    last_error = e
+                    continue
+                finally:
+                    await chunks.aclose()
+            return
+        raise self._exhausted(model, last_error)
+
+    @staticmethod
+    def _exhausted(model: str, last_error: Optional[BaseException]) -> BaseException:
+        if isinstance(last_error, ProviderError):
+            return last_error
+        return ProviderError(f"利用可能なOllamaサーバーがありません（モデル: {model}）: {last_error}", 503)
+
+    def _format_messages(self, messages: List[NeutralMessage]) -> List[Dict[str, Any]]:
+        """Format messages for the Ollama chat API"""
+        formatted = []
+        for msg in messages:
+            msg_dict = {"role": msg["role"], "content": msg["content"]}
+            if msg.get("images"):
+                msg_dict["images"] = msg["images"]
+            formatted.append(msg_dict)
+        return formatted
+
+    def build_request(
+        self,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str],
+        options: Dict[str, Any],
+        stream: bool
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        body: Dict[str, Any] = {
+            "model": model,
+            "messages": self._format_messages(messages),
+            "stream": stream
+        }
+        model_options = {
+            key: options[key]
+            for key in ("temperature", "top_p", "top_k", "num_predict", "num_ctx", "seed")
+            if options.get(key) is not None
+        }
+        if model_options:
+            body["options"] = model_options
+        if options.get("keep_alive") is not None:
+            body["keep_alive"] = options["keep_alive"]
+        if options.get("json_mode"):
+            body["format"] = "json"
+        return f"{self.base_url or OLLAMA_BASE_URL}/api/chat", {}, body
+
+    def parse_response(self, data: Dict[str, Any]) -> CompletionResult:
+        if data.get("error"):
+            raise ProviderError(f"Ollama API error: {data['error']}")
+        return CompletionResult(
+            content=(data.get("message") or {}).get("content", ""),
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            finish_reason=data.get("done_reason"),
+            load_duration_ms=_ns_to_ms(data.get("load_duration")),
+            prompt_eval_duration_ms=_ns_to_ms(data.get("prompt_eval_duration")),
+            eval_duration_ms=_ns_to_ms(data.get("eval_duration"))
+        )
+
+    def parse_stream_line(self, line: str) -> Optional[CompletionChunk]:
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+
+        if data.get("error"):
+            raise ProviderError(f"Ollama API error: {data['error']}")
+
+        return CompletionChunk(
+            content=(data.get("message") or {}).get("content", ""),
+            done=data.get("done", False),
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            load_duration_ms=_ns_to_ms(data.get("load_duration")),
+            prompt_eval_duration_ms=_ns_to_ms(data.get("prompt_eval_duration")),
+            eval_duration_ms=_ns_to_ms(data.get("eval_duration"))
+        )
+
+    def map_error(self, status_code: int, message: str) -> str:
+        return f"Ollama API error: {message}"
@@ -0,0 +1,130 @@
+"""Conversation context with prefixes that stay stable across turns
+
+Ollama (and the cloud providers' prompt caches) only reuse the work done for
+a previous turn when the new prompt starts with exactly the same tokens. The
+history window therefore never slides by one turn: once a session outgrows
+``CHAT_HISTORY_MAX_MESSAGES`` the oldest messages are dropped in blocks of
+``CHAT_HISTORY_TRUNCATE_BLOCK``, so the prefix only changes once per block.
+"""
+from dataclasses import dataclass
+from typing import List, Optional
+from sqlalchemy.orm import Session
+
+from config import CHAT_HISTORY_MAX_MESSAGES, CHAT_HISTORY_TRUNCATE_BLOCK
+from .message_repository import MessageRepository
+from .cloud_providers.base import NeutralMessage
+
+# How the context relates to the previous turn of the session
+PREFIX_NEW = "new"  # First turn: nothing to reuse
+PREFIX_STABLE = "stable"  # Previous turn's context is a prefix of this one
+PREFIX_SHIFTED = "shifted"  # The window start moved (a block was dropped)
+PREFIX_MODEL_CHANGED = "model_changed"  # Previous reply came from another model
+
+
+@dataclass
+class ChatContext:
+    """Messages to send for a turn"""
+    messages: List[NeutralMessage]
+    history_messages: int  # Stored messages included before the current one
+    prefix: str  # One of the PREFIX_* values
+
+
+def window_start(total: int, max_messages: int, block: int) -> int:
+    """
+    Index of the first history message sent
+
+    Args:
+        total: Messages in the session (before the current one)
+        max_messages: Upper bound of messages sent
+        block: Messages dropped at once when the bound is exceeded
+
+    Returns:
+        Start index, a multiple of ``block`` (0 while the session is short)
+    """
+    if total <= max_messages:
+        return 0
+    block = max(1, min(block, max_messages))
+    overflow = total - max_messages
+    return -(-overflow // block) * block
+
+
+class ContextBuilder:
+    """Builds the messages of a chat turn from the stored session history"""
+
+    def __init__(
+        self,
+        db: Session,
+        max_messages: int = CHAT_HISTORY_MAX_MESSAGES,
+        truncate_block: int = CHAT_HISTORY_TRUNCATE_BLOCK
+    ):
+        self.repo = MessageRepository(db)
+        self.max_messages = max_messages
+        self.truncate_block = truncate_block
+
+    def build(
+        self,
+        user_id: int,
+        session_id: Optional[str],
+        model: str,
+        content: str,
+        images: Optional[List[str]] = None,
+        exclude_message_id: Optional[int] = None
+    ) -> ChatContext:
+        """
+        Build the context for a turn
+
+        History messages are serialized exactly as they are stored, in
+        (created_at, id) order, and the window always starts at a user
+        message so no turn is cut in half.
+
+        Args:
+            user_id: ID of the user
+            session_id: Session to load history from (None for no history)
+            model: Model of this turn
+            content: Current message text sent to the model
+            images: Current message images
+            exclude_message_id: The current message when it is already stored
+
+        Returns:
+            ChatContext
+        """
+        history = []
+        total = 0
+        if session_id:
+            total = self.repo.count_session_messages(user_id, session_id, exclude_message_id)
+        if total:
+            start = window_start(total, self.max_messages, self.truncate_block)
+            history = self.repo.get_session_history(
+                user_id=user_id,
+                session_id=session_id,
+                exclude_message_id=exclude_message_id,
+                limit=total - start,
+                offset=start
+            )
+            # Never start with the reply to a user message that was dropped
+            while history and history[0].role != "user":
+                history = history[1:]
+
+        messages: List[NeutralMessage] = [
+            {"role": msg.role, "content": msg.content, "images": msg.images or []}
+            for msg in history
+        ]
+        messages.append({"role": "user", "content": content, "images": images or []})
+
+        return ChatContext(
+            messages=messages,
+            history_messages=len(history),
+            prefix=self._prefix(total, history, model)
+        )
+
+    def _prefix(self, total: int, history: list, model: str) -> str:
+        if not total:
+            return PREFIX_NEW
+        last_reply = next((msg for msg in reversed(history) if msg.role == "assistant"), None)
+        if last_reply is not None and last_reply.model != model:
+            return PREFIX_MODEL_CHANGED
+        # The previous turn saw two fewer messages (its question and reply)
+        previous_start = window_start(max(total - 2, 0), self.max_messages, self.truncate_block)
+        if previous_start != window_start(total, self.max_messages, self.truncate_block):
+            return PREFIX_SHIFTED
+        return PREFIX_STABLE
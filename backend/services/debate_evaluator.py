@@ -1,14 +1,14 @@
 """Debate evaluator service for AI-powered debate analysis"""
 import json
-import httpx
 from sqlalchemy.orm import Session
 from typing import Dict, List, Any, Optional
 
-from config import OLLAMA_BASE_URL
-from models import DebateSession, DebateParticipant, DebateMessage, DebateEvaluation, CloudApiKey
+from models import DebateSession, DebateParticipant, DebateMessage, DebateEvaluation
 from logging_config import get_logger
 from services.model_detector import ModelDetector
-from google import genai
+from services.cloud_providers import get_completion_provider
+from services.response_cache import ResponseCache
+from services.api_key_store import ApiKeyStore
 
 logger = get_logger(__name__)
 
@@ -16,10 +16,22 @@ logger = get_logger(__name__)
 class DebateEvaluator:
     """Service for AI-powered debate evaluation"""
 
-    def __init__(self, db: Session):
+    SYSTEM_PROMPT = "あなたは一流のディベート審査員です。日本語で評価を行い、指示されたフォーマットのJSONのみを返してください。"
+
+    # Providers tried in order when no evaluation model is specified
+    DEFAULT_EVALUATOR_MODELS = [
+        ("gpt", "gpt-4"),
+        ("claude", "claude-3-opus-20240229"),
+        ("gemini", "gemini-2.5-pro"),
+    ]
+
+    def __init__(self, db: Session, use_cache: bool = False, force_cache: bool = False):
         self.db = db
         # Name of the model actually used for the latest evaluation
         self.evaluator_model = "gpt-4"
+        # Reuse cached evaluations of an identical transcript
+        self.use_cache = use_cache
+        self.force_cache = force_cache
 
     async def evaluate_debate(self, debate_id: int, model_name: Optional[str] = None) -> None:
         """
@@ -27,6 +39,7 @@ class DebateEvaluator:
 
         Args:
             debate_id: ID of the debate to evaluate
+            model_name: Optional evaluation model name
 
         Raises:
             Exception: If evaluation fails
@@ -163,6 +176,7 @@ class DebateEvaluator:
         - ローカルモデルの場合: Ollama 経由で評価プロンプトを投げる
 
         model_name が未指定の場合は、従来どおり GPT -> Claude -> Gemini の順で自動選択する。
+        いずれのプロバイダーも共通の CompletionProvider 経由で呼び出す。
         """
 
         detector = ModelDetector()
@@ -170,213 +184,77 @@ class DebateEvaluator:
         # If user specified an evaluation model, try to honor it
         if model_name:
             is_cloud, provider = detector.is_cloud_model(model_name)
+            api_key = None
             if is_cloud and provider is not None:
-                api_key = self.db.query(CloudApiKey).filter(
-                    CloudApiKey.user_id == user_id,
-                    CloudApiKey.provider == provider
-                ).first()
+                api_key = ApiKeyStore(self.db).get(user_id, provider)
 
                 if not api_key:
                     raise Exception(f"選択された評価モデル({model_name})用のAPIキーが登録されていません。モデル管理ページでAPIキーを登録してください。")
 
-                try:
-                    if provider == "gpt":
-                        return await self._call_gpt(prompt, api_key.api_key, model_name)
-                    if provider == "claude":
-                        return await self._call_claude(prompt, api_key.api_key, model_name)
-                    if provider == "gemini":
-                        return await self._call_gemini(prompt, api_key.api_key, model_name)
-                except Exception as e:
-                    logger.error(f"Evaluation with specified model {model_name} failed: {e}")
-                    raise
-
             # ローカルモデルの場合は Ollama を利用
-            if not is_cloud:
-                try:
-                    return await self._call_local_ollama(prompt, model_name)
-                except Exception as e:
-                    logger.error(f"Local evaluation with model {model_name} failed: {e}")
-                    raise
-
-        # Automatic provider selection (backward compatible)
-
-        # Try GPT first
-        api_key = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == user_id,
-            CloudApiKey.provider == "gpt"
-        ).first()
-
-        if api_key:
             try:
-                return await self._call_gpt(prompt, api_key.api_key, "gpt-4")
+                return await self._call_model(prompt, model_name, api_key, user_id)
             except Exception as e:
-                logger.warning(f"GPT evaluation failed: {e}, trying Claude...")
+                logger.error(f"Evaluation with specified model {model_name} failed: {e}")
+                raise
 
-        # Fallback to Claude
-        api_key = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == user_id,
-            CloudApiKey.provider == "claude"
-        ).first()
+        # Automatic provider selection (backward compatible)
+        last_error: Optional[Exception] = None
+        for provider, default_model in self.DEFAULT_EVALUATOR_MODELS:
+            api_key = ApiKeyStore(self.db).get(user_id, provider)
+            if not api_key:
+                continue
 
-        if api_key:
             try:
-                return await self._call_claude(prompt, api_key.api_key, "claude-3-opus-20240229")
+                return await self._call_model(prompt, default_model, api_key, user_id)
             except Exception as e:
-                logger.warning(f"Claude evaluation failed: {e}, trying Gemini...")
-
-        # Fallback to Gemini
-        api_key = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == user_id,
-            CloudApiKey.provider == "gemini"
-        ).first()
+                last_error = e
+                logger.warning(f"{provider} evaluation failed: {e}, trying next provider...")
 
-        if api_key:
-            try:
-                # Use a recent default Gemini model
-                return await self._call_gemini(prompt, api_key.api_key, "gemini-2.5-pro")
-            except Exception as e:
-                logger.error(f"All evaluation providers failed. Last error: {e}")
+        if last_error is not None:
+            logger.error(f"All evaluation providers failed. Last error: {last_error}")
 
         raise Exception("有効な評価用APIキーが見つかりませんでした。GPT / Claude / Gemini のAPIキーを設定してください。")
 
-    async def _call_gpt(self, prompt: str, api_key: str, model_name: str = "gpt-4") -> Dict[str, Any]:
-        """Call OpenAI GPT-4 API for evaluation"""
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model_name,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "あなたは一流のディベート審査員です。日本語で評価を行い、指示されたフォーマットのJSONのみを返してください。"
-                        },
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.3,
-                    "response_format": {"type": "json_object"}
-                }
+    async def _call_model(
+        self, prompt: str, model_name: str, api_key: Optional[str], user_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Run the evaluation prompt on any provider and parse the JSON result"""
+        provider = get_completion_provider(model_name, user_id)
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        options = {"temperature": 0.3, "json_mode": True}
+        if self.use_cache:
+            result = await ResponseCache(self.db).complete(
+                provider, model_name, messages, api_key, options, force=self.force_cache
             )
-            response.raise_for_status()
-            data = response.json()
-            content = data['choices'][0]['message']['content']
-            self.evaluator_model = model_name
-            return json.loads(content)
-
-    async def _call_claude(self, prompt: str, api_key: str, model_name: str = "claude-3-opus-20240229") -> Dict[str, Any]:
-        """Call Anthropic Claude API for evaluation"""
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers={
-                    "x-api-key": api_key,
-                    "anthropic-version": "2023-06-01",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model_name,
-                    "max_tokens": 4096,
-                    "temperature": 0.3,
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ]
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-            content = data['content'][0]['text']
-            self.evaluator_model = model_name
-
-            # Extract JSON from response (Claude might add text around it)
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                return json.loads(content[json_start:json_end])
-            return json.loads(content)
-
-    async def _call_gemini(self, prompt: str, api_key: str, model_name: str = "gemini-2.5-pro") -> Dict[str, Any]:
-        """Call Google Gemini API for evaluation using the official SDK."""
-
-        client = genai.Client(api_key=api_key)
-
-        # Use simple single-turn prompt; the prompt already instructs JSON-only output
-        response = await client.aio.models.generate_content(
-            model=model_name,
-            contents=[prompt],
-        )
-
-        # In the new SDK, full text is available via .text
-        content = response.text or ""
-        self.evaluator_model = model_name
+        else:
+            result = await provider.complete(model_name, messages, api_key, options)
 
-        # Gemini が前後に説明テキストを付けたり、JSONだけでない返答をするケースに備えて
-        # Claude と同様に、最初の { から最後の } までを JSON とみなしてパースを試みる。
-        content_stripped = content.strip()
+        content_stripped = result.content.strip()
         if not content_stripped:
-            raise Exception("Gemini から空のレスポンスが返されました。プロンプトやモデル設定を確認してください。")
-
-        json_start = content_stripped.find('{')
-        json_end = content_stripped.rfind('}') + 1
-        if json_start >= 0 and json_end > json_start:
-            try:
-                return json.loads(content_stripped[json_start:json_end])
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse Gemini JSON slice: {e}, raw: {content_stripped[:500]}")
-
-        # スライスで取れなかった場合は、そのまま JSON として解釈を試みる
-        try:
-            return json.loads(content_stripped)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Gemini response as JSON: {e}, raw: {content_stripped[:500]}")
-            raise
-
-    async def _call_local_ollama(self, prompt: str, model_name: str) -> Dict[str, Any]:
-        """Call local Ollama model for evaluation.
-
-        プロンプトで JSON 形式のみを返すよう指示しているため、
-        返ってきたテキストを JSON としてパースする。
-        """
-
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/chat",
-                json={
-                    "model": model_name,
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ],
-                    "stream": False,
-                },
-            )
-
-        if response.status_code != 200:
-            raise Exception(f"Ollama 評価リクエストが失敗しました: {response.text}")
-
-        data = response.json()
-        content = data.get("message", {}).get("content", "")
-        if not content:
-            raise Exception("ローカル評価モデルから空のレスポンスが返されました。")
+            raise Exception(f"評価モデル({model_name})から空のレスポンスが返されました。プロンプトやモデル設定を確認してください。")
 
         self.evaluator_model = model_name
 
-        content_stripped = content.strip()
+        # モデルが前後に説明テキストを付けるケースに備えて、
+        # 最初の { から最後の } までを JSON とみなしてパースを試みる。
         json_start = content_stripped.find('{')
         json_end = content_stripped.rfind('}') + 1
         if json_start >= 0 and json_end > json_start:
             try:
                 return json.loads(content_stripped[json_start:json_end])
             except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse local Ollama JSON slice: {e}, raw: {content_stripped[:500]}")
+                logger.error(f"Failed to parse {model_name} JSON slice: {e}, raw: {content_stripped[:500]}")
 
+        # スライスで取れなかった場合は、そのまま JSON として解釈を試みる
         try:
             return json.loads(content_stripped)
         except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse local Ollama response as JSON: {e}, raw: {content_stripped[:500]}")
-            raise Exception("ローカル評価モデルの出力が有効なJSONではありません。モデルやプロンプトを確認してください。")
+            logger.error(f"Failed to parse {model_name} response as JSON: {e}, raw: {content_stripped[:500]}")
+            raise Exception(f"評価モデル({model_name})の出力が有効なJSONではありません。モデルやプロンプトを確認してください。")
 
     def _save_evaluations(self, debate_id: int, evaluation_result: Dict[str, Any]) -> None:
         """Save evaluation results to database"""
@@ -1,13 +1,14 @@
 """Debate service for handling turn-based AI debates"""
-import json
 import time
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict
 from sqlalchemy.orm import Session
 from datetime import datetime
 
 from models import DebateSession, DebateParticipant, DebateMessage
 from schemas import DebateTurnRequest, ChatRequest
 from services.chat_service import ChatService
+from services.usage_stats import UsageStats
+from services.chat_events import TokenEvent, UsageEvent, DoneEvent, ErrorEvent
 from logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -20,7 +21,7 @@ class DebateService:
         self.db = db
         self.chat_service = ChatService(db)
 
-    async def process_turn(self, request: DebateTurnRequest) -> AsyncGenerator[str, None]:
+    async def process_turn(self, request: DebateTurnRequest) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Process a single debate turn with streaming response
 
@@ -28,7 +29,7 @@ class DebateService:
             request: Debate turn request
 
         Yields:
-            Server-sent events for streaming debate response
+            Event payloads for the streaming debate response (encoded as SSE by the router)
         """
         # Get debate and participant info
         debate = self.db.query(DebateSession).filter(
@@ -40,7 +41,7 @@ class DebateService:
         ).first()
 
         if not debate or not participant:
-            yield f"data: {json.dumps({'error': 'Debate or participant not found'})}\n\n"
+            yield {'error': 'Debate or participant not found'}
             return
 
         # Build context: Get all previous debate messages
@@ -77,64 +78,58 @@ class DebateService:
 
         # Stream response from ChatService
         try:
-            async for event in self.chat_service.process_message(chat_request):
-                # Parse SSE data
-                if event.startswith("data: "):
-                    data_str = event[6:].strip()
-                    try:
-                        data = json.loads(data_str)
-
-                        # Forward content chunks to client
-                        if 'content' in data:
-                            full_response += data['content']
-                            yield f"data: {json.dumps({'content': data['content']})}\n\n"
-
-                        # Capture token counts
-                        if 'prompt_tokens' in data:
-                            prompt_tokens = data['prompt_tokens']
-                        if 'completion_tokens' in data:
-                            completion_tokens = data['completion_tokens']
-
-                        # Handle completion
-                        if data.get('done'):
-                            response_time = time.time() - start_time
-
-                            # Save debate message to database
-                            message = DebateMessage(
-                                debate_session_id=request.debate_session_id,
-                                participant_id=request.participant_id,
-                                content=full_response,
-                                round_number=request.round_number,
-                                turn_number=request.turn_number,
-                                message_type='argument',
-                                prompt_tokens=prompt_tokens,
-                                completion_tokens=completion_tokens,
-                                response_time=response_time
-                            )
-                            self.db.add(message)
-                            self.db.commit()
-                            self.db.refresh(message)
-
-                            # Send final done event with message ID
-                            final_event = {
-                                'done': True,
-                                'message_id': message.id,
-                                'response_time': response_time,
-                                'prompt_tokens': prompt_tokens,
-                                'completion_tokens': completion_tokens
-                            }
-                            yield f"data: {json.dumps(final_event)}\n\n"
-
-                        # Forward errors
-                        if 'error' in data:
-                            yield event
-
-                    except json.JSONDecodeError:
-                        continue
+            async for event in self.chat_service.stream_events(chat_request):
+                # Forward content chunks to client
+                if isinstance(event, TokenEvent):
+                    full_response += event.content
+                    yield {'content': event.content}
+
+                # Capture token counts
+                elif isinstance(event, UsageEvent):
+                    prompt_tokens = event.prompt_tokens
+                    completion_tokens = event.completion_tokens
+
+                # Handle completion
+                elif isinstance(event, DoneEvent):
+                    if event.content is not None:
+                        # Non-streaming providers deliver the whole response at once
+                        full_response += event.content
+                        yield {'content': event.content}
+                    response_time = time.time() - start_time
+
+                    # Save debate message to database
+                    message = DebateMessage(
+                        debate_session_id=request.debate_session_id,
+                        participant_id=request.participant_id,
+                        content=full_response,
+                        round_number=request.round_number,
+                        turn_number=request.turn_number,
+                        message_type='argument',
+                        prompt_tokens=prompt_tokens,
+                        completion_tokens=completion_tokens,
+                        response_time=response_time
+                    )
+                    self.db.add(message)
+                    UsageStats(self.db).record_debate_message(message)
+                    self.db.commit()
+                    self.db.refresh(message)
+
+                    # Send final done event with message ID
+                    yield {
+                        'done': True,
+                        'message_id': message.id,
+                        'response_time': response_time,
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': completion_tokens
+                    }
+
+                # Forward errors
+                elif isinstance(event, ErrorEvent):
+                    yield {'error': event.message}
 
         except Exception as e:
             logger.error(f"Error in debate turn: {e}", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield {'error': str(e)}
 
     def _build_debate_prompt(
         self,
@@ -0,0 +1,327 @@
+"""Per-session document index for retrieval-augmented chat"""
+from dataclasses import dataclass
+from typing import Optional, List, Tuple
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from config import UPLOAD_DIR, RAG_CHUNK_SIZE, RAG_CHUNK_OVERLAP, RAG_TOP_K, RAG_MAX_CONTEXT_CHARS
+from models import Document, DocumentChunk
+from file_converter import extract_text
+from .embedding_service import EmbeddingService
+from .job_queue import JobQueue
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DOCUMENT_INDEX_JOB = "document_index"
+
+STATUS_PENDING = "pending"
+STATUS_INDEXING = "indexing"
+STATUS_READY = "ready"
+STATUS_EMPTY = "empty"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class RetrievedChunk:
+    """A document chunk selected for the prompt"""
+    document_id: int
+    filename: str
+    page: Optional[int]
+    content: str
+    score: float
+
+
+def chunk_pages(
+    pages: List[str],
+    chunk_size: int = RAG_CHUNK_SIZE,
+    overlap: int = RAG_CHUNK_OVERLAP
+) -> List[Tuple[int, str]]:
+    """
+    Split page texts into overlapping chunks on paragraph boundaries
+
+    Paragraphs that do not fit next to the overlap are split by character count.
+
+    Args:
+        pages: Text of each page
+        chunk_size: Target characters per chunk
+        overlap: Characters carried over from the end of the previous chunk
+
+    Returns:
+        List of (1-based page number where the chunk starts, chunk text)
+    """
+    # Pieces leave room for the overlap so chunks stay within chunk_size
+    piece_size = max(chunk_size - overlap - 1, 1)
+    pieces: List[Tuple[int, str]] = []
+    for page_number, page_text in enumerate(pages, start=1):
+        for paragraph in page_text.split("\n\n"):
+            paragraph = " ".join(paragraph.split())
+            for start in range(0, len(paragraph), piece_size):
+                pieces.append((page_number, paragraph[start:start + piece_size]))
+
+    chunks: List[Tuple[int, str]] = []
+    current_page: Optional[int] = None
+    current = ""
+    for page_number, piece in pieces:
+        if current and len(current) + len(piece) + 1 > chunk_size:
+            chunks.append((current_page, current))
+            tail = current[-overlap:] if overlap > 0 else ""
+            current_page = page_number
+            current = f"{tail} {piece}".strip() if tail else piece
+        else:
+            if not current:
+                current_page = page_number
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append((current_page, current))
+    return chunks
+
+
+class DocumentIndex:
+    """Extracts, chunks and embeds uploaded documents and retrieves relevant chunks
+
+    Instead of attaching every page image to the conversation, each turn only
+    carries the few chunks most similar to the question.
+    """
+
+    def __init__(self, db: Session, embedder: Optional[EmbeddingService] = None):
+        self.db = db
+        self.embedder = embedder or EmbeddingService()
+
+    def register_upload(
+        self,
+        file_id: str,
+        filename: str,
+        user_id: int,
+        session_id: Optional[str] = None
+    ) -> Tuple[Document, Optional[int]]:
+        """
+        Record an uploaded file and queue it for indexing
+
+        Args:
+            file_id: Upload id
+            filename: Original file name
+            user_id: Owner of the upload
+            session_id: Chat session to attach the document to
+
+        Returns:
+            Tuple of (Document, queued job id)
+        """
+        document = Document(
+            file_id=file_id,
+            user_id=user_id,
+            session_id=session_id,
+            filename=filename,
+            status=STATUS_PENDING
+        )
+        self.db.add(document)
+        self.db.commit()
+        self.db.refresh(document)
+
+        job = JobQueue(self.db).enqueue(
+            DOCUMENT_INDEX_JOB,
+            payload={"document_id": document.id},
+            user_id=user_id,
+            dedupe_key=f"document:{document.id}"
+        )
+        return document, job.id
+
+    async def index_document(self, document_id: int) -> None:
+        """
+        Extract, chunk and embed a document, replacing any previous chunks
+
+        Args:
+            document_id: Document ID
+        """
+        document = self.db.query(Document).filter(Document.id == document_id).first()
+        if not document:
+            logger.warning(f"Document {document_id} not found, skipping indexing")
+            return
+
+        document.status = STATUS_INDEXING
+        document.error = None
+        self.db.commit()
+
+        matches = list(UPLOAD_DIR.glob(f"{document.file_id}.*"))
+        if not matches:
+            raise FileNotFoundError(f"Uploaded file for document {document_id} not found")
+
+        pages = await extract_text(matches[0])
+        chunks = chunk_pages(pages)
+
+        self.db.query(DocumentChunk).filter(DocumentChunk.document_id == document.id).delete(synchronize_session=False)
+
+        if not chunks:
+            document.status = STATUS_EMPTY
+            document.chunk_count = 0
+            self.db.commit()
+            logger.info(f"Document {document_id} ({document.filename}) has no extractable text")
+            return
+
+        vectors = await self.embedder.embed([text for _, text in chunks])
+        for chunk_index, ((page, text), vector) in enumerate(zip(chunks, vectors)):
+            self.db.add(DocumentChunk(
+                document_id=document.id,
+                chunk_index=chunk_index,
+                page=page,
+                content=text,
+                model=self.embedder.model,
+                dim=int(vector.shape[0]),
+                vector=EmbeddingService.to_bytes(vector)
+            ))
+
+        document.status = STATUS_READY
+        document.chunk_count = len(chunks)
+        self.db.commit()
+        logger.info(f"Indexed document {document_id} ({document.filename}) into {len(chunks)} chunks")
+
+    def mark_failed(self, document_id: int, error: str) -> None:
+        """Mark a document as failed once indexing retries are exhausted"""
+        document = self.db.query(Document).filter(Document.id == document_id).first()
+        if document:
+            document.status = STATUS_FAILED
+            document.error = error
+            self.db.commit()
+
+    def session_documents(
+        self,
+        user_id: int,
+        session_id: Optional[str],
+        document_ids: Optional[List[int]] = None
+    ) -> List[Document]:
+        """
+        Documents available to a chat turn
+
+        Requested documents that are not attached to a session yet are bound
+        to ``session_id`` so later turns retrieve from them without resending ids.
+
+        Args:
+            user_id: User ID
+            session_id: Chat session ID
+            document_ids: Documents explicitly attached to this turn
+
+        Returns:
+            The user's documents for the session
+        """
+        conditions = []
+        if session_id:
+            conditions.append(Document.session_id == session_id)
+        if document_ids:
+            conditions.append(Document.id.in_(document_ids))
+        if not conditions:
+            return []
+
+        documents = self.db.query(Document).filter(
+            Document.user_id == user_id,
+            or_(*conditions)
+        ).all()
+
+        if session_id:
+            unbound = [doc for doc in documents if doc.session_id is None]
+            for doc in unbound:
+                doc.session_id = session_id
+            if unbound:
+                self.db.commit()
+        return documents
+
+    @staticmethod
+    def is_searchable(documents: List[Document], document_ids: List[int]) -> bool:
+        """
+        Whether retrieval can stand in for the page images of the given documents
+
+        Image files and scanned PDFs have no text (``empty``) and documents
+        still being indexed have no chunks yet; their images must be sent.
+
+        Args:
+            documents: Documents returned by ``session_documents``
+            document_ids: Documents attached to the turn
+
+        Returns:
+            True if every attached document is ready with at least one chunk
+        """
+        by_id = {doc.id: doc for doc in documents}
+        return bool(document_ids) and all(
+            doc_id in by_id and by_id[doc_id].status == STATUS_READY and (by_id[doc_id].chunk_count or 0) > 0
+            for doc_id in document_ids
+        )
+
+    async def retrieve(
+        self,
+        documents: List[Document],
+        query: str,
+        top_k: int = RAG_TOP_K
+    ) -> List[RetrievedChunk]:
+        """
+        Find the chunks most similar to a query
+
+        Args:
+            documents: Documents to search (only ready ones are used)
+            query: User message
+            top_k: Number of chunks to return
+
+        Returns:
+            Chunks ordered by descending cosine similarity
+        """
+        ready = {doc.id: doc for doc in documents if doc.status == STATUS_READY}
+        if not ready or not query.strip():
+            return []
+
+        rows = self.db.query(DocumentChunk).filter(
+            DocumentChunk.document_id.in_(list(ready)),
+            DocumentChunk.model == self.embedder.model
+        ).all()
+        if not rows:
+            return []
+
+        query_vector = await self.embedder.embed_one(query)
+        rows = [row for row in rows if row.dim == query_vector.shape[0]]
+        if not rows:
+            logger.warning(f"No document chunks match query embedding dimension {query_vector.shape[0]}")
+            return []
+
+        matrix = np.vstack([EmbeddingService.from_bytes(row.vector, row.dim) for row in rows])
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        scores = (matrix @ query_vector) / np.where(norms == 0, 1.0, norms)
+
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            RetrievedChunk(
+                document_id=rows[i].document_id,
+                filename=ready[rows[i].document_id].filename,
+                page=rows[i].page,
+                content=rows[i].content,
+                score=float(scores[i])
+            )
+            for i in top
+        ]
+
+    @staticmethod
+    def build_context(chunks: List[RetrievedChunk], max_chars: int = RAG_MAX_CONTEXT_CHARS) -> Optional[str]:
+        """
+        Format retrieved chunks as a prompt prefix
+
+        Args:
+            chunks: Retrieved chunks, most relevant first
+            max_chars: Upper bound on included chunk text
+
+        Returns:
+            Context block, or None if nothing was retrieved
+        """
+        sections = []
+        used = 0
+        for chunk in chunks:
+            if used + len(chunk.content) > max_chars and sections:
+                break
+            source = f"{chunk.filename} p.{chunk.page}" if chunk.page else chunk.filename
+            sections.append(f"[{source}]\n{chunk.content[:max_chars]}")
+            used += len(chunk.content)
+        if not sections:
+            return None
+        return (
+            "以下はアップロードされた資料から質問に関連する部分を抜粋したものです。"
+            "回答の参考にしてください。\n\n" + "\n\n".join(sections)
+        )
@@ -0,0 +1,161 @@
+"""Embedding service backed by local Ollama embedding models"""
+import asyncio
+import time
+from typing import List, Optional, Dict, Tuple
+
+import numpy as np
+
+from config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CHARS,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_CACHE_ENABLED,
+)
+from utils.model_utils import detect_type
+from .cloud_providers import OllamaProvider, ProviderError
+from .ollama_pool import ollama_pool
+from .vector_cache import VectorCache, text_digest
+from metrics import track_upstream
+from tracing import start_span
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class EmbeddingService:
+    """Embeds texts through Ollama ``/api/embed`` in batches
+
+    Identical texts are embedded once per call, previously embedded texts are
+    served from the on-disk ``VectorCache``, and the remaining batches run
+    concurrently. A process-wide semaphore caps batches in flight so large
+    indexing jobs cannot flood Ollama.
+    """
+
+    max_concurrency = EMBEDDING_CONCURRENCY
+
+    # (semaphore, event loop) shared by all instances, like the provider HTTP clients
+    _semaphore: Optional[Tuple[asyncio.Semaphore, asyncio.AbstractEventLoop]] = None
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        use_cache: bool = EMBEDDING_CACHE_ENABLED
+    ):
+        if detect_type(model) != "embedding":
+            logger.warning(f"Model {model} does not look like an embedding model")
+        self.model = model
+        self.batch_size = batch_size
+        self.cache = VectorCache.for_model(model) if use_cache else None
+
+    @classmethod
+    def _get_semaphore(cls) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if cls._semaphore is None or cls._semaphore[1] is not loop:
+            cls._semaphore = (asyncio.Semaphore(cls.max_concurrency), loop)
+        return cls._semaphore[0]
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            float32 array of shape (len(texts), dim)
+
+        Raises:
+            ProviderError: If Ollama returns an error
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        truncated = [text[:EMBEDDING_MAX_CHARS] for text in texts]
+        digests = [text_digest(text) for text in truncated]
+
+        # Deduplicate by text hash, keeping first-seen order
+        unique: Dict[bytes, str] = {}
+        for digest, text in zip(digests, truncated):
+            unique.setdefault(digest, text)
+
+        vectors: Dict[bytes, np.ndarray] = self.cache.get_many(list(unique)) if self.cache else {}
+        missing = [digest for digest in unique if digest not in vectors]
+
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            results = await asyncio.gather(*(
+                self._embed_limited([unique[digest] for digest in batch]) for batch in batches
+            ))
+            fresh = [
+                (digest, vector)
+                for batch, matrix in zip(batches, results)
+                for digest, vector in zip(batch, matrix)
+            ]
+            vectors.update(fresh)
+            if self.cache is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.cache.put_many, fresh)
+
+        logger.debug(
+            f"Embedded {len(texts)} texts ({len(unique)} unique, {len(unique) - len(missing)} cached) with {self.model}"
+        )
+        return np.vstack([vectors[digest] for digest in digests])
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        """Embed a single text and return a 1-D float32 vector"""
+        return (await self.embed([text]))[0]
+
+    async def _embed_limited(self, batch: List[str]) -> np.ndarray:
+        async with self._get_semaphore():
+            return await self._embed_batch(batch)
+
+    async def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        last_error: Optional[BaseException] = None
+        for backend in ollama_pool.route(self.model):
+            with ollama_pool.track(backend):
+                try:
+                    return await self._embed_batch_at(backend.url, batch)
+                except Exception as e:
+                    if not ollama_pool.should_fail_over(backend, self.model, e):
+                        raise
+                    logger.warning(f"Embedding with {self.model} failed on {backend.url}, trying the next backend: {e}")
+                    last_error = e
+        if isinstance(last_error, ProviderError):
+            raise last_error
+        raise ProviderError(f"利用可能なOllamaサーバーがありません（モデル: {self.model}）: {last_error}", 503)
+
+    async def _embed_batch_at(self, base_url: str, batch: List[str]) -> np.ndarray:
+        client = OllamaProvider.get_http_client()
+
+        start_time = time.monotonic()
+        with start_span("ollama.embed", {"model": self.model, "texts": len(batch)}), track_upstream("ollama", "embed"):
+            response = await client.post(
+                f"{base_url}/api/embed",
+                json={"model": self.model, "input": batch, "truncate": True}
+            )
+            if response.status_code != 200:
+                raise ProviderError(
+                    f"Ollama embedding error: {OllamaProvider._extract_error_message(response)}",
+                    response.status_code
+                )
+
+            embeddings = response.json().get("embeddings") or []
+            if len(embeddings) != len(batch):
+                raise ProviderError(f"Ollama returned {len(embeddings)} embeddings for {len(batch)} inputs")
+
+        logger.debug(f"Embedded {len(batch)} texts with {self.model} in {time.monotonic() - start_time:.2f}s")
+        return np.asarray(embeddings, dtype=np.float32)
+
+    @staticmethod
+    def to_bytes(vector: np.ndarray) -> bytes:
+        """Serialize a vector for storage"""
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    @staticmethod
+    def from_bytes(data: bytes, dim: Optional[int] = None) -> np.ndarray:
+        """Deserialize a stored vector"""
+        vector = np.frombuffer(data, dtype=np.float32)
+        if dim is not None and vector.shape[0] != dim:
+            raise ValueError(f"Stored vector has {vector.shape[0]} dimensions, expected {dim}")
+        return vector
@@ -0,0 +1,229 @@
+"""Per-generation latency measurement and percentile aggregates"""
+import time
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Optional, List, Dict, Any, Union, TYPE_CHECKING
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import ChatMessage
+
+if TYPE_CHECKING:
+    # Imported for annotations only: the providers import this module
+    from .cloud_providers.base import CompletionChunk, CompletionResult
+
+# Metrics served as percentiles by ``LatencyStats``
+LATENCY_METRICS = ("ttft_ms", "total_duration_ms", "tokens_per_second", "prompt_eval_duration_ms", "queue_ms")
+LATENCY_PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+@dataclass
+class GenerationMetrics:
+    """Latency of one generation; all durations in milliseconds"""
+    ttft_ms: Optional[float] = None
+    total_duration_ms: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+    load_duration_ms: Optional[float] = None
+    prompt_eval_duration_ms: Optional[float] = None
+    eval_duration_ms: Optional[float] = None
+    queue_ms: Optional[float] = None  # Included in ttft_ms and total_duration_ms
+
+    def as_dict(self) -> Dict[str, float]:
+        """Known values rounded for responses and storage"""
+        return {key: round(value, 2) for key, value in asdict(self).items() if value is not None}
+
+
+class GenerationTimer:
+    """Measures a single generation from request to final chunk
+
+    Create it right before the provider request, ``observe`` every streamed
+    chunk (or ``observe_result`` for a non-streaming completion) and call
+    ``finish`` with the completion token count. Cache replays are flagged so
+    their near-zero latency does not skew model statistics.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.cached = False
+        self.load_duration_ms: Optional[float] = None
+        self.prompt_eval_duration_ms: Optional[float] = None
+        self.eval_duration_ms: Optional[float] = None
+        self.queue_ms: Optional[float] = None
+
+    def _copy_server_timings(self, source: Union["CompletionChunk", "CompletionResult"]) -> None:
+        for field in ("load_duration_ms", "prompt_eval_duration_ms", "eval_duration_ms", "queue_ms"):
+            value = getattr(source, field, None)
+            if value is not None:
+                setattr(self, field, value)
+
+    def observe(self, chunk: "CompletionChunk") -> None:
+        """Record a streamed chunk"""
+        if chunk.content and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if chunk.cached:
+            self.cached = True
+        self._copy_server_timings(chunk)
+
+    def observe_result(self, result: "CompletionResult") -> None:
+        """Record a non-streaming completion (the first token arrives with the whole response)"""
+        self.first_token_at = time.perf_counter()
+        if result.finish_reason == "cached":
+            self.cached = True
+        self._copy_server_timings(result)
+
+    def finish(self, completion_tokens: Optional[int] = None) -> Optional[GenerationMetrics]:
+        """
+        Compute the metrics of the finished generation
+
+        Args:
+            completion_tokens: Generated token count, if the provider reported it
+
+        Returns:
+            GenerationMetrics, or None for cache replays
+        """
+        if self.cached:
+            return None
+
+        total_ms = (time.perf_counter() - self.started_at) * 1000
+        ttft_ms = (self.first_token_at - self.started_at) * 1000 if self.first_token_at is not None else None
+
+        # Prefer the server's decode time; otherwise time after the first token
+        # (streams) or the whole request (single responses)
+        tokens_per_second = None
+        if completion_tokens:
+            if self.eval_duration_ms:
+                decode_ms = self.eval_duration_ms
+            elif ttft_ms is not None and total_ms - ttft_ms > 1:
+                decode_ms = total_ms - ttft_ms
+            else:
+                # Time spent queued before the request was sent is not decoding
+                decode_ms = total_ms - (self.queue_ms or 0)
+            if decode_ms > 0:
+                tokens_per_second = completion_tokens / (decode_ms / 1000)
+
+        return GenerationMetrics(
+            ttft_ms=ttft_ms,
+            total_duration_ms=total_ms,
+            tokens_per_second=tokens_per_second,
+            load_duration_ms=self.load_duration_ms,
+            prompt_eval_duration_ms=self.prompt_eval_duration_ms,
+            eval_duration_ms=self.eval_duration_ms,
+            queue_ms=self.queue_ms
+        )
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Linear interpolation between closest ranks (same as PostgreSQL percentile_cont)"""
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class LatencyStats:
+    """Latency percentiles per model over a user's assistant messages
+
+    PostgreSQL computes the percentiles with ``percentile_cont``; other
+    databases load the measured values and interpolate in Python.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.is_postgres = db.get_bind().dialect.name == "postgresql"
+
+    def _filtered(self, query, user_id: int, model: Optional[str], start_date: Optional[date], end_date: Optional[date]):
+        query = query.filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.role == "assistant",
+            ChatMessage.total_duration_ms.isnot(None)
+        )
+        if model:
+            query = query.filter(ChatMessage.model == model)
+        if start_date:
+            query = query.filter(ChatMessage.created_at >= datetime.combine(start_date, dt_time.min))
+        if end_date:
+            query = query.filter(ChatMessage.created_at < datetime.combine(end_date + timedelta(days=1), dt_time.min))
+        return query
+
+    def query(
+        self,
+        user_id: int,
+        model: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Latency percentiles per model
+
+        Args:
+            user_id: User ID
+            model: Only this model
+            start_date: First UTC day included
+            end_date: Last UTC day included
+
+        Returns:
+            One dict per model: ``count`` plus ``{metric: {"p50", "p90", "p95", "p99"}}``
+            for ttft_ms, total_duration_ms, tokens_per_second, prompt_eval_duration_ms
+            (Ollama prefill time; None for cloud models) and queue_ms (rate limit wait;
+            None for Ollama models)
+        """
+        if self.is_postgres:
+            return self._query_postgres(user_id, model, start_date, end_date)
+
+        rows = self._filtered(
+            self.db.query(ChatMessage.model, *[getattr(ChatMessage, metric) for metric in LATENCY_METRICS]),
+            user_id, model, start_date, end_date
+        ).all()
+
+        values_by_model: Dict[str, Dict[str, List[float]]] = {}
+        for row in rows:
+            values = values_by_model.setdefault(row.model, {metric: [] for metric in LATENCY_METRICS})
+            for metric in LATENCY_METRICS:
+                value = getattr(row, metric)
+                if value is not None:
+                    values[metric].append(value)
+
+        stats = []
+        for model_name, values in sorted(values_by_model.items()):
+            entry: Dict[str, Any] = {"model": model_name, "count": len(values["total_duration_ms"])}
+            for metric in LATENCY_METRICS:
+                ordered = sorted(values[metric])
+                entry[metric] = {
+                    f"p{int(fraction * 100)}": round(_percentile(ordered, fraction), 2) if ordered else None
+                    for fraction in LATENCY_PERCENTILES
+                }
+            stats.append(entry)
+        return stats
+
+    def _query_postgres(
+        self,
+        user_id: int,
+        model: Optional[str],
+        start_date: Optional[date],
+        end_date: Optional[date]
+    ) -> List[Dict[str, Any]]:
+        columns = [ChatMessage.model, func.count(ChatMessage.id).label("count")]
+        for metric in LATENCY_METRICS:
+            for fraction in LATENCY_PERCENTILES:
+                columns.append(
+                    func.percentile_cont(fraction).within_group(getattr(ChatMessage, metric))
+                    .label(f"{metric}_p{int(fraction * 100)}")
+                )
+
+        rows = self._filtered(
+            self.db.query(*columns), user_id, model, start_date, end_date
+        ).group_by(ChatMessage.model).order_by(ChatMessage.model).all()
+
+        stats = []
+        for row in rows:
+            entry: Dict[str, Any] = {"model": row.model, "count": row.count}
+            for metric in LATENCY_METRICS:
+                entry[metric] = {}
+                for fraction in LATENCY_PERCENTILES:
+                    key = f"p{int(fraction * 100)}"
+                    value = getattr(row, f"{metric}_{key}")
+                    entry[metric][key] = round(float(value), 2) if value is not None else None
+            stats.append(entry)
+        return stats
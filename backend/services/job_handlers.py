@@ -0,0 +1,58 @@
+"""Handlers for background job types"""
+from typing import Dict, Any
+from sqlalchemy.orm import Session
+
+from .job_worker import register_job_handler
+from .note_generator import NoteGenerator
+from .semantic_search import SemanticSearch, EMBEDDING_INDEX_JOB
+from .document_index import DocumentIndex, DOCUMENT_INDEX_JOB
+from .usage_stats import UsageStats, USAGE_STATS_REBUILD_JOB
+
+NOTE_GENERATION_JOB = "note_generation"
+
+
+async def run_note_generation(db: Session, payload: Dict[str, Any]) -> None:
+    """Generate note content for a queued note"""
+    generator = NoteGenerator(db)
+    await generator.generate_content(
+        payload["user_id"],
+        payload["session_id"],
+        payload["model"],
+        payload["prompt"],
+        payload["note_id"],
+        use_cache=payload.get("use_cache", False),
+        force_cache=payload.get("force_cache", False)
+    )
+
+
+def fail_note_generation(db: Session, payload: Dict[str, Any], error: str) -> None:
+    """Mark the note as failed once all retries are exhausted"""
+    NoteGenerator(db).mark_failed(payload["note_id"], error)
+
+
+async def run_embedding_index(db: Session, payload: Dict[str, Any]) -> None:
+    """Embed a user's messages and notes that are not indexed yet"""
+    await SemanticSearch(db).index_user(payload["user_id"])
+
+
+async def run_document_index(db: Session, payload: Dict[str, Any]) -> None:
+    """Extract, chunk and embed an uploaded document"""
+    await DocumentIndex(db).index_document(payload["document_id"])
+
+
+def fail_document_index(db: Session, payload: Dict[str, Any], error: str) -> None:
+    """Mark the document as failed once all retries are exhausted"""
+    DocumentIndex(db).mark_failed(payload["document_id"], error)
+
+
+async def run_usage_stats_rebuild(db: Session, payload: Dict[str, Any]) -> None:
+    """Recompute the per-model usage rollup from the source tables"""
+    UsageStats(db).rebuild(payload.get("user_id"))
+
+
+def register_default_handlers() -> None:
+    """Register all built-in job handlers with the worker pool"""
+    register_job_handler(NOTE_GENERATION_JOB, run_note_generation, fail_note_generation)
+    register_job_handler(EMBEDDING_INDEX_JOB, run_embedding_index)
+    register_job_handler(DOCUMENT_INDEX_JOB, run_document_index, fail_document_index)
+    register_job_handler(USAGE_STATS_REBUILD_JOB, run_usage_stats_rebuild)
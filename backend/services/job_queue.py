@@ -0,0 +1,241 @@
+"""Persistent background job queue backed by PostgreSQL"""
+import random
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
+from sqlalchemy import func
+from sqlalchemy.orm import Session, aliased
+
+from config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_PER_USER_CONCURRENCY,
+    JOB_LEASE_TIMEOUT,
+    JOB_RETRY_BASE_DELAY,
+)
+from models import BackgroundJob
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class JobQueue:
+    """Enqueues, claims and finalizes background jobs
+
+    Jobs are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` so any number of
+    workers (across processes) can poll the same table without double-processing.
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: Optional[Dict[str, Any]] = None,
+        user_id: Optional[int] = None,
+        dedupe_key: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        delay: float = 0.0
+    ) -> BackgroundJob:
+        """
+        Add a job to the queue
+
+        Args:
+            job_type: Registered handler name
+            payload: JSON-serializable handler arguments
+            user_id: Owner of the job (used for per-user concurrency caps)
+            dedupe_key: If set, an existing queued/running job with the same key is returned instead
+            max_attempts: Attempts before the job is marked as failed
+            delay: Seconds to wait before the job becomes claimable
+
+        Returns:
+            The queued (or already pending) BackgroundJob
+        """
+        if dedupe_key:
+            existing = self.db.query(BackgroundJob).filter(
+                BackgroundJob.dedupe_key == dedupe_key,
+                BackgroundJob.status.in_([self.STATUS_QUEUED, self.STATUS_RUNNING])
+            ).first()
+            if existing:
+                return existing
+
+        job = BackgroundJob(
+            job_type=job_type,
+            user_id=user_id,
+            payload=payload or {},
+            dedupe_key=dedupe_key,
+            status=self.STATUS_QUEUED,
+            attempts=0,
+            max_attempts=max_attempts,
+            run_after=datetime.utcnow() + timedelta(seconds=delay)
+        )
+        self.db.add(job)
+        self.db.commit()
+        self.db.refresh(job)
+        return job
+
+    def claim(self, worker_id: str, job_types: List[str]) -> Optional[BackgroundJob]:
+        """
+        Claim the next runnable job
+
+        Users that already have ``JOB_PER_USER_CONCURRENCY`` running jobs are
+        skipped. The cap is evaluated inside the claiming statement, so it is a
+        soft limit that may be exceeded briefly when several workers race.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+            job_types: Job types this worker can handle
+
+        Returns:
+            Claimed BackgroundJob (status running) or None if nothing is runnable
+        """
+        now = datetime.utcnow()
+        running = aliased(BackgroundJob)
+        running_for_user = self.db.query(func.count(running.id)).filter(
+            running.user_id == BackgroundJob.user_id,
+            running.status == self.STATUS_RUNNING
+        ).correlate(BackgroundJob).scalar_subquery()
+
+        job = self.db.query(BackgroundJob).filter(
+            BackgroundJob.status == self.STATUS_QUEUED,
+            BackgroundJob.job_type.in_(job_types),
+            BackgroundJob.run_after <= now,
+            (BackgroundJob.user_id.is_(None)) | (running_for_user < JOB_PER_USER_CONCURRENCY)
+        ).order_by(
+            BackgroundJob.run_after.asc(),
+            BackgroundJob.id.asc()
+        ).with_for_update(skip_locked=True).limit(1).first()
+
+        if not job:
+            # Release the (empty) transaction so the next poll sees fresh data
+            self.db.rollback()
+            return None
+
+        job.status = self.STATUS_RUNNING
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_at = now
+        self.db.commit()
+        self.db.refresh(job)
+        return job
+
+    def mark_succeeded(self, job: BackgroundJob) -> None:
+        """Mark a running job as finished successfully"""
+        job.status = self.STATUS_SUCCEEDED
+        job.locked_by = None
+        job.locked_at = None
+        job.last_error = None
+        job.finished_at = datetime.utcnow()
+        self.db.commit()
+
+    def mark_failed(self, job: BackgroundJob, error: str) -> bool:
+        """
+        Record a failed attempt and schedule a retry if attempts remain
+
+        Retries use exponential backoff with full jitter based on
+        ``JOB_RETRY_BASE_DELAY``.
+
+        Args:
+            job: The running job
+            error: Error description
+
+        Returns:
+            True if the job will be retried, False if it is now permanently failed
+        """
+        job.last_error = error[:2000]
+        job.locked_by = None
+        job.locked_at = None
+
+        if job.attempts < job.max_attempts:
+            backoff = JOB_RETRY_BASE_DELAY * (2 ** (job.attempts - 1))
+            job.status = self.STATUS_QUEUED
+            job.run_after = datetime.utcnow() + timedelta(seconds=random.uniform(backoff / 2, backoff))
+            self.db.commit()
+            return True
+
+        job.status = self.STATUS_FAILED
+        job.finished_at = datetime.utcnow()
+        self.db.commit()
+        return False
+
+    def release(self, job: BackgroundJob) -> None:
+        """Return an interrupted job to the queue without counting the attempt"""
+        job.status = self.STATUS_QUEUED
+        job.attempts = max(job.attempts - 1, 0)
+        job.locked_by = None
+        job.locked_at = None
+        job.run_after = datetime.utcnow()
+        self.db.commit()
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """
+        Renew the lease of a running job
+
+        Args:
+            job_id: ID of the running job
+            worker_id: Worker that claimed the job
+
+        Returns:
+            False if the job is no longer running under this worker (its lease was taken over)
+        """
+        count = self.db.query(BackgroundJob).filter(
+            BackgroundJob.id == job_id,
+            BackgroundJob.status == self.STATUS_RUNNING,
+            BackgroundJob.locked_by == worker_id
+        ).update({BackgroundJob.locked_at: datetime.utcnow()}, synchronize_session=False)
+        self.db.commit()
+        return count > 0
+
+    def requeue_stale(self) -> int:
+        """
+        Requeue running jobs whose heartbeat has expired (e.g. worker killed by a restart)
+
+        Workers renew ``locked_at`` every ``JOB_HEARTBEAT_INTERVAL`` seconds while
+        a job runs, so only jobs without a heartbeat for ``JOB_LEASE_TIMEOUT``
+        seconds are taken back, however long they have been running.
+
+        Returns:
+            Number of jobs requeued
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_LEASE_TIMEOUT)
+        count = self.db.query(BackgroundJob).filter(
+            BackgroundJob.status == self.STATUS_RUNNING,
+            BackgroundJob.locked_at < cutoff
+        ).update({
+            BackgroundJob.status: self.STATUS_QUEUED,
+            BackgroundJob.locked_by: None,
+            BackgroundJob.locked_at: None,
+            BackgroundJob.run_after: datetime.utcnow()
+        }, synchronize_session=False)
+        self.db.commit()
+        if count:
+            logger.warning(f"Requeued {count} stale background jobs")
+        return count
+
+    def get_job(self, job_id: int) -> Optional[BackgroundJob]:
+        """Get a job by ID"""
+        return self.db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+
+    def list_jobs(
+        self,
+        user_id: int,
+        status: Optional[str] = None,
+        limit: int = 50
+    ) -> List[BackgroundJob]:
+        """List the most recent jobs of a user"""
+        query = self.db.query(BackgroundJob).filter(BackgroundJob.user_id == user_id)
+        if status:
+            query = query.filter(BackgroundJob.status == status)
+        return query.order_by(BackgroundJob.created_at.desc()).limit(limit).all()
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Count jobs per status"""
+        rows = self.db.query(
+            BackgroundJob.status,
+            func.count(BackgroundJob.id)
+        ).group_by(BackgroundJob.status).all()
+        return {status: count for status, count in rows}
@@ -0,0 +1,158 @@
+"""Worker pool that executes jobs from the persistent job queue"""
+import asyncio
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, List, Any
+from sqlalchemy.orm import Session
+
+from config import JOB_WORKER_CONCURRENCY, JOB_POLL_INTERVAL, JOB_HEARTBEAT_INTERVAL
+from database import SessionLocal
+from .job_queue import JobQueue
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+JobHandler = Callable[[Session, Dict[str, Any]], Awaitable[None]]
+JobFailureHandler = Callable[[Session, Dict[str, Any], str], None]
+
+
+@dataclass
+class _RegisteredHandler:
+    run: JobHandler
+    on_failure: Optional[JobFailureHandler] = None
+
+
+_HANDLERS: Dict[str, _RegisteredHandler] = {}
+
+
+def register_job_handler(
+    job_type: str,
+    handler: JobHandler,
+    on_failure: Optional[JobFailureHandler] = None
+) -> None:
+    """
+    Register the coroutine that processes a job type
+
+    Args:
+        job_type: Job type name stored in ``BackgroundJob.job_type``
+        handler: ``async handler(db, payload)``; raising marks the attempt as failed
+        on_failure: Optional ``on_failure(db, payload, error)`` called once retries are exhausted
+    """
+    _HANDLERS[job_type] = _RegisteredHandler(run=handler, on_failure=on_failure)
+
+
+class JobWorkerPool:
+    """Runs a fixed number of polling workers inside the API process"""
+
+    # How often (in polls) each worker checks for abandoned leases
+    STALE_CHECK_EVERY = 60
+
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY, poll_interval: float = JOB_POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def start(self) -> None:
+        """Start worker tasks on the running event loop"""
+        if self._tasks:
+            return
+        self._recover_stale_jobs()
+        for index in range(self.concurrency):
+            worker_id = f"{self._instance_id}/{index}"
+            self._tasks.append(asyncio.create_task(self._run_worker(worker_id)))
+        logger.info(f"Started {self.concurrency} background job workers ({self._instance_id})")
+
+    async def stop(self) -> None:
+        """Stop workers and hand interrupted jobs back to the queue"""
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _heartbeat(self, job_id: int, worker_id: str) -> None:
+        """Renew a running job's lease until cancelled (uses its own session, the handler owns the other)"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            db = SessionLocal()
+            try:
+                if not JobQueue(db).heartbeat(job_id, worker_id):
+                    logger.warning(f"Lease of job {job_id} was taken over while {worker_id} was running it")
+                    return
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Could not renew the lease of job {job_id}: {e}")
+            finally:
+                db.close()
+
+    def _recover_stale_jobs(self) -> None:
+        db = SessionLocal()
+        try:
+            JobQueue(db).requeue_stale()
+        except Exception as e:
+            logger.warning(f"Could not requeue stale jobs: {e}")
+        finally:
+            db.close()
+
+    async def _run_worker(self, worker_id: str) -> None:
+        polls = 0
+        while not self._stopping.is_set():
+            polls += 1
+            if polls % self.STALE_CHECK_EVERY == 0:
+                self._recover_stale_jobs()
+            try:
+                processed = await self._process_next(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} error: {e}", exc_info=True)
+                processed = False
+
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _process_next(self, worker_id: str) -> bool:
+        """Claim and run a single job. Returns False when the queue was empty."""
+        db = SessionLocal()
+        try:
+            queue = JobQueue(db)
+            job = queue.claim(worker_id, list(_HANDLERS.keys()))
+            if not job:
+                return False
+
+            registered = _HANDLERS[job.job_type]
+            payload = dict(job.payload or {})
+            logger.info(f"Running job {job.id} ({job.job_type}) attempt {job.attempts}/{job.max_attempts}")
+
+            heartbeat = asyncio.create_task(self._heartbeat(job.id, worker_id))
+            try:
+                await registered.run(db, payload)
+            except asyncio.CancelledError:
+                # Graceful shutdown: hand the job back instead of waiting for the lease to expire
+                db.rollback()
+                queue.release(job)
+                raise
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Job {job.id} ({job.job_type}) failed: {e}", exc_info=True)
+                will_retry = queue.mark_failed(job, str(e))
+                if not will_retry and registered.on_failure:
+                    try:
+                        registered.on_failure(db, payload, str(e))
+                    except Exception as hook_error:
+                        logger.error(f"Failure hook for job {job.id} raised: {hook_error}", exc_info=True)
+                return True
+            finally:
+                heartbeat.cancel()
+
+            queue.mark_succeeded(job)
+            return True
+        finally:
+            db.close()
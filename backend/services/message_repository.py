@@ -1,8 +1,10 @@
 """Message repository for database operations"""
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Optional, List, Dict
 from models import ChatMessage
+from .usage_stats import UsageStats
 from logging_config import get_logger
+from tracing import traced
 
 logger = get_logger(__name__)
 
@@ -13,6 +15,7 @@ class MessageRepository:
     def __init__(self, db: Session):
         self.db = db
 
+    @traced("db.message_repository.save_user_message")
     def save_user_message(
         self,
         user_id: int,
@@ -43,10 +46,12 @@ class MessageRepository:
             images=images if images else None
         )
         self.db.add(user_message)
+        UsageStats(self.db).record_chat_message(user_message)
         self.db.commit()
         self.db.refresh(user_message)
         return user_message
 
+    @traced("db.message_repository.save_assistant_message")
     def save_assistant_message(
         self,
         user_id: int,
@@ -55,7 +60,8 @@ class MessageRepository:
         model: str,
         prompt_tokens: Optional[int] = None,
         completion_tokens: Optional[int] = None,
-        is_cancelled: bool = False
+        is_cancelled: bool = False,
+        metrics: Optional[Dict[str, float]] = None
     ) -> ChatMessage:
         """
         Save assistant message to database
@@ -68,6 +74,7 @@ class MessageRepository:
             prompt_tokens: Number of prompt tokens used
             completion_tokens: Number of completion tokens used
             is_cancelled: Whether the message was cancelled
+            metrics: Latency columns (``GenerationMetrics.as_dict()``)
 
         Returns:
             Saved ChatMessage object
@@ -80,13 +87,16 @@ class MessageRepository:
             model=model,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
-            is_cancelled=1 if is_cancelled else 0
+            is_cancelled=1 if is_cancelled else 0,
+            **(metrics or {})
         )
         self.db.add(assistant_msg)
+        UsageStats(self.db).record_chat_message(assistant_msg)
         self.db.commit()
         self.db.refresh(assistant_msg)
         return assistant_msg
 
+    @traced("db.message_repository.delete_message")
     def delete_message(self, message_id: int) -> bool:
         """
         Delete a message by ID
@@ -100,6 +110,10 @@ class MessageRepository:
         try:
             message = self.db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
             if message:
+                usage_stats = UsageStats(self.db)
+                usage_stats.record_chat_message(message, sign=-1)
+                for feedback in message.feedbacks:
+                    usage_stats.record_feedback(feedback, sign=-1)
                 self.db.delete(message)
                 self.db.commit()
                 return True
@@ -108,12 +122,14 @@ class MessageRepository:
             logger.error(f"Error deleting message: {e}", exc_info=True)
             return False
 
+    @traced("db.message_repository.get_session_history")
     def get_session_history(
         self,
         user_id: int,
         session_id: str,
         exclude_message_id: Optional[int] = None,
-        limit: int = 20
+        limit: int = 20,
+        offset: int = 0
     ) -> List[ChatMessage]:
         """
         Get chat history for a session
@@ -123,10 +139,35 @@ class MessageRepository:
             session_id: Session ID
             exclude_message_id: Optional message ID to exclude
             limit: Maximum number of messages to return
+            offset: Number of oldest messages to skip
 
         Returns:
-            List of ChatMessage objects
+            List of ChatMessage objects, oldest first (ties broken by ID so the order is stable)
         """
+        query = self._session_query(user_id, session_id, exclude_message_id)
+        return query.order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc()).offset(offset).limit(limit).all()
+
+    @traced("db.message_repository.count_session_messages")
+    def count_session_messages(
+        self,
+        user_id: int,
+        session_id: str,
+        exclude_message_id: Optional[int] = None
+    ) -> int:
+        """
+        Count the messages of a session
+
+        Args:
+            user_id: ID of the user
+            session_id: Session ID
+            exclude_message_id: Optional message ID to exclude
+
+        Returns:
+            Number of messages
+        """
+        return self._session_query(user_id, session_id, exclude_message_id).count()
+
+    def _session_query(self, user_id: int, session_id: str, exclude_message_id: Optional[int]):
         query = self.db.query(ChatMessage).filter(
             ChatMessage.user_id == user_id,
             ChatMessage.session_id == session_id
@@ -135,4 +176,4 @@ class MessageRepository:
         if exclude_message_id:
             query = query.filter(ChatMessage.id != exclude_message_id)
 
-        return query.order_by(ChatMessage.created_at.asc()).limit(limit).all()
+        return query
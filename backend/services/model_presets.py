@@ -0,0 +1,87 @@
+"""Per-model generation presets"""
+from typing import Any, Dict, List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import ModelPreset
+from schemas import GenerationOptions
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class ModelPresets:
+    """Stores a user's generation options per model and merges them into requests"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def for_user(self, user_id: int) -> List[ModelPreset]:
+        """All presets of a user, ordered by model name"""
+        return self.db.query(ModelPreset).filter(
+            ModelPreset.user_id == user_id
+        ).order_by(ModelPreset.model.asc()).all()
+
+    def get(self, user_id: int, model: str) -> Optional[ModelPreset]:
+        """The user's preset for a model, if any"""
+        return self.db.query(ModelPreset).filter(
+            ModelPreset.user_id == user_id,
+            ModelPreset.model == model
+        ).first()
+
+    def save(self, user_id: int, model: str, options: GenerationOptions) -> ModelPreset:
+        """
+        Create or replace the preset for a model
+
+        Args:
+            user_id: ID of the user
+            model: Model name as used in chat requests
+            options: Options to store (unset fields fall back to provider defaults)
+
+        Returns:
+            Saved ModelPreset
+        """
+        preset = self.get(user_id, model)
+        if preset is None:
+            preset = ModelPreset(user_id=user_id, model=model)
+            self.db.add(preset)
+        preset.options = options.as_options()
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # Created concurrently for the same model: update that row instead
+            self.db.rollback()
+            preset = self.get(user_id, model)
+            preset.options = options.as_options()
+            self.db.commit()
+        self.db.refresh(preset)
+        return preset
+
+    def resolve(
+        self,
+        user_id: int,
+        model: str,
+        overrides: Optional[GenerationOptions] = None,
+        defaults: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generation options for a request
+
+        Precedence: request overrides, then the user's preset, then defaults.
+
+        Args:
+            user_id: ID of the user
+            model: Model name
+            overrides: Options sent with the request
+            defaults: Caller defaults (e.g. note generation settings)
+
+        Returns:
+            Options dict for ``CompletionProvider.complete`` / ``stream``
+        """
+        options = dict(defaults or {})
+        preset = self.get(user_id, model)
+        if preset is not None and preset.options:
+            options.update({key: value for key, value in preset.options.items() if value is not None})
+        if overrides is not None:
+            options.update(overrides.as_options())
+        return options
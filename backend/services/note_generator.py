@@ -1,11 +1,17 @@
 """Note generation service"""
-import httpx
+import time
 from sqlalchemy.orm import Session
-from typing import Optional, List, Dict, Any
+from typing import List, Dict, Any, AsyncGenerator
 from logging_config import get_logger
 
-from models import ChatMessage, Note, CloudApiKey
-from config import OLLAMA_BASE_URL
+from models import ChatMessage, Note
+from config import NOTE_STREAM_COMMIT_INTERVAL
+from .cloud_providers import get_completion_provider
+from .note_stream import note_stream_broker
+from .response_cache import ResponseCache
+from .model_presets import ModelPresets
+from .api_key_store import ApiKeyStore
+from .semantic_search import schedule_embedding_index
 
 logger = get_logger(__name__)
 
@@ -13,19 +19,37 @@ logger = get_logger(__name__)
 class NoteGenerator:
     """Handles note content generation for various providers"""
 
+    # Provider-specific generation defaults, overridden by the user's preset for the model
+    GENERATION_OPTIONS: Dict[str, Dict[str, Any]] = {
+        "gemini": {
+            "temperature": 0.7,
+            "top_k": 40,
+            "top_p": 0.95,
+            "num_predict": 8192,
+        },
+    }
+
     def __init__(self, db: Session):
         self.db = db
 
-    async def generate(
+    async def generate_content(
         self,
         user_id: int,
         session_id: str,
         model: str,
         prompt: str,
-        note_id: int
+        note_id: int,
+        use_cache: bool = False,
+        force_cache: bool = False
     ) -> None:
         """
-        Generate note content and update the note in database
+        Generate note content and update the note, raising on failure
+
+        Run by the background job handler so failed attempts can be retried
+        before the note is marked as failed (``mark_failed``). Content is
+        streamed from the model: every chunk is published to live subscribers
+        and the partial text is committed to the note at most every
+        ``NOTE_STREAM_COMMIT_INTERVAL`` seconds.
 
         Args:
             user_id: User ID
@@ -33,30 +57,37 @@ class NoteGenerator:
             model: Model to use for generation
             prompt: User's prompt for note generation
             note_id: Note ID to update
+            use_cache: Reuse a cached result for an unchanged session and prompt
+            force_cache: Cache even when the provider samples (temperature > 0)
         """
-        try:
-            # Get conversation messages
-            messages = self._get_session_messages(user_id, session_id)
-
-            # Detect provider
-            is_cloud, provider = self._is_cloud_model(model)
-
-            # Generate content
-            if is_cloud and provider == "gemini":
-                content = await self._generate_with_gemini(
-                    user_id, model, messages, prompt
-                )
-            else:
-                content = await self._generate_with_ollama(
-                    model, messages, prompt
-                )
-
-            # Extract title and update note
-            self._update_note_with_content(note_id, content)
-
-        except Exception as e:
-            logger.error(f"Error generating note {note_id}: {e}", exc_info=True)
-            self._update_note_with_error(note_id, str(e))
+        # Get conversation messages
+        messages = self._get_session_messages(user_id, session_id)
+
+        # Reset any partial content left by a previous failed attempt
+        self._start_note(note_id)
+
+        # Stream content
+        chunks = self._stream_note(user_id, model, messages, prompt, use_cache, force_cache)
+
+        content = ""
+        last_commit = time.monotonic()
+        async for chunk in chunks:
+            # The offset lets subscribers line chunks up with the committed snapshot
+            note_stream_broker.publish(note_id, {"content": chunk, "offset": len(content)})
+            content += chunk
+
+            # Debounced commit so polling clients also see progress
+            now = time.monotonic()
+            if now - last_commit >= NOTE_STREAM_COMMIT_INTERVAL:
+                self._write_partial_content(note_id, content)
+                last_commit = now
+
+        # Extract title and update note
+        self._update_note_with_content(note_id, content)
+
+    def mark_failed(self, note_id: int, error: str) -> None:
+        """Write the final error message into the note"""
+        self._update_note_with_error(note_id, error)
 
     def _get_session_messages(
         self,
@@ -69,144 +100,63 @@ class NoteGenerator:
             ChatMessage.session_id == session_id
         ).order_by(ChatMessage.created_at.asc()).all()
 
-    @staticmethod
-    def _is_cloud_model(model_name: str) -> tuple[bool, Optional[str]]:
-        """Check if model is a cloud model"""
-        model_lower = model_name.lower()
-        if "gemini" in model_lower:
-            return True, "gemini"
-        elif "gpt" in model_lower:
-            return True, "gpt"
-        elif "grok" in model_lower:
-            return True, "grok"
-        elif "claude" in model_lower:
-            return True, "claude"
-        return False, None
-
-    async def _generate_with_gemini(
+    async def _stream_note(
         self,
         user_id: int,
         model: str,
         messages: List[ChatMessage],
-        prompt: str
-    ) -> str:
-        """Generate note using Gemini API"""
-        # Get API key
-        api_key_obj = self.db.query(CloudApiKey).filter(
-            CloudApiKey.user_id == user_id,
-            CloudApiKey.provider == "gemini"
-        ).first()
-
-        if not api_key_obj:
-            raise ValueError("Gemini APIキーが登録されていません。")
-
-        # Prepare messages
-        contents = self._prepare_gemini_messages(messages, prompt)
-
-        # Make API request
-        gemini_request = {
-            "contents": contents,
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 8192,
-            },
-        }
-
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key_obj.api_key}"
-
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(url, json=gemini_request)
-
-            if response.status_code != 200:
-                error_message = self._extract_error_message(response)
-                raise ValueError(f"Gemini API error: {error_message}")
-
-            response_json = response.json()
-
-            # Check for safety blocks
-            if not response_json.get("candidates"):
-                finish_reason = response_json.get("promptFeedback", {}).get("blockReason")
-                if finish_reason:
-                    raise ValueError(f"Request blocked by Gemini: {finish_reason}")
-                raise ValueError("Gemini API returned no content")
-
-            candidate = response_json["candidates"][0]
-            return "".join(
-                part.get("text", "")
-                for part in candidate.get("content", {}).get("parts", [])
-            )
-
-    def _prepare_gemini_messages(
-        self,
-        messages: List[ChatMessage],
-        prompt: str
-    ) -> List[Dict[str, Any]]:
-        """Prepare messages for Gemini API format"""
-        contents = []
-
-        for msg in messages:
-            parts = [{"text": msg.content}]
-
-            # Add images if present
-            if msg.images:
-                for img_base64 in msg.images:
-                    img_data = img_base64.split(",")[1] if "," in img_base64 else img_base64
-                    parts.append({
-                        "inline_data": {
-                            "mime_type": "image/jpeg",
-                            "data": img_data
-                        }
-                    })
-
-            role = "user" if msg.role == "user" else "model"
-            contents.append({"role": role, "parts": parts})
-
-        # Add prompt as final message
-        contents.append({"role": "user", "parts": [{"text": prompt}]})
-
-        return contents
-
-    async def _generate_with_ollama(
-        self,
-        model: str,
-        messages: List[ChatMessage],
-        prompt: str
-    ) -> str:
-        """Generate note using Ollama API"""
-        ollama_messages = []
-
-        for msg in messages:
-            msg_dict = {
-                "role": msg.role,
-                "content": msg.content
-            }
-            if msg.images:
-                msg_dict["images"] = msg.images
-            ollama_messages.append(msg_dict)
-
-        # Add prompt
-        ollama_messages.append({
-            "role": "user",
-            "content": prompt
-        })
-
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/chat",
-                json={
-                    "model": model,
-                    "messages": ollama_messages,
-                    "stream": False
-                }
+        prompt: str,
+        use_cache: bool = False,
+        force_cache: bool = False
+    ) -> AsyncGenerator[str, None]:
+        """Stream note content from whichever provider serves the model"""
+        provider = get_completion_provider(model, user_id)
+
+        api_key = None
+        if provider.name is not None:
+            api_key = ApiKeyStore(self.db).get(user_id, provider.name)
+            if not api_key:
+                raise ValueError(f"{provider.display_name} APIキーが登録されていません。")
+
+        # Conversation followed by the note prompt as the final user message
+        completion_messages = [
+            {"role": msg.role, "content": msg.content, "images": msg.images or []}
+            for msg in messages
+        ]
+        completion_messages.append({"role": "user", "content": prompt})
+
+        options = ModelPresets(self.db).resolve(user_id, model, defaults=self.GENERATION_OPTIONS.get(provider.name))
+        if use_cache:
+            chunks = ResponseCache(self.db).stream(
+                provider, model, completion_messages, api_key, options, force=force_cache
             )
+        else:
+            chunks = provider.stream(model, completion_messages, api_key, options)
+
+        received_content = False
+        async for chunk in chunks:
+            if chunk.content:
+                received_content = True
+                yield chunk.content
+
+        if not received_content:
+            raise ValueError(f"{provider.display_name} API returned no content")
+
+    def _start_note(self, note_id: int) -> None:
+        """Mark the note as generating and clear partial content"""
+        self.db.query(Note).filter(Note.id == note_id).update({
+            Note.status: "generating",
+            Note.content: ""
+        }, synchronize_session=False)
+        self.db.commit()
+        note_stream_broker.publish(note_id, {"reset": True})
 
-            if response.status_code != 200:
-                raise ValueError(f"Ollama error: {response.text}")
-
-            response_data = response.json()
-            return response_data.get("message", {}).get("content", "")
+    def _write_partial_content(self, note_id: int, content: str) -> None:
+        """Commit partial content without loading the note"""
+        self.db.query(Note).filter(Note.id == note_id).update({
+            Note.content: content
+        }, synchronize_session=False)
+        self.db.commit()
 
     def _update_note_with_content(self, note_id: int, content: str) -> None:
         """Update note with generated content and extracted title"""
@@ -223,21 +173,19 @@ class NoteGenerator:
 
         note.title = title
         note.content = content
+        note.status = "completed"
         self.db.commit()
+        # Full content so subscribers that missed chunks end up with the whole note
+        note_stream_broker.publish(note_id, {"done": True, "title": title, "status": "completed", "content": content})
         logger.info(f"Note {note_id} generated successfully")
 
+        schedule_embedding_index(self.db, note.user_id)
+
     def _update_note_with_error(self, note_id: int, error: str) -> None:
         """Update note with error message"""
         note = self.db.query(Note).filter(Note.id == note_id).first()
         if note:
             note.content = f"エラー: ノートの生成中にエラーが発生しました。{error}"
+            note.status = "failed"
             self.db.commit()
-
-    @staticmethod
-    def _extract_error_message(response: httpx.Response) -> str:
-        """Extract error message from API response"""
-        try:
-            error_json = response.json()
-            return error_json.get("error", {}).get("message", str(error_json))
-        except (ValueError, KeyError):
-            return response.text
+            note_stream_broker.publish(note_id, {"error": note.content, "status": "failed"})
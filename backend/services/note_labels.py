@@ -0,0 +1,178 @@
+"""Label index for notes: normalization, filtering and facet counts"""
+from typing import Optional, List, Dict, Any, Iterable
+
+from sqlalchemy import func, distinct
+from sqlalchemy.orm import Session, Query
+
+from models import Note, NoteLabel
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+MAX_LABEL_LENGTH = 100
+LABEL_MATCH_MODES = ("any", "all")
+
+
+def normalize_labels(labels: Optional[Iterable[str]]) -> List[str]:
+    """
+    Clean a label list: strip whitespace, drop empties and duplicates
+
+    Args:
+        labels: Raw labels
+
+    Returns:
+        Labels in their original order
+    """
+    normalized = []
+    seen = set()
+    for label in labels or []:
+        if not isinstance(label, str):
+            continue
+        label = label.strip()[:MAX_LABEL_LENGTH]
+        if label and label not in seen:
+            seen.add(label)
+            normalized.append(label)
+    return normalized
+
+
+class NoteLabelIndex:
+    """Keeps ``note_labels`` in sync with ``Note.labels`` and queries it
+
+    ``Note.labels`` stays the source returned to clients; the join table is an
+    index over it. Facet counts are answered from the
+    ``(user_id, is_deleted, label)`` index without loading any notes.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def set_labels(self, note: Note, labels: Optional[Iterable[str]]) -> List[str]:
+        """
+        Replace a note's labels (caller commits)
+
+        Args:
+            note: Note to update (must have an id)
+            labels: New labels
+
+        Returns:
+            The normalized labels stored on the note
+        """
+        normalized = normalize_labels(labels)
+        note.labels = normalized
+
+        self.db.query(NoteLabel).filter(NoteLabel.note_id == note.id).delete(synchronize_session=False)
+        for label in normalized:
+            self.db.add(NoteLabel(
+                note_id=note.id,
+                user_id=note.user_id,
+                label=label,
+                is_deleted=bool(note.is_deleted)
+            ))
+        return normalized
+
+    def set_deleted(self, note_ids: List[int], is_deleted: bool) -> None:
+        """Mirror a trash/restore of notes onto their labels (caller commits)"""
+        if not note_ids:
+            return
+        self.db.query(NoteLabel).filter(
+            NoteLabel.note_id.in_(note_ids)
+        ).update({NoteLabel.is_deleted: is_deleted}, synchronize_session=False)
+
+    def delete_notes(self, note_ids: List[int]) -> None:
+        """Remove labels of permanently deleted notes (caller commits)
+
+        The foreign key cascades on PostgreSQL; this keeps databases without
+        enforced foreign keys consistent too.
+        """
+        if not note_ids:
+            return
+        self.db.query(NoteLabel).filter(NoteLabel.note_id.in_(note_ids)).delete(synchronize_session=False)
+
+    def _matching_note_ids(self, user_id: int, labels: List[str], match: str) -> Query:
+        """Subquery of note ids carrying any/all of ``labels``"""
+        matching = self.db.query(NoteLabel.note_id).filter(
+            NoteLabel.user_id == user_id,
+            NoteLabel.label.in_(labels)
+        )
+        if match == "all":
+            matching = matching.group_by(NoteLabel.note_id).having(
+                func.count(distinct(NoteLabel.label)) == len(labels)
+            )
+        return matching
+
+    def filter_notes(self, query: Query, user_id: int, labels: List[str], match: str = "any") -> Query:
+        """
+        Restrict a Note query to notes carrying the given labels
+
+        Args:
+            query: Query over Note
+            user_id: Owner of the notes
+            labels: Labels to filter by
+            match: "any" (at least one label) or "all" (every label)
+
+        Returns:
+            Filtered query
+        """
+        labels = normalize_labels(labels)
+        if not labels:
+            return query
+        return query.filter(Note.id.in_(self._matching_note_ids(user_id, labels, match)))
+
+    def facets(
+        self,
+        user_id: int,
+        labels: Optional[List[str]] = None,
+        match: str = "all",
+        include_deleted: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Count notes per label
+
+        With ``labels`` set, counts are restricted to notes matching that
+        selection (drill-down facets).
+
+        Args:
+            user_id: User ID
+            labels: Currently selected labels
+            match: How the selected labels combine ("any" or "all")
+            include_deleted: Also count notes in the trash
+
+        Returns:
+            List of {"label", "count"} ordered by count, then label
+        """
+        count = func.count(NoteLabel.note_id)
+        query = self.db.query(NoteLabel.label, count.label("count")).filter(NoteLabel.user_id == user_id)
+        if not include_deleted:
+            query = query.filter(NoteLabel.is_deleted == False)
+
+        selected = normalize_labels(labels)
+        if selected:
+            query = query.filter(NoteLabel.note_id.in_(self._matching_note_ids(user_id, selected, match)))
+
+        rows = query.group_by(NoteLabel.label).order_by(count.desc(), NoteLabel.label).all()
+        return [{"label": row.label, "count": row.count} for row in rows]
+
+    def backfill(self) -> int:
+        """
+        Index labels of notes that have labels but no ``note_labels`` rows
+
+        Used once for databases created before the label index existed.
+
+        Returns:
+            Number of notes indexed
+        """
+        indexed = self.db.query(NoteLabel.note_id)
+        notes = self.db.query(Note).filter(
+            Note.labels.isnot(None),
+            ~Note.id.in_(indexed)
+        ).all()
+
+        count = 0
+        for note in notes:
+            if normalize_labels(note.labels):
+                self.set_labels(note, note.labels)
+                count += 1
+        self.db.commit()
+        if count:
+            logger.info(f"Backfilled label index for {count} notes")
+        return count
@@ -0,0 +1,156 @@
+"""Indexed keyword search over notes"""
+from typing import List, Dict, Any
+
+from sqlalchemy import case, func, literal, literal_column, or_, inspect
+from sqlalchemy.orm import Session
+
+from models import Note
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+SNIPPET_CONTEXT = 50  # Characters kept on each side of the match
+SNIPPET_FALLBACK_LENGTH = 100  # Leading excerpt when the query is not found verbatim
+
+# Cached per process: whether notes.search_vector exists (created by migration / ensure_columns_exist)
+_search_vector_available = None
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class NoteSearch:
+    """Keyword search over note titles and content
+
+    On PostgreSQL, matches come from the generated ``search_vector`` tsvector
+    and pg_trgm GIN indexes (which also serve ``ILIKE '%q%'``). Results are
+    ranked with ``ts_rank_cd`` plus title trigram similarity. Snippets are
+    cut in SQL, so full note bodies never leave the database. Other databases
+    fall back to unindexed LIKE matching ordered by recency.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.is_postgres = db.get_bind().dialect.name == "postgresql"
+
+    def _has_search_vector(self) -> bool:
+        global _search_vector_available
+        if _search_vector_available is None:
+            columns = [col["name"] for col in inspect(self.db.get_bind()).get_columns("notes")]
+            _search_vector_available = "search_vector" in columns
+            if self.is_postgres and not _search_vector_available:
+                logger.warning("notes.search_vector is missing; note search falls back to ILIKE scans")
+        return _search_vector_available
+
+    def _snippet_expression(self, query: str, tsquery=None):
+        """SQL expression reproducing ``utils.text_utils.build_snippet``"""
+        position_fn = func.strpos if self.is_postgres else func.instr
+        greatest_fn = func.greatest if self.is_postgres else func.max
+        least_fn = func.least if self.is_postgres else func.min
+
+        content = func.coalesce(Note.content, "")
+        query_length = len(query)
+        position = position_fn(func.lower(content), query.lower())
+
+        around_match = (
+            case((position > SNIPPET_CONTEXT + 1, literal("...")), else_=literal(""))
+            + func.substr(
+                content,
+                greatest_fn(position - SNIPPET_CONTEXT, 1),
+                least_fn(position - 1, SNIPPET_CONTEXT) + query_length + SNIPPET_CONTEXT
+            )
+            + case(
+                (position + query_length + SNIPPET_CONTEXT - 1 < func.length(content), literal("...")),
+                else_=literal("")
+            )
+        )
+        leading = func.substr(content, 1, SNIPPET_FALLBACK_LENGTH) + case(
+            (func.length(content) > SNIPPET_FALLBACK_LENGTH, literal("...")),
+            else_=literal("")
+        )
+
+        whens = [(position > 0, around_match)]
+        if tsquery is not None:
+            # Multi-word queries can match words that are not adjacent in the text
+            whens.append((
+                literal_column("notes.search_vector").op("@@")(tsquery),
+                func.ts_headline(
+                    "simple", content, tsquery,
+                    "MaxWords=30, MinWords=10, MaxFragments=1, StartSel=\"\", StopSel=\"\""
+                )
+            ))
+        return case(*whens, else_=leading)
+
+    def search(self, user_id: int, query: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Search a user's notes
+
+        Args:
+            user_id: User ID
+            query: Search text
+            limit: Maximum number of results
+            offset: Number of results to skip
+
+        Returns:
+            Note summaries (no content) with ``snippet`` and ``score``, best match first
+        """
+        query = query.strip()
+        pattern = f"%{_escape_like(query)}%"
+        title_match = Note.title.ilike(pattern, escape="\\")
+        content_match = Note.content.ilike(pattern, escape="\\")
+
+        tsquery = None
+        if self.is_postgres and self._has_search_vector():
+            tsquery = func.websearch_to_tsquery("simple", query)
+            search_vector = literal_column("notes.search_vector")
+            match = or_(search_vector.op("@@")(tsquery), title_match, content_match)
+            score = (
+                func.ts_rank_cd(search_vector, tsquery)
+                + func.similarity(Note.title, query)
+                + case((title_match, 1.0), else_=0.0)
+            )
+        else:
+            match = or_(title_match, content_match)
+            score = case((title_match, 1.0), else_=0.0)
+
+        rows = self.db.query(
+            Note.id,
+            Note.user_id,
+            Note.session_id,
+            Note.title,
+            Note.model,
+            Note.prompt,
+            Note.labels,
+            Note.is_deleted,
+            Note.status,
+            Note.created_at,
+            self._snippet_expression(query, tsquery).label("snippet"),
+            score.label("score"),
+        ).filter(
+            Note.user_id == user_id,
+            Note.is_deleted == False,
+            match
+        ).order_by(
+            score.desc(),
+            Note.created_at.desc(),
+            Note.id.desc()
+        ).offset(offset).limit(limit).all()
+
+        return [
+            {
+                "id": row.id,
+                "user_id": row.user_id,
+                "session_id": row.session_id,
+                "title": row.title,
+                "model": row.model,
+                "prompt": row.prompt,
+                "labels": row.labels or [],
+                "is_deleted": row.is_deleted,
+                "status": row.status or "completed",
+                "created_at": row.created_at.isoformat(),
+                "snippet": row.snippet or "",
+                "score": round(float(row.score or 0.0), 4),
+            }
+            for row in rows
+        ]
@@ -0,0 +1,51 @@
+"""In-process pub/sub for live note generation updates"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, Set, Any
+
+
+class NoteStreamBroker:
+    """Fans out note generation events to SSE subscribers in this process
+
+    Subscribers in other processes (or when the generating worker runs
+    elsewhere) fall back to polling the note row, so events here are a
+    latency optimization rather than the source of truth.
+    """
+
+    # Bounded so a slow client cannot grow memory without limit
+    QUEUE_SIZE = 1000
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, note_id: int) -> asyncio.Queue:
+        """Register a new subscriber queue for a note"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._subscribers[note_id].add(queue)
+        return queue
+
+    def unsubscribe(self, note_id: int, queue: asyncio.Queue) -> None:
+        """Remove a subscriber queue"""
+        subscribers = self._subscribers.get(note_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[note_id]
+
+    def publish(self, note_id: int, event: Dict[str, Any]) -> None:
+        """Deliver an event to every subscriber of a note (non-blocking)"""
+        for queue in list(self._subscribers.get(note_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Subscriber is too slow; it notices the gap in chunk offsets and catches up
+                # from the database (or the final content of the done event)
+                pass
+
+    def has_subscribers(self, note_id: int) -> bool:
+        """Check whether anyone is listening to a note"""
+        return bool(self._subscribers.get(note_id))
+
+
+note_stream_broker = NoteStreamBroker()
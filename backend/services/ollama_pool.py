@@ -0,0 +1,292 @@
+"""Routing across several Ollama backends
+
+``OLLAMA_BASE_URLS`` lists the backends (a single ``OLLAMA_BASE_URL`` is a
+pool of one). A background task polls ``/api/tags`` (pulled models) and
+``/api/ps`` (models loaded in memory) on every backend; requests are routed
+to healthy backends that have the model, preferring the backend a session
+used last (its KV cache holds the conversation), then backends where the
+model is already loaded, then the one with the fewest requests in flight.
+Backends that fail are skipped for ``OLLAMA_FAILURE_COOLDOWN`` seconds and
+the request fails over to the next candidate.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import httpx
+
+from config import (
+    OLLAMA_BASE_URLS,
+    OLLAMA_HEALTH_INTERVAL,
+    OLLAMA_FAILURE_COOLDOWN,
+    OLLAMA_STICKY_TTL,
+)
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Sessions remembered for stickiness (least recently used are forgotten)
+STICKY_MAX_SESSIONS = 10000
+
+
+def _model_names(name: str) -> Set[str]:
+    """Names a model can be requested by ("llama3" is "llama3:latest")"""
+    return {name, f"{name}:latest"} if ":" not in name else {name}
+
+
+class OllamaBackend:
+    """State of one Ollama server as seen by the pool"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True  # Assumed until the first health check says otherwise
+        self.models: Optional[Set[str]] = None  # None until /api/tags was read
+        self.resident: Set[str] = set()
+        self.in_flight = 0
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+
+    def is_available(self, now: float) -> bool:
+        return self.healthy and now >= self.down_until
+
+    def has_model(self, model: str) -> bool:
+        return self.models is None or bool(_model_names(model) & self.models)
+
+    def is_resident(self, model: str) -> bool:
+        return bool(_model_names(model) & self.resident)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.is_available(time.monotonic()),
+            "in_flight": self.in_flight,
+            "models": sorted(self.models) if self.models is not None else None,
+            "resident": sorted(self.resident),
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool:
+    """Health-checked, model-aware pool of Ollama backends"""
+
+    def __init__(self, urls: List[str]):
+        self.backends = [OllamaBackend(url) for url in urls]
+        self._sticky: "OrderedDict[str, tuple]" = OrderedDict()
+        self._turn = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def primary_url(self) -> str:
+        return self.backends[0].url
+
+    def route(self, model: str, affinity_key: Optional[str] = None) -> List[OllamaBackend]:
+        """
+        Backends to try for a request, best first
+
+        Args:
+            model: Model name
+            affinity_key: Session ID for stickiness
+
+        Returns:
+            Available backends that have the model, ordered by (sticky, resident,
+            in-flight requests), followed by the remaining backends as a last resort
+        """
+        if len(self.backends) == 1:
+            return list(self.backends)
+
+        now = time.monotonic()
+        sticky_url = self._sticky_url(affinity_key, now)
+        self._turn += 1
+        count = len(self.backends)
+
+        def rank(indexed):
+            index, backend = indexed
+            return (
+                backend.url != sticky_url,
+                not backend.is_resident(model),
+                backend.in_flight,
+                (index - self._turn) % count  # Rotate among equally loaded backends
+            )
+
+        available = [(i, b) for i, b in enumerate(self.backends) if b.is_available(now)]
+        preferred = sorted(((i, b) for i, b in available if b.has_model(model)), key=rank)
+        ordered = [backend for _, backend in preferred]
+        # Stale tags or backends in cooldown are still better than failing outright
+        ordered += [b for _, b in sorted(available, key=rank) if b not in ordered]
+        ordered += sorted((b for b in self.backends if b not in ordered), key=lambda b: b.down_until)
+        return ordered
+
+    @contextmanager
+    def track(self, backend: OllamaBackend) -> Iterator[None]:
+        """Count a request as in flight on a backend for the enclosed block"""
+        backend.in_flight += 1
+        try:
+            yield
+        finally:
+            backend.in_flight -= 1
+
+    def pin(self, affinity_key: Optional[str], backend: OllamaBackend) -> None:
+        """Route later requests of a session to ``backend``"""
+        if not affinity_key or len(self.backends) == 1:
+            return
+        self._sticky[affinity_key] = (backend.url, time.monotonic() + OLLAMA_STICKY_TTL)
+        self._sticky.move_to_end(affinity_key)
+        while len(self._sticky) > STICKY_MAX_SESSIONS:
+            self._sticky.popitem(last=False)
+
+    def _sticky_url(self, affinity_key: Optional[str], now: float) -> Optional[str]:
+        if not affinity_key:
+            return None
+        entry = self._sticky.get(affinity_key)
+        if entry is None:
+            return None
+        url, expires_at = entry
+        if now >= expires_at:
+            del self._sticky[affinity_key]
+            return None
+        return url
+
+    def should_fail_over(self, backend: OllamaBackend, model: str, error: BaseException) -> bool:
+        """
+        Record a failed request and decide whether another backend may succeed
+
+        Connection problems and server errors put the backend in cooldown; a
+        missing model only removes it from that backend's model list.
+        """
+        status_code = getattr(error, "status_code", None)
+        if status_code == 404:
+            if backend.models is not None:
+                backend.models -= _model_names(model)
+            return len(self.backends) > 1
+        if isinstance(error, httpx.TransportError) or (status_code is not None and status_code >= 500):
+            self.mark_failed(backend, error)
+            return len(self.backends) > 1
+        return False
+
+    def mark_failed(self, backend: OllamaBackend, error: BaseException) -> None:
+        backend.down_until = time.monotonic() + OLLAMA_FAILURE_COOLDOWN
+        backend.last_error = f"{type(error).__name__}: {error}"
+        logger.warning(f"Ollama backend {backend.url} failed ({backend.last_error}); skipping it for {OLLAMA_FAILURE_COOLDOWN:.0f}s")
+
+    async def refresh(self) -> None:
+        """Health-check every backend and reload its pulled and loaded models"""
+        from .cloud_providers import OllamaProvider
+
+        client = OllamaProvider.get_http_client()
+        await asyncio.gather(*(self._refresh_backend(client, backend) for backend in self.backends))
+
+    async def _refresh_backend(self, client: httpx.AsyncClient, backend: OllamaBackend) -> None:
+        try:
+            tags, ps = await asyncio.gather(
+                client.get(f"{backend.url}/api/tags", timeout=5.0),
+                client.get(f"{backend.url}/api/ps", timeout=5.0)
+            )
+            tags.raise_for_status()
+            backend.models = {model.get("name", "") for model in tags.json().get("models", [])}
+            # /api/ps is missing on old Ollama versions
+            backend.resident = (
+                {model.get("name", "") for model in ps.json().get("models", [])}
+                if ps.status_code == 200 else set()
+            )
+            if not backend.healthy:
+                logger.info(f"Ollama backend {backend.url} is healthy again")
+            backend.healthy = True
+            backend.down_until = 0.0
+            backend.last_error = None
+        except (httpx.HTTPError, ValueError) as e:
+            if backend.healthy:
+                logger.warning(f"Ollama backend {backend.url} failed its health check: {e}")
+            backend.healthy = False
+            backend.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            backend.last_checked = time.monotonic()
+
+    async def list_models(self) -> List[Dict[str, Any]]:
+        """
+        Models pulled on any healthy backend (``/api/tags`` entries, deduplicated by name)
+
+        Raises:
+            httpx.HTTPError: If no backend answered
+        """
+        from .cloud_providers import OllamaProvider
+
+        client = OllamaProvider.get_http_client()
+        now = time.monotonic()
+        backends = [b for b in self.backends if b.is_available(now)] or self.backends
+        responses = await asyncio.gather(
+            *(client.get(f"{backend.url}/api/tags", timeout=10.0) for backend in backends),
+            return_exceptions=True
+        )
+
+        models: Dict[str, Dict[str, Any]] = {}
+        last_error: Optional[BaseException] = None
+        answered = False
+        for backend, response in zip(backends, responses):
+            if isinstance(response, BaseException):
+                last_error = response
+                continue
+            if response.status_code != 200:
+                last_error = httpx.HTTPStatusError(
+                    f"Ollama API returned status {response.status_code}", request=response.request, response=response
+                )
+                continue
+            answered = True
+            entries = response.json().get("models", [])
+            backend.models = {entry.get("name", "") for entry in entries}
+            for entry in entries:
+                models.setdefault(entry.get("name", ""), entry)
+        if not answered and last_error is not None:
+            raise last_error
+        return list(models.values())
+
+    def backend_for_pull(self, model: str) -> OllamaBackend:
+        """Least loaded available backend that does not have the model yet"""
+        now = time.monotonic()
+        available = [b for b in self.backends if b.is_available(now)] or self.backends
+        missing = [b for b in available if b.models is None or not b.has_model(model)]
+        return min(missing or available, key=lambda b: b.in_flight)
+
+    def backends_with_model(self, model: str) -> List[OllamaBackend]:
+        """Backends known to have the model (all backends while tags are unknown)"""
+        return [b for b in self.backends if b.has_model(model)] or list(self.backends)
+
+    def model_pulled(self, backend: OllamaBackend, model: str) -> None:
+        if backend.models is not None:
+            backend.models.add(model if ":" in model else f"{model}:latest")
+
+    def model_deleted(self, backend: OllamaBackend, model: str) -> None:
+        if backend.models is not None:
+            backend.models -= _model_names(model)
+        backend.resident -= _model_names(model)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """State of every backend (for the backends endpoint)"""
+        return [backend.status() for backend in self.backends]
+
+    def start(self) -> None:
+        """Start the periodic health check (called on application startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Ollama health check failed: {e}", exc_info=True)
+            await asyncio.sleep(OLLAMA_HEALTH_INTERVAL)
+
+
+ollama_pool = OllamaPool(OLLAMA_BASE_URLS)
@@ -0,0 +1,221 @@
+"""Client-side rate limiting of cloud provider calls
+
+Each (user, provider) pair has two token buckets refilled continuously from
+``PROVIDER_RATE_LIMITS``: one for requests per minute and one for tokens per
+minute. A request reserves one request and its estimated tokens up front; if
+the budget is short it is queued (sleeps) until the buckets would have
+refilled, as long as that takes at most ``RATE_LIMIT_MAX_WAIT`` seconds.
+Reservations may drive a bucket negative, so queued requests are served in
+arrival order. Once the provider reports usage the estimate is replaced by
+the actual token count.
+
+Budgets are per process, like the other in-memory state of the backend.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import PROVIDER_RATE_LIMITS, RATE_LIMIT_MAX_WAIT
+from metrics import RATE_LIMIT_WAIT, RATE_LIMIT_REJECTED
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Output tokens assumed when the request does not set num_predict
+DEFAULT_OUTPUT_ESTIMATE = 256
+# Characters per token for the prompt estimate
+CHARS_PER_TOKEN = 4
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would have to queue longer than allowed"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Rate limit budget for {provider} exhausted (retry in {retry_after:.0f}s)")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Bucket refilled at ``per_minute / 60`` per second up to ``per_minute``"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available (after ``refill``)"""
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None) -> int:
+    """Rough token count of a request: prompt characters / 4 plus the expected output"""
+    prompt_chars = sum(len(msg.get("content") or "") for msg in messages)
+    output = (options or {}).get("num_predict") or DEFAULT_OUTPUT_ESTIMATE
+    return math.ceil(prompt_chars / CHARS_PER_TOKEN) + int(output)
+
+
+class Reservation:
+    """Budget taken for one request; ``settle`` replaces the estimate with actual usage"""
+
+    def __init__(self, budget: "ProviderBudget", tokens: int, wait: float = 0.0):
+        self.budget = budget
+        self.tokens = tokens
+        self.wait = wait  # Seconds the request was queued
+        self.settled = False
+
+    def settle(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+        if self.settled or (prompt_tokens is None and completion_tokens is None):
+            return
+        self.settled = True
+        actual = (prompt_tokens or 0) + (completion_tokens or 0)
+        self.budget.used_tokens += actual
+        if self.budget.tokens is not None:
+            self.budget.tokens.refill(time.monotonic())
+            self.budget.tokens.level -= actual - self.tokens
+
+
+class ProviderBudget:
+    """Request and token buckets of one (user, provider) pair"""
+
+    def __init__(self, provider: str, rpm: int, tpm: int):
+        self.provider = provider
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.queued = 0
+        self.used_requests = 0
+        self.used_tokens = 0
+
+    def _buckets(self) -> List[TokenBucket]:
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def reserve(self, tokens: int, max_wait: float) -> Tuple[Reservation, float]:
+        """
+        Take budget for a request
+
+        Returns:
+            Tuple of (reservation, seconds to wait before sending)
+
+        Raises:
+            RateLimitExceeded: If the wait would exceed ``max_wait``
+        """
+        now = time.monotonic()
+        if self.tokens is not None:
+            # A single request larger than the whole budget waits for a full bucket only
+            tokens = min(tokens, int(self.tokens.capacity))
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        if wait > max_wait:
+            raise RateLimitExceeded(self.provider, wait)
+
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            self.tokens.level -= tokens
+        self.used_requests += 1
+        return Reservation(self, tokens, wait), wait
+
+    def release(self, reservation: Reservation) -> None:
+        """Return the budget of a request that was never sent"""
+        now = time.monotonic()
+        if self.requests is not None:
+            self.requests.refill(now)
+            self.requests.level += 1
+        if self.tokens is not None:
+            self.tokens.refill(now)
+            self.tokens.level += reservation.tokens
+        self.used_requests -= 1
+
+    def exhaust(self) -> None:
+        """The provider rejected a request (429): spend the remaining request budget"""
+        if self.requests is not None:
+            self.requests.refill(time.monotonic())
+            self.requests.level = min(self.requests.level, 0.0)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        for bucket in self._buckets():
+            bucket.refill(now)
+        return {
+            "provider": self.provider,
+            "rpm_limit": int(self.requests.capacity) if self.requests is not None else None,
+            "tpm_limit": int(self.tokens.capacity) if self.tokens is not None else None,
+            "requests_remaining": max(int(self.requests.level), 0) if self.requests is not None else None,
+            "tokens_remaining": max(int(self.tokens.level), 0) if self.tokens is not None else None,
+            "queued": self.queued,
+            "requests_used": self.used_requests,
+            "tokens_used": self.used_tokens,
+        }
+
+
+class RateLimiter:
+    """Budgets of every (user, provider) pair seen by this process"""
+
+    def __init__(self, limits: Dict[str, Dict[str, int]] = PROVIDER_RATE_LIMITS, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.limits = limits
+        self.max_wait = max_wait
+        self._budgets: Dict[Tuple[Optional[int], str], ProviderBudget] = {}
+
+    def budget(self, user_id: Optional[int], provider: str) -> ProviderBudget:
+        key = (user_id, provider)
+        budget = self._budgets.get(key)
+        if budget is None:
+            limits = self.limits.get(provider, {})
+            budget = self._budgets[key] = ProviderBudget(provider, limits.get("rpm", 0), limits.get("tpm", 0))
+        return budget
+
+    @asynccontextmanager
+    async def acquire(self, user_id: Optional[int], provider: str, tokens: int) -> AsyncIterator[Reservation]:
+        """
+        Wait for budget, then run the enclosed request
+
+        Args:
+            user_id: ID of the user whose key is used (None for calls without a user)
+            provider: Provider name
+            tokens: Estimated tokens of the request (see ``estimate_tokens``)
+
+        Yields:
+            Reservation to ``settle`` with the reported usage
+
+        Raises:
+            RateLimitExceeded: If the budget does not free up within the allowed wait
+        """
+        budget = self.budget(user_id, provider)
+        try:
+            reservation, wait = budget.reserve(tokens, self.max_wait)
+        except RateLimitExceeded:
+            RATE_LIMIT_REJECTED.labels(provider=provider).inc()
+            raise
+        RATE_LIMIT_WAIT.labels(provider=provider).observe(wait)
+
+        if wait > 0:
+            logger.debug(f"Queuing {provider} request of user {user_id} for {wait:.2f}s (rate limit budget)")
+            budget.queued += 1
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                budget.release(reservation)
+                raise
+            finally:
+                budget.queued -= 1
+        yield reservation
+
+    def status(self, user_id: int) -> List[Dict[str, Any]]:
+        """Budget of every rate-limited provider for a user"""
+        return [self.budget(user_id, provider).status() for provider in self.limits]
+
+
+rate_limiter = RateLimiter()
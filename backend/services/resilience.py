@@ -0,0 +1,262 @@
+"""Retries, circuit breakers and hedged requests for cloud provider calls
+
+``send_with_resilience`` wraps one HTTP exchange:
+
+- 408/425/429/5xx responses and errors raised before the request reached
+  the upstream (connect failures, pool timeouts, a reused connection closed
+  before it answered) are retried with full jitter exponential backoff,
+  honouring ``Retry-After`` (``retry-after-ms``) when the provider sends it;
+- a per-provider ``CircuitBreaker`` rejects calls for ``CIRCUIT_RESET_TIMEOUT``
+  seconds after ``CIRCUIT_FAILURE_THRESHOLD`` consecutive failures (5xx,
+  connection errors, timeouts), then lets a single probe through;
+- with a hedge delay, a duplicate request is sent if the first has not
+  answered in time and whichever answers first is used.
+
+Read/write errors and read timeouts are not retried: the upstream may
+already be generating (and billing) the completion, and another attempt
+would most likely hang as long again.
+"""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from config import (
+    PROVIDER_MAX_RETRIES,
+    PROVIDER_RETRY_BASE_DELAY,
+    PROVIDER_RETRY_MAX_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+)
+from metrics import UPSTREAM_RETRIES, UPSTREAM_HEDGES, CIRCUIT_STATE
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504, 529})
+# Errors raised before the upstream could start working on the request
+RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+    httpx.RemoteProtocolError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit for {name} is open (retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)"""
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        CIRCUIT_STATE.labels(provider=name).set(0)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self) -> None:
+        """
+        Check that a call may be made
+
+        Raises:
+            CircuitOpenError: While open, or while a half-open probe is in flight
+        """
+        if self.failure_threshold <= 0:
+            return
+        state = self.state
+        now = time.monotonic()
+        if state == self.OPEN:
+            raise CircuitOpenError(self.name, self.reset_timeout - (now - self.opened_at))
+        if state == self.HALF_OPEN:
+            # A probe that never reported back (cancelled) does not block forever
+            if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+                raise CircuitOpenError(self.name, self.reset_timeout - (now - self.probe_started_at))
+            self.probe_started_at = now
+            self._publish()
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+        self._publish()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failure_threshold <= 0:
+            return
+        if self.probe_started_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.probe_started_at is not None:
+                logger.warning(
+                    f"Circuit for {self.name} opened after {self.failures} consecutive failures; "
+                    f"rejecting calls for {self.reset_timeout:.0f}s"
+                )
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+        self._publish()
+
+    def _publish(self) -> None:
+        CIRCUIT_STATE.labels(provider=self.name).set(self._STATE_VALUES[self.state])
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def circuit_breaker(name: str) -> CircuitBreaker:
+    """Shared circuit breaker of a provider"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def backoff_delay(attempt: int, base: float = PROVIDER_RETRY_BASE_DELAY, cap: float = PROVIDER_RETRY_MAX_DELAY) -> float:
+    """Full jitter backoff: uniform in [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Seconds requested by ``retry-after-ms`` or ``Retry-After`` (seconds or HTTP date)"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _hedged(send: Callable[[], Awaitable[httpx.Response]], delay: float, provider: str) -> httpx.Response:
+    """Send a second request if the first has not answered after ``delay`` seconds"""
+    primary = asyncio.ensure_future(send())
+    pending = {primary}
+    fallback: Optional[asyncio.Future] = None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(send())
+        pending.add(hedge)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code not in RETRYABLE_STATUS_CODES:
+                    UPSTREAM_HEDGES.labels(provider=provider, winner="primary" if task is primary else "hedge").inc()
+                    for other in (primary, hedge):
+                        # Release the connection of a loser that answered too
+                        if other is not task and other.done() and not other.cancelled() and other.exception() is None:
+                            await other.result().aclose()
+                    return task.result()
+                if fallback is not None and fallback.exception() is None:
+                    await fallback.result().aclose()
+                fallback = task
+        # Both failed: report the later outcome
+        return fallback.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def send_with_resilience(
+    send: Callable[[], Awaitable[httpx.Response]],
+    provider: str,
+    breaker: Optional[CircuitBreaker] = None,
+    max_retries: int = PROVIDER_MAX_RETRIES,
+    hedge_delay: float = 0.0
+) -> httpx.Response:
+    """
+    Send a request with retries, circuit breaking and optional hedging
+
+    Args:
+        send: Sends the request once (called again for every attempt)
+        provider: Provider label for logs and metrics
+        breaker: Circuit breaker of the provider (None to skip)
+        max_retries: Retries after the first attempt
+        hedge_delay: Seconds before a duplicate request is sent (0 disables hedging)
+
+    Returns:
+        The first non-retryable response, or the last response once retries
+        are exhausted (the caller turns error statuses into errors as usual)
+
+    Raises:
+        CircuitOpenError: If the provider's circuit is open
+        httpx.HTTPError: If the last attempt failed without a response
+    """
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            response = await (_hedged(send, hedge_delay, provider) if hedge_delay > 0 else send())
+        except httpx.HTTPError as e:
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt >= max_retries or not isinstance(e, RETRYABLE_ERRORS):
+                raise
+            reason = "timeout" if isinstance(e, httpx.TimeoutException) else "connection"
+            delay = backoff_delay(attempt)
+            logger.info(f"{provider} request failed ({type(e).__name__}: {e}); retry {attempt + 1}/{max_retries} in {delay:.2f}s")
+        else:
+            status_code = response.status_code
+            if breaker is not None:
+                if status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                return response
+            retry_after = parse_retry_after(response.headers)
+            if retry_after is not None and retry_after > PROVIDER_RETRY_MAX_DELAY:
+                # Waiting that long would hold the request open; report it instead
+                return response
+            await response.aclose()
+            reason = str(status_code)
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            logger.info(f"{provider} returned {status_code}; retry {attempt + 1}/{max_retries} in {delay:.2f}s")
+
+        UPSTREAM_RETRIES.labels(provider=provider, reason=reason).inc()
+        attempt += 1
+        await asyncio.sleep(delay)
@@ -0,0 +1,293 @@
+"""Response cache for deterministic model prompts"""
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, AsyncGenerator
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_EVICT_EVERY
+from models import ResponseCacheEntry
+from .cloud_providers.base import CompletionProvider, CompletionResult, CompletionChunk, NeutralMessage
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Process-wide counters (reset on restart)
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+# Options that do not change the generated text and are left out of the key
+NON_OUTPUT_OPTIONS = ("keep_alive",)
+
+
+def _count(name: str) -> int:
+    with _stats_lock:
+        _stats[name] += 1
+        return _stats[name]
+
+
+class ResponseCache:
+    """Caches completions keyed by a hash of (model, normalized messages, options)
+
+    Entries live in PostgreSQL with a TTL; every ``RESPONSE_CACHE_EVICT_EVERY``
+    stores, expired entries are deleted and the least recently used ones
+    beyond ``RESPONSE_CACHE_MAX_ENTRIES`` are evicted (in between, the table
+    may exceed the maximum by up to that many entries per process). Sampling makes
+    responses non-deterministic, so requests with temperature > 0 (or the
+    provider's default temperature) bypass the cache unless ``force`` is set.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def make_key(model: str, messages: List[NeutralMessage], options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Build the cache key for a request
+
+        Message text is normalized (line endings, surrounding whitespace) and
+        images are reduced to their hashes so keys stay small.
+
+        Args:
+            model: Model name
+            messages: Provider-neutral messages
+            options: Generation options
+
+        Returns:
+            Hex sha256 digest
+        """
+        normalized_messages = []
+        for msg in messages:
+            content = (msg.get("content") or "").replace("\r\n", "\n").strip()
+            images = [
+                hashlib.sha256(image.encode("utf-8")).hexdigest()
+                for image in (msg.get("images") or [])
+            ]
+            normalized_messages.append({"role": msg["role"], "content": content, "images": images})
+
+        normalized_options = {
+            key: value for key, value in (options or {}).items()
+            if value is not None and key not in NON_OUTPUT_OPTIONS
+        }
+        payload = json.dumps(
+            {"model": model, "messages": normalized_messages, "options": normalized_options},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def is_cacheable(options: Optional[Dict[str, Any]] = None, force: bool = False) -> bool:
+        """Whether a request is deterministic enough to cache"""
+        if force:
+            return True
+        temperature = (options or {}).get("temperature")
+        return temperature is not None and temperature <= 0
+
+    def get(self, key: str) -> Optional[CompletionResult]:
+        """
+        Look up a cached completion
+
+        Args:
+            key: Cache key from ``make_key``
+
+        Returns:
+            Cached CompletionResult or None on a miss
+        """
+        now = datetime.utcnow()
+        entry = self.db.query(ResponseCacheEntry).filter(
+            ResponseCacheEntry.cache_key == key,
+            ResponseCacheEntry.expires_at > now
+        ).first()
+        if not entry:
+            _count("misses")
+            return None
+
+        entry.hit_count += 1
+        entry.last_accessed_at = now
+        self.db.commit()
+        _count("hits")
+        return CompletionResult(
+            content=entry.content,
+            prompt_tokens=entry.prompt_tokens,
+            completion_tokens=entry.completion_tokens,
+            finish_reason="cached"
+        )
+
+    def set(self, key: str, model: str, result: CompletionResult) -> None:
+        """
+        Store a completion, replacing any previous entry for the key
+
+        Args:
+            key: Cache key from ``make_key``
+            model: Model name
+            result: Completion to store
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=RESPONSE_CACHE_TTL)
+        entry = self.db.query(ResponseCacheEntry).filter(ResponseCacheEntry.cache_key == key).first()
+        if entry is None:
+            entry = ResponseCacheEntry(cache_key=key, model=model, hit_count=0)
+            self.db.add(entry)
+        entry.content = result.content
+        entry.prompt_tokens = result.prompt_tokens
+        entry.completion_tokens = result.completion_tokens
+        entry.created_at = now
+        entry.last_accessed_at = now
+        entry.expires_at = expires_at
+
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # Another worker stored the same key concurrently
+            self.db.rollback()
+            return
+
+        # Counting the table on every store is wasteful; trim it periodically instead
+        if _count("stores") % max(RESPONSE_CACHE_EVICT_EVERY, 1) == 0:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drop expired entries and trim the cache to its maximum size (LRU)"""
+        now = datetime.utcnow()
+        self.db.query(ResponseCacheEntry).filter(
+            ResponseCacheEntry.expires_at <= now
+        ).delete(synchronize_session=False)
+
+        overflow = self.db.query(ResponseCacheEntry).count() - RESPONSE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            oldest_ids = [
+                row.id for row in self.db.query(ResponseCacheEntry.id).order_by(
+                    ResponseCacheEntry.last_accessed_at.asc()
+                ).limit(overflow).all()
+            ]
+            self.db.query(ResponseCacheEntry).filter(
+                ResponseCacheEntry.id.in_(oldest_ids)
+            ).delete(synchronize_session=False)
+            logger.info(f"Evicted {len(oldest_ids)} least recently used response cache entries")
+        self.db.commit()
+
+    async def complete(
+        self,
+        provider: CompletionProvider,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        force: bool = False
+    ) -> CompletionResult:
+        """
+        ``provider.complete`` with read-through caching
+
+        Args:
+            provider: Provider serving the model
+            model: Model name
+            messages: Provider-neutral messages
+            api_key: Provider API key
+            options: Generation options (also part of the key)
+            force: Cache even when sampling is enabled
+
+        Returns:
+            Cached or freshly generated CompletionResult
+        """
+        if not self.is_cacheable(options, force):
+            _count("bypassed")
+            return await provider.complete(model, messages, api_key, options)
+
+        key = self.make_key(model, messages, options)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        result = await provider.complete(model, messages, api_key, options)
+        if result.content:
+            self.set(key, model, result)
+        return result
+
+    async def stream(
+        self,
+        provider: CompletionProvider,
+        model: str,
+        messages: List[NeutralMessage],
+        api_key: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        force: bool = False
+    ) -> AsyncGenerator[CompletionChunk, None]:
+        """
+        ``provider.stream`` with read-through caching
+
+        A hit is replayed as a single final chunk. On a miss chunks are passed
+        through and the full text is stored once the stream completes.
+        """
+        if not self.is_cacheable(options, force):
+            _count("bypassed")
+            async for chunk in provider.stream(model, messages, api_key, options):
+                yield chunk
+            return
+
+        key = self.make_key(model, messages, options)
+        cached = self.get(key)
+        if cached is not None:
+            yield CompletionChunk(
+                content=cached.content,
+                done=True,
+                prompt_tokens=cached.prompt_tokens,
+                completion_tokens=cached.completion_tokens,
+                cached=True
+            )
+            return
+
+        result = CompletionResult(content="")
+        stored = False
+        async for chunk in provider.stream(model, messages, api_key, options):
+            result.content += chunk.content
+            if chunk.prompt_tokens is not None:
+                result.prompt_tokens = chunk.prompt_tokens
+            if chunk.completion_tokens is not None:
+                result.completion_tokens = chunk.completion_tokens
+            # Store before yielding the final chunk: consumers usually stop iterating on it
+            if chunk.done and result.content:
+                self.set(key, model, result)
+                stored = True
+            yield chunk
+
+        # Providers without an explicit final chunk end the stream instead;
+        # cancelled or failed streams raise out of the loop and are never stored
+        if not stored and result.content:
+            self.set(key, model, result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus stored entry counts"""
+        with _stats_lock:
+            counters = dict(_stats)
+        lookups = counters["hits"] + counters["misses"]
+        now = datetime.utcnow()
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": self.db.query(ResponseCacheEntry).filter(
+                ResponseCacheEntry.expires_at > now
+            ).count(),
+            "max_entries": RESPONSE_CACHE_MAX_ENTRIES,
+            "ttl_seconds": RESPONSE_CACHE_TTL,
+        }
+
+    def clear(self, model: Optional[str] = None) -> int:
+        """
+        Delete cached entries
+
+        Args:
+            model: Only delete entries for this model
+
+        Returns:
+            Number of deleted entries
+        """
+        query = self.db.query(ResponseCacheEntry)
+        if model:
+            query = query.filter(ResponseCacheEntry.model == model)
+        deleted = query.delete(synchronize_session=False)
+        self.db.commit()
+        return deleted
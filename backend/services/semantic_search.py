@@ -0,0 +1,414 @@
+"""Semantic (embedding based) search over chat messages and notes"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Tuple, Sequence
+
+import numpy as np
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+
+from config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_AUTO_INDEX,
+    EMBEDDING_INDEX_DELAY,
+    SEMANTIC_ANN_THRESHOLD,
+    SEMANTIC_CACHE_MAX_MATRICES,
+)
+from models import ChatMessage, Note, Embedding
+from .embedding_service import EmbeddingService
+from .job_queue import JobQueue
+from logging_config import get_logger
+
+try:
+    import hnswlib
+except ImportError:  # Optional: brute force is used without it
+    hnswlib = None
+
+logger = get_logger(__name__)
+
+EMBEDDING_INDEX_JOB = "embedding_index"
+
+SOURCE_MESSAGE = "message"
+SOURCE_NOTE = "note"
+
+SEARCH_MODES = ("keyword", "semantic", "hybrid")
+
+# Reciprocal rank fusion constant (standard value from the RRF paper)
+RRF_K = 60
+
+
+def schedule_embedding_index(db: Session, user_id: int) -> None:
+    """
+    Queue background embedding of a user's new messages and notes
+
+    Bursts of writes collapse into one job through the dedupe key, and the
+    delay lets a whole chat exchange land before indexing starts.
+    """
+    if not EMBEDDING_AUTO_INDEX:
+        return
+    try:
+        JobQueue(db).enqueue(
+            EMBEDDING_INDEX_JOB,
+            payload={"user_id": user_id},
+            user_id=user_id,
+            dedupe_key=f"embed:{user_id}",
+            delay=EMBEDDING_INDEX_DELAY
+        )
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not schedule embedding index for user {user_id}: {e}")
+
+
+@dataclass
+class SearchHit:
+    """A ranked search result"""
+    source_type: str
+    source_id: int
+    score: float
+    record: Any = None  # ChatMessage or Note
+
+
+@dataclass
+class _VectorMatrix:
+    signature: Tuple[Any, ...]
+    keys: List[Tuple[str, int]]
+    matrix: np.ndarray  # Row-normalized float32 vectors
+    ann: Any = None
+
+
+class VectorStore:
+    """Per-user normalized embedding matrices cached in memory
+
+    Matrices are rebuilt when the (count, last update) signature of the
+    user's embeddings changes; outdated matrices are dropped and at most
+    ``SEMANTIC_CACHE_MAX_MATRICES`` are kept (least recently used first out).
+    Above ``SEMANTIC_ANN_THRESHOLD`` vectors an HNSW index is built if
+    hnswlib is installed.
+    """
+
+    _cache: "OrderedDict[Tuple[int, str, Tuple[str, ...]], _VectorMatrix]" = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, db: Session, model: str):
+        self.db = db
+        self.model = model
+
+    def _query(self, user_id: int, source_types: Sequence[str]):
+        return self.db.query(Embedding).filter(
+            Embedding.user_id == user_id,
+            Embedding.model == self.model,
+            Embedding.source_type.in_(list(source_types))
+        )
+
+    def get(self, user_id: int, source_types: Sequence[str]) -> Optional[_VectorMatrix]:
+        """Get the (possibly cached) matrix for a user"""
+        source_types = tuple(sorted(source_types))
+        cache_key = (user_id, self.model, source_types)
+        signature = tuple(self._query(user_id, source_types).with_entities(
+            func.count(Embedding.id),
+            func.max(Embedding.updated_at)
+        ).one())
+
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                if cached.signature == signature:
+                    self._cache.move_to_end(cache_key)
+                    return cached
+                # Free the outdated matrix before the new one is built
+                del self._cache[cache_key]
+
+        rows = self._query(user_id, source_types).with_entities(
+            Embedding.source_type,
+            Embedding.source_id,
+            Embedding.dim,
+            Embedding.vector
+        ).all()
+        if not rows:
+            return None
+
+        dim = rows[0].dim
+        rows = [row for row in rows if row.dim == dim]
+        matrix = np.vstack([EmbeddingService.from_bytes(row.vector, dim) for row in rows])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        entry = _VectorMatrix(
+            signature=signature,
+            keys=[(row.source_type, row.source_id) for row in rows],
+            matrix=matrix.astype(np.float32, copy=False),
+            ann=self._build_ann(matrix) if len(rows) >= SEMANTIC_ANN_THRESHOLD else None
+        )
+        with self._lock:
+            self._cache[cache_key] = entry
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > SEMANTIC_CACHE_MAX_MATRICES:
+                self._cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _build_ann(matrix: np.ndarray):
+        if hnswlib is None:
+            return None
+        index = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        index.init_index(max_elements=matrix.shape[0], ef_construction=200, M=16)
+        index.add_items(matrix, np.arange(matrix.shape[0]))
+        return index
+
+    @staticmethod
+    def nearest(entry: _VectorMatrix, query_vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        Find the k nearest rows by cosine similarity
+
+        Returns:
+            List of (row index, similarity) sorted by similarity
+        """
+        norm = np.linalg.norm(query_vector)
+        query = (query_vector / norm if norm else query_vector).astype(np.float32)
+        k = min(k, entry.matrix.shape[0])
+        if k <= 0:
+            return []
+
+        if entry.ann is not None:
+            entry.ann.set_ef(max(64, k * 2))
+            labels, distances = entry.ann.knn_query(query, k=k)
+            # hnswlib "ip" distance is 1 - inner product
+            return [(int(label), float(1 - distance)) for label, distance in zip(labels[0], distances[0])]
+
+        scores = entry.matrix @ query
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class SemanticSearch:
+    """Indexes chat messages and notes and serves keyword/semantic/hybrid search"""
+
+    def __init__(self, db: Session, embedder: Optional[EmbeddingService] = None):
+        self.db = db
+        self.embedder = embedder or EmbeddingService()
+        self.model = self.embedder.model
+
+    @staticmethod
+    def _note_text(note: Note) -> str:
+        return f"{note.title or ''}\n{note.content or ''}".strip()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _pending_sources(self, user_id: int) -> List[Tuple[str, int, str]]:
+        """Messages without an embedding and notes whose text changed since embedding"""
+        pending: List[Tuple[str, int, str]] = []
+
+        messages = self.db.query(ChatMessage.id, ChatMessage.content).outerjoin(
+            Embedding,
+            and_(
+                Embedding.source_type == SOURCE_MESSAGE,
+                Embedding.source_id == ChatMessage.id,
+                Embedding.model == self.model
+            )
+        ).filter(
+            ChatMessage.user_id == user_id,
+            Embedding.id.is_(None)
+        ).order_by(ChatMessage.id.asc()).all()
+        pending.extend(
+            (SOURCE_MESSAGE, row.id, row.content)
+            for row in messages if row.content and row.content.strip()
+        )
+
+        notes = self.db.query(Note, Embedding.content_hash).outerjoin(
+            Embedding,
+            and_(
+                Embedding.source_type == SOURCE_NOTE,
+                Embedding.source_id == Note.id,
+                Embedding.model == self.model
+            )
+        ).filter(
+            Note.user_id == user_id,
+            Note.is_deleted == False,
+            (Note.status == "completed") | Note.status.is_(None)
+        ).all()
+        for note, content_hash in notes:
+            text = self._note_text(note)
+            if text and content_hash != self._hash(text):
+                pending.append((SOURCE_NOTE, note.id, text))
+
+        return pending
+
+    async def index_user(self, user_id: int) -> int:
+        """
+        Embed all pending messages and notes of a user
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            Number of embedded texts
+        """
+        pending = self._pending_sources(user_id)
+        if not pending:
+            return 0
+
+        # Several embed batches per commit keeps round trips and transactions low
+        step = EMBEDDING_BATCH_SIZE * 4
+        for start in range(0, len(pending), step):
+            chunk = pending[start:start + step]
+            vectors = await self.embedder.embed([text for _, _, text in chunk])
+            self._store(user_id, chunk, vectors)
+
+        logger.info(f"Embedded {len(pending)} texts for user {user_id} with {self.model}")
+        return len(pending)
+
+    def _store(self, user_id: int, chunk: List[Tuple[str, int, str]], vectors: np.ndarray) -> None:
+        existing = {
+            (row.source_type, row.source_id): row
+            for row in self.db.query(Embedding).filter(
+                Embedding.model == self.model,
+                Embedding.source_type.in_({source_type for source_type, _, _ in chunk}),
+                Embedding.source_id.in_([source_id for _, source_id, _ in chunk])
+            ).all()
+        }
+        for (source_type, source_id, text), vector in zip(chunk, vectors):
+            row = existing.get((source_type, source_id))
+            if row is None:
+                row = Embedding(
+                    user_id=user_id,
+                    source_type=source_type,
+                    source_id=source_id,
+                    model=self.model
+                )
+                self.db.add(row)
+            row.dim = int(vector.shape[0])
+            row.vector = EmbeddingService.to_bytes(vector)
+            row.content_hash = self._hash(text)
+        self.db.commit()
+
+    def index_status(self, user_id: int) -> Dict[str, Any]:
+        """Count indexed vs indexable items for a user"""
+        indexed = dict(self.db.query(Embedding.source_type, func.count(Embedding.id)).filter(
+            Embedding.user_id == user_id,
+            Embedding.model == self.model
+        ).group_by(Embedding.source_type).all())
+        pending = self._pending_sources(user_id)
+        return {
+            "model": self.model,
+            "indexed_messages": indexed.get(SOURCE_MESSAGE, 0),
+            "indexed_notes": indexed.get(SOURCE_NOTE, 0),
+            "pending": len(pending),
+        }
+
+    def _keyword_ranking(self, user_id: int, query: str, source_types: Sequence[str], limit: int) -> List[Tuple[str, int]]:
+        pattern = f"%{query}%"
+        ranking: List[Tuple[str, int, Any]] = []
+        if SOURCE_NOTE in source_types:
+            rows = self.db.query(Note.id, Note.created_at).filter(
+                Note.user_id == user_id,
+                Note.is_deleted == False,
+                (Note.title.ilike(pattern) | Note.content.ilike(pattern))
+            ).order_by(Note.created_at.desc()).limit(limit).all()
+            ranking.extend((SOURCE_NOTE, row.id, row.created_at) for row in rows)
+        if SOURCE_MESSAGE in source_types:
+            rows = self.db.query(ChatMessage.id, ChatMessage.created_at).filter(
+                ChatMessage.user_id == user_id,
+                ChatMessage.content.ilike(pattern)
+            ).order_by(ChatMessage.created_at.desc()).limit(limit).all()
+            ranking.extend((SOURCE_MESSAGE, row.id, row.created_at) for row in rows)
+
+        # Most recent first across both sources, like the keyword endpoints
+        ranking.sort(key=lambda item: item[2], reverse=True)
+        return [(source_type, source_id) for source_type, source_id, _ in ranking[:limit]]
+
+    async def _semantic_ranking(
+        self,
+        user_id: int,
+        query: str,
+        source_types: Sequence[str],
+        limit: int
+    ) -> List[Tuple[str, int, float]]:
+        entry = VectorStore(self.db, self.model).get(user_id, source_types)
+        if entry is None:
+            return []
+        query_vector = await self.embedder.embed_one(query)
+        if query_vector.shape[0] != entry.matrix.shape[1]:
+            logger.warning(f"Query embedding dimension {query_vector.shape[0]} does not match index {entry.matrix.shape[1]}")
+            return []
+        # Unrelated texts have similarity <= 0 and would only pad the results
+        return [
+            (*entry.keys[row], score)
+            for row, score in VectorStore.nearest(entry, query_vector, limit)
+            if score > 0
+        ]
+
+    async def search(
+        self,
+        user_id: int,
+        query: str,
+        source_types: Sequence[str] = (SOURCE_MESSAGE, SOURCE_NOTE),
+        mode: str = "hybrid",
+        limit: int = 20
+    ) -> List[SearchHit]:
+        """
+        Search a user's messages and notes
+
+        Args:
+            user_id: User ID
+            query: Search text
+            source_types: Any of "message" and "note"
+            mode: "keyword" (substring), "semantic" (embedding similarity) or
+                "hybrid" (reciprocal rank fusion of both)
+            limit: Maximum number of hits
+
+        Returns:
+            Hits sorted by score, with ``record`` set to the loaded row
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+
+        # Over-fetch so deleted or missing rows can be dropped afterwards
+        candidates = limit * 3
+        scores: Dict[Tuple[str, int], float] = {}
+
+        if mode in ("semantic", "hybrid"):
+            semantic = await self._semantic_ranking(user_id, query, source_types, candidates)
+            for rank, (source_type, source_id, similarity) in enumerate(semantic):
+                key = (source_type, source_id)
+                scores[key] = similarity if mode == "semantic" else 1.0 / (RRF_K + rank + 1)
+
+        if mode in ("keyword", "hybrid"):
+            keyword = self._keyword_ranking(user_id, query, source_types, candidates)
+            for rank, key in enumerate(keyword):
+                rrf = 1.0 / (RRF_K + rank + 1)
+                scores[key] = scores.get(key, 0.0) + rrf if mode == "hybrid" else rrf
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return self._load_records(user_id, ranked)[:limit]
+
+    def _load_records(self, user_id: int, ranked: List[Tuple[Tuple[str, int], float]]) -> List[SearchHit]:
+        note_ids = [source_id for (source_type, source_id), _ in ranked if source_type == SOURCE_NOTE]
+        message_ids = [source_id for (source_type, source_id), _ in ranked if source_type == SOURCE_MESSAGE]
+
+        records: Dict[Tuple[str, int], Any] = {}
+        if note_ids:
+            for note in self.db.query(Note).filter(
+                Note.id.in_(note_ids),
+                Note.user_id == user_id,
+                Note.is_deleted == False
+            ).all():
+                records[(SOURCE_NOTE, note.id)] = note
+        if message_ids:
+            for message in self.db.query(ChatMessage).filter(
+                ChatMessage.id.in_(message_ids),
+                ChatMessage.user_id == user_id
+            ).all():
+                records[(SOURCE_MESSAGE, message.id)] = message
+
+        return [
+            SearchHit(source_type=key[0], source_id=key[1], score=round(score, 6), record=records[key])
+            for key, score in ranked if key in records
+        ]
@@ -0,0 +1,143 @@
+"""Server-sent event encoding and token coalescing for streamed responses"""
+import asyncio
+import json
+from dataclasses import replace
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from config import SSE_COALESCE_WINDOW, SSE_COALESCE_MAX_CHARS
+from .cloud_providers.base import CompletionChunk
+from .chat_events import ChatEvent
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library encoder is used without it
+    orjson = None
+
+
+def encode_event(data: Dict[str, Any]) -> str:
+    """
+    Frame a payload as one SSE ``data:`` event
+
+    Args:
+        data: JSON-serializable event payload
+
+    Returns:
+        The event including the terminating blank line
+    """
+    if orjson is not None:
+        body = orjson.dumps(data).decode("utf-8")
+    else:
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"data: {body}\n\n"
+
+
+async def encode_events(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Frame every payload of an event stream (see ``encode_event``)"""
+    async for event in events:
+        yield encode_event(event)
+
+
+async def encode_chat_events(events: AsyncIterator[ChatEvent]) -> AsyncIterator[str]:
+    """Frame typed chat events for HTTP clients, skipping events without a payload"""
+    async for event in events:
+        payload = event.to_payload()
+        if payload is not None:
+            yield encode_event(payload)
+
+
+def _mergeable(chunk: CompletionChunk) -> bool:
+    return bool(chunk.content) and not chunk.done and chunk.prompt_tokens is None and chunk.completion_tokens is None
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterator[CompletionChunk],
+    window: float = SSE_COALESCE_WINDOW,
+    max_chars: int = SSE_COALESCE_MAX_CHARS
+) -> AsyncIterator[CompletionChunk]:
+    """
+    Merge consecutive content chunks so fast models produce fewer events
+
+    The first content chunk is passed through immediately (time to first
+    token is unchanged). Later content is held for at most ``window``
+    seconds or until ``max_chars`` characters are buffered; chunks carrying
+    token counts or ``done`` flush the buffer and are passed through as is.
+
+    Args:
+        chunks: Provider stream
+        window: Seconds content may be held back (0 disables coalescing)
+        max_chars: Buffered characters that force a flush
+
+    Yields:
+        CompletionChunk objects with the same concatenated content
+    """
+    if window <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    iterator = chunks.__aiter__()
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    buffered = 0
+    flush_at = 0.0
+    template: Optional[CompletionChunk] = None
+    started = False
+    # Pending read of the next chunk while content is buffered; it is not
+    # cancelled on a flush timeout, the next iteration awaits it instead
+    next_chunk: Optional[asyncio.Future] = None
+
+    def flush() -> CompletionChunk:
+        nonlocal buffered
+        merged = replace(template, content="".join(buffer))
+        buffer.clear()
+        buffered = 0
+        return merged
+
+    try:
+        while True:
+            if next_chunk is None and not buffer:
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(iterator.__anext__())
+                if buffer:
+                    done, _ = await asyncio.wait((next_chunk,), timeout=max(flush_at - loop.time(), 0.0))
+                    if not done:
+                        yield flush()
+                        continue
+                pending, next_chunk = next_chunk, None
+                try:
+                    chunk = await pending
+                except StopAsyncIteration:
+                    break
+
+            if started and _mergeable(chunk):
+                if not buffer:
+                    template = chunk
+                    flush_at = loop.time() + window
+                buffer.append(chunk.content)
+                buffered += len(chunk.content)
+                if buffered >= max_chars:
+                    yield flush()
+                continue
+
+            if buffer:
+                yield flush()
+            started = started or bool(chunk.content)
+            yield chunk
+
+        if buffer:
+            yield flush()
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
+            try:
+                await next_chunk
+            except (asyncio.CancelledError, StopAsyncIteration, Exception):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
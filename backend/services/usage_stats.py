@@ -0,0 +1,340 @@
+"""Incrementally maintained per-model usage statistics"""
+from datetime import datetime, date
+from typing import Optional, List, Dict, Any
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import (
+    ChatMessage,
+    MessageFeedback,
+    DebateMessage,
+    DebateSession,
+    DebateParticipant,
+    ModelUsageStat,
+)
+from .job_queue import JobQueue
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+USAGE_STATS_REBUILD_JOB = "usage_stats_rebuild"
+
+COUNTER_COLUMNS = (
+    "chat_messages",
+    "debate_messages",
+    "prompt_tokens",
+    "completion_tokens",
+    "positive_feedback",
+    "negative_feedback",
+)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        # SQLite returns date() as text
+        return date.fromisoformat(value[:10])
+    return datetime.utcnow().date()
+
+
+def schedule_usage_stats_rebuild(db: Session, user_id: Optional[int] = None):
+    """
+    Queue a rebuild of the usage rollup from the source tables
+
+    Args:
+        db: Database session
+        user_id: Only rebuild this user's rows (all users when omitted)
+
+    Returns:
+        The queued BackgroundJob
+    """
+    return JobQueue(db).enqueue(
+        USAGE_STATS_REBUILD_JOB,
+        payload={"user_id": user_id},
+        user_id=user_id,
+        dedupe_key=f"usage-stats:{user_id if user_id is not None else 'all'}"
+    )
+
+
+class UsageStats:
+    """Maintains and queries the ``model_usage_stats`` rollup
+
+    Writers call ``record`` with deltas inside their own transaction, so the
+    rollup commits (or rolls back) together with the row it counts. Counts are
+    bucketed per user, model and UTC day; reading stats touches one row per
+    model and day instead of every message.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record(
+        self,
+        user_id: Optional[int],
+        model: Optional[str],
+        day: Optional[date] = None,
+        **deltas: int
+    ) -> None:
+        """
+        Add deltas to a user/model/day bucket (the caller commits)
+
+        Args:
+            user_id: User the usage belongs to
+            model: Model name
+            day: UTC day (today when omitted)
+            **deltas: Increments for any of COUNTER_COLUMNS (negative to subtract)
+        """
+        deltas = {column: int(value or 0) for column, value in deltas.items() if value}
+        if user_id is None or not model or not deltas:
+            return
+        unknown = set(deltas) - set(COUNTER_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown usage counters: {', '.join(sorted(unknown))}")
+
+        day = _as_date(day) if day is not None else datetime.utcnow().date()
+        values = {column: deltas.get(column, 0) for column in COUNTER_COLUMNS}
+        dialect = self.db.get_bind().dialect.name
+
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(ModelUsageStat).values(
+                user_id=user_id, model=model, day=day, updated_at=datetime.utcnow(), **values
+            )
+            table = ModelUsageStat.__table__.c
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "model", "day"],
+                set_={
+                    **{column: table[column] + stmt.excluded[column] for column in deltas},
+                    "updated_at": stmt.excluded.updated_at,
+                }
+            )
+            self.db.execute(stmt)
+            return
+
+        # Other databases: read-modify-write
+        row = self.db.query(ModelUsageStat).filter(
+            ModelUsageStat.user_id == user_id,
+            ModelUsageStat.model == model,
+            ModelUsageStat.day == day
+        ).with_for_update().first()
+        if row is None:
+            self.db.add(ModelUsageStat(user_id=user_id, model=model, day=day, **values))
+        else:
+            for column, value in deltas.items():
+                setattr(row, column, (getattr(row, column) or 0) + value)
+
+    def record_chat_message(self, message: ChatMessage, sign: int = 1) -> None:
+        """Count (or with sign=-1 uncount) a chat message"""
+        self.record(
+            message.user_id,
+            message.model,
+            message.created_at,
+            chat_messages=sign,
+            prompt_tokens=sign * (message.prompt_tokens or 0),
+            completion_tokens=sign * (message.completion_tokens or 0)
+        )
+
+    def record_debate_message(self, message: DebateMessage, sign: int = 1) -> None:
+        """Count (or uncount) a debate participant message; moderator messages are not counted"""
+        if message.participant_id is None:
+            return
+        row = self.db.query(DebateSession.creator_id, DebateParticipant.model_name).join(
+            DebateParticipant, DebateParticipant.debate_session_id == DebateSession.id
+        ).filter(
+            DebateSession.id == message.debate_session_id,
+            DebateParticipant.id == message.participant_id
+        ).first()
+        if row is None:
+            return
+        self.record(
+            row.creator_id,
+            row.model_name,
+            message.created_at,
+            debate_messages=sign,
+            prompt_tokens=sign * (message.prompt_tokens or 0),
+            completion_tokens=sign * (message.completion_tokens or 0)
+        )
+
+    def record_feedback(self, feedback: MessageFeedback, sign: int = 1) -> None:
+        """Count (or uncount) a feedback entry"""
+        column = "positive_feedback" if feedback.feedback_type == "positive" else "negative_feedback"
+        if feedback.feedback_type not in ("positive", "negative"):
+            return
+        self.record(feedback.user_id, feedback.model, feedback.created_at, **{column: sign})
+
+    def remove_debate(self, debate_id: int) -> None:
+        """Subtract all counted messages of a debate before it is deleted (the caller commits)"""
+        rows = self.db.query(
+            DebateSession.creator_id,
+            DebateParticipant.model_name,
+            func.date(DebateMessage.created_at).label("day"),
+            func.count(DebateMessage.id).label("messages"),
+            func.sum(func.coalesce(DebateMessage.prompt_tokens, 0)).label("prompt_tokens"),
+            func.sum(func.coalesce(DebateMessage.completion_tokens, 0)).label("completion_tokens"),
+        ).join(
+            DebateSession, DebateSession.id == DebateMessage.debate_session_id
+        ).join(
+            DebateParticipant, DebateParticipant.id == DebateMessage.participant_id
+        ).filter(
+            DebateMessage.debate_session_id == debate_id
+        ).group_by(
+            DebateSession.creator_id, DebateParticipant.model_name, func.date(DebateMessage.created_at)
+        ).all()
+
+        for row in rows:
+            self.record(
+                row.creator_id,
+                row.model_name,
+                _as_date(row.day),
+                debate_messages=-row.messages,
+                prompt_tokens=-(row.prompt_tokens or 0),
+                completion_tokens=-(row.completion_tokens or 0)
+            )
+
+    def rebuild(self, user_id: Optional[int] = None) -> int:
+        """
+        Recompute the rollup from chat messages, debate messages and feedback
+
+        Args:
+            user_id: Only rebuild this user's rows (all users when omitted)
+
+        Returns:
+            Number of rollup rows written
+        """
+        buckets: Dict[tuple, Dict[str, int]] = {}
+
+        def bucket(owner, model, day) -> Dict[str, int]:
+            key = (owner, model, _as_date(day))
+            if key not in buckets:
+                buckets[key] = {column: 0 for column in COUNTER_COLUMNS}
+            return buckets[key]
+
+        chat_day = func.date(ChatMessage.created_at)
+        chat_query = self.db.query(
+            ChatMessage.user_id,
+            ChatMessage.model,
+            chat_day.label("day"),
+            func.count(ChatMessage.id).label("messages"),
+            func.sum(func.coalesce(ChatMessage.prompt_tokens, 0)).label("prompt_tokens"),
+            func.sum(func.coalesce(ChatMessage.completion_tokens, 0)).label("completion_tokens"),
+        ).filter(ChatMessage.model.isnot(None), ChatMessage.user_id.isnot(None))
+        if user_id is not None:
+            chat_query = chat_query.filter(ChatMessage.user_id == user_id)
+        for row in chat_query.group_by(ChatMessage.user_id, ChatMessage.model, chat_day):
+            counters = bucket(row.user_id, row.model, row.day)
+            counters["chat_messages"] += row.messages
+            counters["prompt_tokens"] += row.prompt_tokens or 0
+            counters["completion_tokens"] += row.completion_tokens or 0
+
+        debate_day = func.date(DebateMessage.created_at)
+        debate_query = self.db.query(
+            DebateSession.creator_id,
+            DebateParticipant.model_name,
+            debate_day.label("day"),
+            func.count(DebateMessage.id).label("messages"),
+            func.sum(func.coalesce(DebateMessage.prompt_tokens, 0)).label("prompt_tokens"),
+            func.sum(func.coalesce(DebateMessage.completion_tokens, 0)).label("completion_tokens"),
+        ).join(
+            DebateSession, DebateSession.id == DebateMessage.debate_session_id
+        ).join(
+            DebateParticipant, DebateParticipant.id == DebateMessage.participant_id
+        ).filter(DebateSession.creator_id.isnot(None))
+        if user_id is not None:
+            debate_query = debate_query.filter(DebateSession.creator_id == user_id)
+        for row in debate_query.group_by(DebateSession.creator_id, DebateParticipant.model_name, debate_day):
+            counters = bucket(row.creator_id, row.model_name, row.day)
+            counters["debate_messages"] += row.messages
+            counters["prompt_tokens"] += row.prompt_tokens or 0
+            counters["completion_tokens"] += row.completion_tokens or 0
+
+        feedback_day = func.date(MessageFeedback.created_at)
+        feedback_query = self.db.query(
+            MessageFeedback.user_id,
+            MessageFeedback.model,
+            MessageFeedback.feedback_type,
+            feedback_day.label("day"),
+            func.count(MessageFeedback.id).label("count"),
+        ).filter(
+            MessageFeedback.model.isnot(None),
+            MessageFeedback.feedback_type.in_(["positive", "negative"])
+        )
+        if user_id is not None:
+            feedback_query = feedback_query.filter(MessageFeedback.user_id == user_id)
+        for row in feedback_query.group_by(
+            MessageFeedback.user_id, MessageFeedback.model, MessageFeedback.feedback_type, feedback_day
+        ):
+            counters = bucket(row.user_id, row.model, row.day)
+            counters[f"{row.feedback_type}_feedback"] += row.count
+
+        delete_query = self.db.query(ModelUsageStat)
+        if user_id is not None:
+            delete_query = delete_query.filter(ModelUsageStat.user_id == user_id)
+        delete_query.delete(synchronize_session=False)
+
+        self.db.bulk_insert_mappings(ModelUsageStat, [
+            {"user_id": owner, "model": model, "day": day, "updated_at": datetime.utcnow(), **counters}
+            for (owner, model, day), counters in buckets.items()
+        ])
+        self.db.commit()
+        logger.info(f"Rebuilt {len(buckets)} usage stat rows" + (f" for user {user_id}" if user_id is not None else ""))
+        return len(buckets)
+
+    def query(
+        self,
+        user_id: int,
+        model: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Per-model totals for a user
+
+        Args:
+            user_id: User ID
+            model: Only this model
+            start_date: First UTC day included
+            end_date: Last UTC day included
+
+        Returns:
+            One dict per model in the feedback stats response format
+        """
+        query = self.db.query(
+            ModelUsageStat.model,
+            *[func.sum(getattr(ModelUsageStat, column)).label(column) for column in COUNTER_COLUMNS]
+        ).filter(ModelUsageStat.user_id == user_id)
+        if model:
+            query = query.filter(ModelUsageStat.model == model)
+        if start_date:
+            query = query.filter(ModelUsageStat.day >= start_date)
+        if end_date:
+            query = query.filter(ModelUsageStat.day <= end_date)
+
+        stats = []
+        for row in query.group_by(ModelUsageStat.model).all():
+            total_messages = (row.chat_messages or 0) + (row.debate_messages or 0)
+            if not total_messages:
+                continue
+            positive = row.positive_feedback or 0
+            negative = row.negative_feedback or 0
+            prompt_tokens = int(row.prompt_tokens or 0)
+            completion_tokens = int(row.completion_tokens or 0)
+            stats.append({
+                "model": row.model,
+                "total_messages": total_messages,
+                "chat_messages": row.chat_messages or 0,
+                "debate_messages": row.debate_messages or 0,
+                "total_prompt_tokens": prompt_tokens,
+                "total_completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "positive_feedback_count": positive,
+                "negative_feedback_count": negative,
+                "total_feedback_count": positive + negative,
+            })
+        return stats
@@ -0,0 +1,232 @@
+"""On-disk embedding cache backed by memory-mapped float32 files"""
+import hashlib
+import json
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Dict, List, Tuple
+
+import numpy as np
+
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES
+from logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: without file locks only one process may write a cache
+    fcntl = None
+
+logger = get_logger(__name__)
+
+DIGEST_SIZE = 32  # sha256 digest bytes per index row
+
+
+def text_digest(text: str) -> bytes:
+    """sha256 digest used as the cache key for a text"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class VectorCache:
+    """Append-only vector cache for one embedding model
+
+    Three files per model live in ``EMBEDDING_CACHE_DIR``:
+
+    - ``{model}.json``: vector dimension
+    - ``{model}.idx``: 32-byte text digests, one per row
+    - ``{model}.f32``: float32 vectors, read through ``np.memmap``
+
+    - ``{model}.lock``: ``flock`` held while the files are read or appended
+
+    Several processes (API workers, job workers) share the files: appends take
+    the file lock and first pick up rows other processes appended, so the row
+    of every digest is its position in the files. Vectors are written before
+    their digest, so a row only becomes visible once both are on disk; rows of
+    a writer that crashed in between are truncated under the lock, so later
+    appends line up again.
+    """
+
+    _instances: Dict[str, "VectorCache"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, model: str, cache_dir: Path = EMBEDDING_CACHE_DIR):
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self.model = model
+        self.meta_path = cache_dir / f"{slug}.json"
+        self.index_path = cache_dir / f"{slug}.idx"
+        self.vectors_path = cache_dir / f"{slug}.f32"
+        self.lock_path = cache_dir / f"{slug}.lock"
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._row_count = 0  # Rows in the files (a digest appended by two processes has two)
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._full_logged = False
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def for_model(cls, model: str) -> "VectorCache":
+        """Shared cache instance for a model (one per process)"""
+        with cls._instances_lock:
+            cache = cls._instances.get(model)
+            if cache is None:
+                cache = cls(model)
+                cls._instances[model] = cache
+            return cache
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Exclusive lock shared with the other processes using the cache files"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        with self._lock, self._file_lock():
+            self._sync()
+        if self._row_count:
+            logger.info(f"Loaded {self._row_count} cached embeddings for {self.model}")
+
+    def _read_dim(self) -> Optional[int]:
+        if not self.meta_path.exists():
+            return None
+        try:
+            return int(json.loads(self.meta_path.read_text())["dim"])
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning(f"Ignoring unreadable embedding cache metadata {self.meta_path}: {e}")
+            return None
+
+    def _sync(self) -> None:
+        """
+        Catch up with the files (call with the file lock held)
+
+        Rows appended by other processes are added to the digest map, a torn
+        write is truncated, and the map is rebuilt if the files were cleared.
+        """
+        if self.dim is None:
+            self.dim = self._read_dim()
+            if self.dim is None:
+                return
+
+        digest_rows = self.index_path.stat().st_size // DIGEST_SIZE if self.index_path.exists() else 0
+        vector_rows = self.vectors_path.stat().st_size // (4 * self.dim) if self.vectors_path.exists() else 0
+        rows = min(digest_rows, vector_rows)
+        self._truncate(rows)
+
+        if rows < self._row_count:
+            # Cleared (and possibly refilled) since this process read the files
+            self._rows = {}
+            self._row_count = 0
+            self._matrix = None
+        if rows > self._row_count:
+            with open(self.index_path, "rb") as f:
+                f.seek(self._row_count * DIGEST_SIZE)
+                digests = f.read((rows - self._row_count) * DIGEST_SIZE)
+            for i in range(rows - self._row_count):
+                self._rows[digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]] = self._row_count + i
+            self._row_count = rows
+
+    def _truncate(self, rows: int) -> None:
+        """Drop the tail of a torn write so appends start right after ``rows``"""
+        for path, size in ((self.index_path, rows * DIGEST_SIZE), (self.vectors_path, rows * 4 * self.dim)):
+            if path.exists() and path.stat().st_size > size:
+                logger.warning(f"Truncating {path} to {rows} rows after an incomplete write")
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _matrix_view(self) -> Optional[np.memmap]:
+        """Memory map covering every known row (remapped after appends)"""
+        rows = self._row_count
+        if rows == 0 or self.dim is None:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, digests: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Look up cached vectors
+
+        Args:
+            digests: Text digests from ``text_digest``
+
+        Returns:
+            Mapping of found digests to vectors (copies, safe to keep)
+        """
+        with self._lock:
+            matrix = self._matrix_view()
+            if matrix is None:
+                return {}
+            found = {}
+            for digest in digests:
+                row = self._rows.get(digest)
+                if row is not None:
+                    found[digest] = np.array(matrix[row])
+            return found
+
+    def put_many(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        """
+        Append vectors to the cache
+
+        Args:
+            items: (digest, vector) pairs; already cached digests are skipped
+        """
+        if not items:
+            return
+        with self._lock, self._file_lock():
+            self._sync()
+            if self.dim is None:
+                self.dim = int(items[0][1].shape[0])
+                self.meta_path.write_text(json.dumps({"model": self.model, "dim": self.dim}))
+
+            new_items = []
+            seen = set()
+            for digest, vector in items:
+                if digest in self._rows or digest in seen:
+                    continue
+                if vector.shape[0] != self.dim:
+                    logger.warning(f"Not caching {vector.shape[0]}-dim vector for {self.model} (cache holds {self.dim})")
+                    continue
+                seen.add(digest)
+                new_items.append((digest, vector))
+
+            room = EMBEDDING_CACHE_MAX_ENTRIES - self._row_count
+            if len(new_items) > room:
+                if not self._full_logged:
+                    logger.warning(f"Embedding cache for {self.model} is full ({EMBEDDING_CACHE_MAX_ENTRIES} entries)")
+                    self._full_logged = True
+                new_items = new_items[:max(room, 0)]
+            if not new_items:
+                return
+
+            start_row = self._row_count
+            block = np.vstack([np.asarray(vector, dtype=np.float32) for _, vector in new_items])
+            with open(self.vectors_path, "ab") as f:
+                f.write(block.tobytes())
+            with open(self.index_path, "ab") as f:
+                f.write(b"".join(digest for digest, _ in new_items))
+            for offset, (digest, _) in enumerate(new_items):
+                self._rows[digest] = start_row + offset
+            self._row_count += len(new_items)
+
+    def clear(self) -> None:
+        """Delete the cache files for this model (maintenance: other processes must not be using the cache)"""
+        with self._lock, self._file_lock():
+            self._matrix = None
+            self._rows = {}
+            self._row_count = 0
+            self.dim = None
+            for path in (self.meta_path, self.index_path, self.vectors_path):
+                if path.exists():
+                    path.unlink()
@@ -0,0 +1,24 @@
+"""Shared fixtures: an in-memory SQLite database with the full schema"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+import models  # noqa: F401  (registers the tables)
+
+
+@pytest.fixture
+def session_factory():
+    """Sessionmaker bound to a fresh in-memory database shared by all its sessions"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
@@ -0,0 +1,24 @@
+"""Tests for deciding when retrieved passages replace page images"""
+from models import Document
+from services.document_index import DocumentIndex, STATUS_READY, STATUS_EMPTY, STATUS_PENDING
+
+
+def _document(doc_id: int, status: str, chunk_count: int = 0) -> Document:
+    return Document(id=doc_id, status=status, chunk_count=chunk_count)
+
+
+def test_ready_document_with_chunks_is_searchable():
+    assert DocumentIndex.is_searchable([_document(1, STATUS_READY, 3)], [1])
+
+
+def test_image_or_scanned_document_is_not_searchable():
+    assert not DocumentIndex.is_searchable([_document(1, STATUS_EMPTY)], [1])
+
+
+def test_document_still_indexing_is_not_searchable():
+    documents = [_document(1, STATUS_READY, 3), _document(2, STATUS_PENDING)]
+    assert not DocumentIndex.is_searchable(documents, [1, 2])
+
+
+def test_turn_without_attached_documents_keeps_images():
+    assert not DocumentIndex.is_searchable([_document(1, STATUS_READY, 3)], [])
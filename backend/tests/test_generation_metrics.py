@@ -0,0 +1,49 @@
+"""Tests for generation timing and latency percentiles"""
+from models import ChatMessage
+from services import generation_metrics
+from services.cloud_providers.base import CompletionChunk, CompletionResult
+from services.generation_metrics import GenerationTimer, LatencyStats
+from services.rate_limiter import ProviderBudget
+
+
+def test_reservation_records_the_queue_wait():
+    budget = ProviderBudget("test", rpm=60, tpm=0)
+    first, wait = budget.reserve(1, max_wait=0)
+    assert wait == first.wait == 0
+
+    budget.requests.level = 0
+    second, wait = budget.reserve(1, max_wait=5)
+    assert 0.9 < second.wait == wait <= 1
+
+
+def test_queue_time_is_not_counted_as_decoding(monkeypatch):
+    clock = iter([0.0, 2.0, 2.0])
+    monkeypatch.setattr(generation_metrics.time, "perf_counter", lambda: next(clock))
+    timer = GenerationTimer()
+    timer.observe_result(CompletionResult(content="answer", queue_ms=1000.0))
+
+    metrics = timer.finish(completion_tokens=100)
+
+    assert metrics.queue_ms == 1000.0
+    assert metrics.total_duration_ms == 2000.0
+    assert metrics.tokens_per_second == 100.0
+
+
+def test_stream_takes_queue_time_from_the_first_chunk():
+    timer = GenerationTimer()
+    timer.observe(CompletionChunk(content="a", queue_ms=250.0))
+    timer.observe(CompletionChunk(content="b"))
+
+    assert timer.finish().queue_ms == 250.0
+
+
+def test_latency_stats_include_queue_time(db):
+    for queue_ms in (0.0, 100.0, 200.0):
+        db.add(ChatMessage(user_id=1, role="assistant", model="cloud", total_duration_ms=500.0, queue_ms=queue_ms))
+    db.add(ChatMessage(user_id=1, role="assistant", model="local", total_duration_ms=500.0))
+    db.commit()
+
+    stats = {row["model"]: row for row in LatencyStats(db).query(1)}
+
+    assert stats["cloud"]["queue_ms"]["p50"] == 100.0
+    assert stats["local"]["queue_ms"]["p50"] is None
@@ -0,0 +1,110 @@
+"""Tests for the persistent job queue"""
+from datetime import datetime, timedelta
+
+from config import JOB_LEASE_TIMEOUT
+from models import BackgroundJob
+from services import job_queue
+from services.job_queue import JobQueue
+
+
+def _claim_long_ago(queue: JobQueue, worker_id: str) -> BackgroundJob:
+    queue.enqueue("test")
+    job = queue.claim(worker_id, ["test"])
+    job.locked_at = datetime.utcnow() - timedelta(seconds=JOB_LEASE_TIMEOUT + 60)
+    queue.db.commit()
+    return job
+
+
+def test_claim_takes_oldest_runnable_job_of_known_types(db):
+    queue = JobQueue(db)
+    first = queue.enqueue("test")
+    queue.enqueue("other")
+    queue.enqueue("test", delay=3600)
+    second = queue.enqueue("test")
+
+    job = queue.claim("worker", ["test"])
+    assert job.id == first.id
+    assert job.status == JobQueue.STATUS_RUNNING
+    assert job.attempts == 1
+    assert job.locked_by == "worker"
+
+    assert queue.claim("worker", ["test"]).id == second.id
+    # The delayed job is not runnable yet
+    assert queue.claim("worker", ["test"]) is None
+
+
+def test_dedupe_key_returns_pending_job(db):
+    queue = JobQueue(db)
+    job = queue.enqueue("test", dedupe_key="k")
+    assert queue.enqueue("test", dedupe_key="k").id == job.id
+
+    queue.mark_succeeded(queue.claim("worker", ["test"]))
+    assert queue.enqueue("test", dedupe_key="k").id != job.id
+
+
+def test_failed_job_is_retried_with_backoff_until_attempts_run_out(db, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BASE_DELAY", 10.0)
+    queue = JobQueue(db)
+    queue.enqueue("test", max_attempts=2)
+
+    job = queue.claim("worker", ["test"])
+    assert queue.mark_failed(job, "boom")
+    assert job.status == JobQueue.STATUS_QUEUED
+    assert job.last_error == "boom"
+    assert 5 <= (job.run_after - datetime.utcnow()).total_seconds() <= 10
+    assert queue.claim("worker", ["test"]) is None
+
+    job.run_after = datetime.utcnow()
+    db.commit()
+    job = queue.claim("worker", ["test"])
+    assert job.attempts == 2
+    assert not queue.mark_failed(job, "boom again")
+    assert job.status == JobQueue.STATUS_FAILED
+    assert job.finished_at is not None
+
+
+def test_release_does_not_count_the_attempt(db):
+    queue = JobQueue(db)
+    queue.enqueue("test")
+    job = queue.claim("worker", ["test"])
+    queue.release(job)
+
+    job = queue.claim("worker", ["test"])
+    assert job.attempts == 1
+
+
+def test_per_user_concurrency_cap(db, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_PER_USER_CONCURRENCY", 1)
+    queue = JobQueue(db)
+    queue.enqueue("test", user_id=1)
+    queue.enqueue("test", user_id=1)
+    other = queue.enqueue("test", user_id=2)
+
+    running = queue.claim("worker", ["test"])
+    assert running.user_id == 1
+    # User 1 is at the cap, so user 2's later job goes first
+    assert queue.claim("worker", ["test"]).id == other.id
+    assert queue.claim("worker", ["test"]) is None
+
+    queue.mark_succeeded(running)
+    assert queue.claim("worker", ["test"]).user_id == 1
+
+
+def test_heartbeat_keeps_long_running_job(db):
+    queue = JobQueue(db)
+    job = _claim_long_ago(queue, "worker")
+
+    assert queue.heartbeat(job.id, "worker")
+    assert queue.requeue_stale() == 0
+    db.refresh(job)
+    assert job.status == JobQueue.STATUS_RUNNING
+
+
+def test_job_without_heartbeat_is_requeued(db):
+    queue = JobQueue(db)
+    job = _claim_long_ago(queue, "worker")
+
+    assert queue.requeue_stale() == 1
+    assert not queue.heartbeat(job.id, "worker")
+    db.refresh(job)
+    assert job.status == JobQueue.STATUS_QUEUED
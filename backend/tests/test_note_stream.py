@@ -0,0 +1,88 @@
+"""Tests for lining up the note stream snapshot with live chunks"""
+import asyncio
+import json
+
+import pytest
+
+from models import Note
+from routers import notes
+from services.note_stream import note_stream_broker
+
+
+@pytest.fixture
+def note(db, session_factory, monkeypatch):
+    monkeypatch.setattr(notes, "SessionLocal", session_factory)
+    row = Note(user_id=1, title="", content="", status="generating")
+    db.add(row)
+    db.commit()
+    return row
+
+
+def _commit(db, note: Note, content: str) -> None:
+    note.content = content
+    db.commit()
+
+
+def _replay(events) -> str:
+    """Text a client builds from the stream"""
+    text = ""
+    for raw in events:
+        event = json.loads(raw.removeprefix("data: "))
+        if event.get("reset"):
+            text = ""
+        elif event.get("snapshot"):
+            text = event["content"]
+        elif "content" in event:
+            text += event["content"]
+    return text
+
+
+async def _stream(note_id: int, publish_after_snapshot):
+    stream = notes._note_event_stream(note_id)
+    events = [await stream.__anext__()]
+    for event in publish_after_snapshot:
+        note_stream_broker.publish(note_id, event)
+    async for raw in stream:
+        events.append(raw)
+    return events
+
+
+def test_chunks_in_snapshot_are_not_repeated(db, note):
+    # The commit already holds "wor", which is also still queued for the subscriber
+    _commit(db, note, "Hello wor")
+    events = asyncio.run(_stream(note.id, [
+        {"content": "wor", "offset": 6},
+        {"content": "ld", "offset": 9},
+        {"done": True, "title": "Hello world", "status": "completed", "content": "Hello world"},
+    ]))
+    assert _replay(events) == "Hello world"
+
+
+def test_chunks_missed_before_subscribing_are_recovered_on_done(db, note):
+    # "wor" was published after the last commit but before the subscription
+    _commit(db, note, "Hello ")
+    events = asyncio.run(_stream(note.id, [
+        {"content": "ld", "offset": 9},
+        {"done": True, "title": "Hello world", "status": "completed", "content": "Hello world"},
+    ]))
+    assert _replay(events) == "Hello world"
+    assert json.loads(events[-1].removeprefix("data: "))["done"]
+
+
+def test_gap_is_filled_from_the_database(db, note, monkeypatch):
+    monkeypatch.setattr(notes.time, "monotonic", iter(range(0, 1000, 10)).__next__)
+    _commit(db, note, "Hello ")
+
+    async def run():
+        stream = notes._note_event_stream(note.id)
+        events = [await stream.__anext__()]
+        # The generator committed "Hello wor" since the snapshot; "wor" never reached the queue
+        _commit(db, note, "Hello wor")
+        note_stream_broker.publish(note.id, {"content": "ld", "offset": 9})
+        events.append(await stream.__anext__())
+        events.append(await stream.__anext__())
+        await stream.aclose()
+        return events
+
+    events = asyncio.run(run())
+    assert _replay(events) == "Hello world"
@@ -0,0 +1,164 @@
+"""Tests for routing and failover across Ollama backends"""
+import asyncio
+import socket
+
+import httpx
+import pytest
+
+from benchmarks.stub_ollama import create_app, StubServer
+from services import ollama_pool as pool_module
+from services.cloud_providers import ollama as ollama_provider
+from services.cloud_providers.base import ProviderError
+from services.cloud_providers.ollama import OllamaProvider
+from services.ollama_pool import OllamaPool
+
+MODEL = "stub-chat"
+
+
+def _pool(*names: str) -> OllamaPool:
+    pool = OllamaPool([f"http://{name}" for name in names])
+    for backend in pool.backends:
+        backend.models = {f"{MODEL}:latest"}
+    return pool
+
+
+def _urls(backends) -> list:
+    return [backend.url.removeprefix("http://") for backend in backends]
+
+
+def test_route_prefers_sticky_then_resident_then_least_loaded():
+    pool = _pool("a", "b", "c")
+    a, b, c = pool.backends
+    a.in_flight, b.in_flight, c.in_flight = 5, 0, 1
+    a.resident = {f"{MODEL}:latest"}
+
+    assert _urls(pool.route(MODEL)) == ["a", "b", "c"]
+
+    pool.pin("session", c)
+    assert _urls(pool.route(MODEL, "session")) == ["c", "a", "b"]
+    # Other sessions are not affected
+    assert _urls(pool.route(MODEL, "other")) == ["a", "b", "c"]
+
+
+def test_expired_stickiness_is_ignored(monkeypatch):
+    monkeypatch.setattr(pool_module, "OLLAMA_STICKY_TTL", -1)
+    pool = _pool("a", "b")
+    pool.backends[0].in_flight = 1
+    pool.pin("session", pool.backends[0])
+
+    assert _urls(pool.route(MODEL, "session")) == ["b", "a"]
+
+
+def test_sticky_sessions_are_bounded(monkeypatch):
+    monkeypatch.setattr(pool_module, "STICKY_MAX_SESSIONS", 2)
+    pool = _pool("a", "b")
+    for session in ("s1", "s2", "s3"):
+        pool.pin(session, pool.backends[1])
+
+    assert list(pool._sticky) == ["s2", "s3"]
+
+
+def test_backends_without_the_model_come_last():
+    pool = _pool("a", "b")
+    pool.backends[0].models = {"other:latest"}
+    pool.backends[1].in_flight = 3
+
+    assert _urls(pool.route(MODEL)) == ["b", "a"]
+
+
+def test_connection_failure_puts_backend_in_cooldown():
+    pool = _pool("a", "b")
+    a = pool.backends[0]
+    error = httpx.ConnectError("refused", request=httpx.Request("POST", a.url))
+
+    assert pool.should_fail_over(a, MODEL, error)
+    assert not a.is_available(pool_module.time.monotonic())
+    assert a.last_error.startswith("ConnectError")
+    # Kept as a last resort after the healthy backends
+    assert _urls(pool.route(MODEL)) == ["b", "a"]
+
+
+def test_missing_model_fails_over_without_cooldown():
+    pool = _pool("a", "b")
+    a = pool.backends[0]
+
+    assert pool.should_fail_over(a, MODEL, ProviderError("model not found", 404))
+    assert a.is_available(pool_module.time.monotonic())
+    assert not a.has_model(MODEL)
+
+
+def test_client_errors_do_not_fail_over():
+    pool = _pool("a", "b")
+
+    assert not pool.should_fail_over(pool.backends[0], MODEL, ProviderError("bad request", 400))
+    assert pool.backends[0].is_available(pool_module.time.monotonic())
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def stubs():
+    """Two stub Ollama servers (the first does not serve the chat model) and a dead URL"""
+    servers = [
+        StubServer(create_app(token_delay=0, tokens=3, models=("other:latest",)), _free_port()),
+        StubServer(create_app(token_delay=0, tokens=3), _free_port()),
+    ]
+    for server in servers:
+        server.__enter__()
+    yield servers, f"http://127.0.0.1:{_free_port()}"
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+def _stream(pool: OllamaPool, monkeypatch, session_id: str = "session") -> str:
+    monkeypatch.setattr(ollama_provider, "ollama_pool", pool)
+    provider = OllamaProvider().for_session(session_id)
+
+    async def run():
+        messages = [{"role": "user", "content": "hi"}]
+        return "".join([chunk.content async for chunk in provider.stream(MODEL, messages)])
+
+    return asyncio.run(run())
+
+
+def test_refresh_reads_models_and_marks_dead_backends(stubs):
+    (without_model, with_model), dead_url = stubs
+    pool = OllamaPool([dead_url, without_model.url, with_model.url])
+
+    asyncio.run(pool.refresh())
+
+    dead, first, second = pool.backends
+    assert not dead.healthy
+    assert first.models == {"other:latest"}
+    assert first.healthy and second.has_model(MODEL)
+    assert _urls(pool.route(MODEL))[0] == with_model.url.removeprefix("http://")
+
+
+def test_stream_fails_over_to_a_backend_that_answers(stubs, monkeypatch):
+    (without_model, with_model), dead_url = stubs
+    # Health checks have not run yet: every backend is assumed to have the model
+    pool = OllamaPool([dead_url, without_model.url, with_model.url])
+    pool.backends[1].in_flight = 1
+    pool.backends[2].in_flight = 2
+
+    assert _stream(pool, monkeypatch)
+
+    dead, first, second = pool.backends
+    assert not dead.is_available(pool_module.time.monotonic())
+    # A missing model is not a backend failure
+    assert first.is_available(pool_module.time.monotonic())
+    assert with_model.app.state.chat_requests == 1
+    assert pool._sticky["session"][0] == second.url
+
+
+def test_stream_without_any_backend_raises_provider_error(stubs, monkeypatch):
+    _, dead_url = stubs
+    pool = OllamaPool([dead_url, f"http://127.0.0.1:{_free_port()}"])
+
+    with pytest.raises(ProviderError) as error:
+        _stream(pool, monkeypatch)
+    assert error.value.status_code == 503
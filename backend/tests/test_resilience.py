@@ -0,0 +1,209 @@
+"""Tests for provider retries, circuit breaking and hedging"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, send_with_resilience
+
+
+def _response(status_code: int, headers=None) -> httpx.Response:
+    return httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "http://upstream/"))
+
+
+class FakeUpstream:
+    """``send`` callable answering from a script of responses, exceptions and delays"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def send(self) -> httpx.Response:
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, tuple):
+            delay, outcome = outcome
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return _response(outcome) if isinstance(outcome, int) else outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff sleeps of send_with_resilience, recorded instead of waited"""
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def test_retryable_status_is_retried_with_backoff(sleeps, monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0.1 * (attempt + 1))
+    upstream = FakeUpstream(503, 502, 200)
+
+    response = asyncio.run(send_with_resilience(upstream.send, "test", max_retries=3))
+
+    assert response.status_code == 200
+    assert upstream.calls == 3
+    assert sleeps == [0.1, 0.2]
+
+
+def test_retry_after_is_honoured(sleeps):
+    upstream = FakeUpstream(_response(429, {"retry-after-ms": "1500"}), 200)
+
+    response = asyncio.run(send_with_resilience(upstream.send, "test", max_retries=2))
+
+    assert response.status_code == 200
+    assert sleeps == [1.5]
+
+
+def test_long_retry_after_is_returned_instead_of_waited(sleeps):
+    upstream = FakeUpstream(_response(429, {"retry-after": "3600"}), 200)
+
+    response = asyncio.run(send_with_resilience(upstream.send, "test", max_retries=2))
+
+    assert response.status_code == 429
+    assert upstream.calls == 1
+    assert sleeps == []
+
+
+def test_last_response_is_returned_when_retries_run_out(sleeps):
+    upstream = FakeUpstream(503)
+
+    response = asyncio.run(send_with_resilience(upstream.send, "test", max_retries=2))
+
+    assert response.status_code == 503
+    assert upstream.calls == 3
+
+
+def test_client_errors_are_not_retried(sleeps):
+    upstream = FakeUpstream(400, 200)
+
+    assert asyncio.run(send_with_resilience(upstream.send, "test", max_retries=2)).status_code == 400
+    assert upstream.calls == 1
+
+
+def test_connect_errors_are_retried(sleeps):
+    request = httpx.Request("POST", "http://upstream/")
+    upstream = FakeUpstream(httpx.ConnectError("refused", request=request), httpx.PoolTimeout("busy"), 200)
+
+    assert asyncio.run(send_with_resilience(upstream.send, "test", max_retries=2)).status_code == 200
+    assert upstream.calls == 3
+
+
+@pytest.mark.parametrize("error", [httpx.ReadError("reset"), httpx.ReadTimeout("slow"), httpx.WriteError("broken")])
+def test_errors_after_the_request_was_sent_are_not_retried(sleeps, error):
+    upstream = FakeUpstream(error, 200)
+
+    with pytest.raises(type(error)):
+        asyncio.run(send_with_resilience(upstream.send, "test", max_retries=2))
+    assert upstream.calls == 1
+
+
+def test_circuit_opens_after_consecutive_failures_and_probes_after_reset():
+    breaker = CircuitBreaker("test-open", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = CircuitBreaker("test-probe", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test-reset", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_stops_retries_and_rejects_without_calling_upstream(sleeps):
+    breaker = CircuitBreaker("test-reject", failure_threshold=1, reset_timeout=60)
+    upstream = FakeUpstream(503)
+
+    # The first failure opens the circuit, so the retry is rejected
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(send_with_resilience(upstream.send, "test", breaker, max_retries=2))
+    assert upstream.calls == 1
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(send_with_resilience(upstream.send, "test", breaker, max_retries=2))
+    assert upstream.calls == 1
+
+
+def test_hedge_answers_when_primary_stalls():
+    upstream = FakeUpstream((10, 200), (0, 201))
+
+    async def run():
+        response = await send_with_resilience(upstream.send, "test", max_retries=0, hedge_delay=0.01)
+        await asyncio.sleep(0)
+        assert upstream.cancelled == 1
+        return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 201
+    assert upstream.calls == 2
+
+
+def test_fast_primary_sends_no_hedge():
+    upstream = FakeUpstream(200)
+
+    response = asyncio.run(send_with_resilience(upstream.send, "test", max_retries=0, hedge_delay=1))
+
+    assert response.status_code == 200
+    assert upstream.calls == 1
+
+
+def test_cancelled_caller_cancels_the_primary_request():
+    upstream = FakeUpstream((10, 200))
+
+    async def run():
+        task = asyncio.ensure_future(send_with_resilience(upstream.send, "test", max_retries=0, hedge_delay=5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        # Checked before asyncio.run cancels leftover tasks on shutdown
+        assert upstream.cancelled == 1
+
+    asyncio.run(run())
+    assert upstream.calls == 1
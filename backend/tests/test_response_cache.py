@@ -0,0 +1,133 @@
+"""Tests for the response cache"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import ResponseCacheEntry
+from services import response_cache
+from services.cloud_providers.base import CompletionChunk, CompletionResult
+from services.response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+GREEDY = {"temperature": 0}
+
+
+class FakeProvider:
+    """Provider answering every request with the same text"""
+
+    def __init__(self, content: str = "answer"):
+        self.content = content
+        self.calls = 0
+
+    async def complete(self, model, messages, api_key=None, options=None):
+        self.calls += 1
+        return CompletionResult(content=self.content, prompt_tokens=3, completion_tokens=1)
+
+    async def stream(self, model, messages, api_key=None, options=None):
+        self.calls += 1
+        for word in self.content.split(" "):
+            yield CompletionChunk(content=word + " ")
+        yield CompletionChunk(done=True, prompt_tokens=3, completion_tokens=2)
+
+
+@pytest.fixture(autouse=True)
+def small_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_MAX_ENTRIES", 2)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_EVICT_EVERY", 3)
+    monkeypatch.setitem(response_cache._stats, "stores", 0)
+
+
+def test_key_ignores_formatting_and_non_output_options():
+    key = ResponseCache.make_key("m", MESSAGES, {"temperature": 0, "keep_alive": "5m"})
+
+    assert key == ResponseCache.make_key("m", [{"role": "user", "content": " hello\r\n"}], {"temperature": 0})
+    assert key != ResponseCache.make_key("m", MESSAGES, {"temperature": 0, "seed": 1})
+    assert key != ResponseCache.make_key("other", MESSAGES, {"temperature": 0})
+
+
+def test_only_greedy_requests_are_cacheable():
+    assert ResponseCache.is_cacheable({"temperature": 0})
+    assert not ResponseCache.is_cacheable({"temperature": 0.7})
+    # The provider's default temperature samples
+    assert not ResponseCache.is_cacheable({})
+    assert ResponseCache.is_cacheable({"temperature": 0.7}, force=True)
+
+
+def test_complete_reads_through_the_cache(db):
+    cache = ResponseCache(db)
+    provider = FakeProvider()
+
+    first = asyncio.run(cache.complete(provider, "m", MESSAGES, options=GREEDY))
+    second = asyncio.run(cache.complete(provider, "m", MESSAGES, options=GREEDY))
+
+    assert provider.calls == 1
+    assert second.content == first.content == "answer"
+    assert second.finish_reason == "cached"
+    assert db.query(ResponseCacheEntry).one().hit_count == 1
+
+
+def test_sampled_requests_bypass_the_cache(db):
+    cache = ResponseCache(db)
+    provider = FakeProvider()
+
+    for _ in range(2):
+        asyncio.run(cache.complete(provider, "m", MESSAGES, options={"temperature": 0.7}))
+
+    assert provider.calls == 2
+    assert db.query(ResponseCacheEntry).count() == 0
+
+
+def test_expired_entries_are_misses(db):
+    cache = ResponseCache(db)
+    key = cache.make_key("m", MESSAGES, GREEDY)
+    cache.set(key, "m", CompletionResult(content="old"))
+    db.query(ResponseCacheEntry).update({ResponseCacheEntry.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+    assert cache.get(key) is None
+
+
+def test_stream_miss_is_stored_and_replayed_as_one_chunk(db):
+    cache = ResponseCache(db)
+    provider = FakeProvider("streamed answer")
+
+    async def collect():
+        return [chunk async for chunk in cache.stream(provider, "m", MESSAGES, options=GREEDY)]
+
+    live = asyncio.run(collect())
+    replay = asyncio.run(collect())
+
+    assert provider.calls == 1
+    assert "".join(chunk.content for chunk in live) == "streamed answer "
+    assert len(replay) == 1
+    assert replay[0].cached and replay[0].done
+    assert replay[0].content == "streamed answer "
+    assert replay[0].completion_tokens == 2
+
+
+def test_eviction_runs_every_nth_store(db):
+    cache = ResponseCache(db)
+    for i in range(2):
+        cache.set(f"key{i}", "model", CompletionResult(content=str(i)))
+    cache.set("key2", "model", CompletionResult(content="2"))
+    assert db.query(ResponseCacheEntry).count() == 2
+
+    for i in range(3, 5):
+        cache.set(f"key{i}", "model", CompletionResult(content=str(i)))
+    assert db.query(ResponseCacheEntry).count() == 4
+
+
+def test_eviction_keeps_the_most_recently_used_entries(db):
+    cache = ResponseCache(db)
+    for i in range(2):
+        cache.set(f"key{i}", "model", CompletionResult(content=str(i)))
+    # key0 is read after key1 was stored
+    db.query(ResponseCacheEntry).filter(ResponseCacheEntry.cache_key == "key1").update(
+        {ResponseCacheEntry.last_accessed_at: datetime.utcnow() - timedelta(minutes=1)}
+    )
+    db.commit()
+    cache.get("key0")
+    cache.set("key2", "model", CompletionResult(content="2"))
+
+    assert {row.cache_key for row in db.query(ResponseCacheEntry)} == {"key0", "key2"}
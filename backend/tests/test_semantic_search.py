@@ -0,0 +1,45 @@
+"""Regression tests for the in-memory embedding matrix cache"""
+import numpy as np
+import pytest
+
+from models import Embedding
+from services import semantic_search
+from services.semantic_search import VectorStore, SOURCE_NOTE
+
+
+@pytest.fixture(autouse=True)
+def small_cache(monkeypatch):
+    monkeypatch.setattr(semantic_search, "SEMANTIC_CACHE_MAX_MATRICES", 2)
+    monkeypatch.setattr(VectorStore, "_cache", type(VectorStore._cache)())
+
+
+def _add(db, user_id: int, source_id: int) -> None:
+    vector = np.ones(4, dtype=np.float32)
+    db.add(Embedding(
+        user_id=user_id, source_type=SOURCE_NOTE, source_id=source_id, model="model",
+        dim=4, vector=vector.tobytes(), content_hash="x"
+    ))
+    db.commit()
+
+
+def test_least_recently_used_matrix_is_evicted(db):
+    for user_id in (1, 2, 3):
+        _add(db, user_id, user_id)
+    store = VectorStore(db, "model")
+    store.get(1, [SOURCE_NOTE])
+    store.get(2, [SOURCE_NOTE])
+    store.get(1, [SOURCE_NOTE])
+    store.get(3, [SOURCE_NOTE])
+
+    assert [key[0] for key in VectorStore._cache] == [1, 3]
+
+
+def test_outdated_matrix_is_dropped(db):
+    _add(db, 1, 1)
+    store = VectorStore(db, "model")
+    store.get(1, [SOURCE_NOTE])
+    db.query(Embedding).delete()
+    db.commit()
+
+    assert store.get(1, [SOURCE_NOTE]) is None
+    assert len(VectorStore._cache) == 0
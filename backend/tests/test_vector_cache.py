@@ -0,0 +1,91 @@
+"""Regression tests for the on-disk embedding cache"""
+import multiprocessing
+
+import numpy as np
+
+from services.vector_cache import VectorCache, text_digest
+
+
+def test_put_after_torn_write_keeps_rows_aligned(tmp_path):
+    a = np.arange(4, dtype=np.float32)
+    b = np.arange(4, 8, dtype=np.float32)
+    cache = VectorCache("model", cache_dir=tmp_path)
+    cache.put_many([(text_digest("a"), a)])
+
+    # Crash after the vector was written but before its digest
+    with open(cache.vectors_path, "ab") as f:
+        f.write(np.full(4, 99, dtype=np.float32).tobytes())
+
+    cache = VectorCache("model", cache_dir=tmp_path)
+    assert len(cache) == 1
+    cache.put_many([(text_digest("b"), b)])
+
+    cache = VectorCache("model", cache_dir=tmp_path)
+    found = cache.get_many([text_digest("a"), text_digest("b")])
+    np.testing.assert_array_equal(found[text_digest("a")], a)
+    np.testing.assert_array_equal(found[text_digest("b")], b)
+
+
+def test_partial_digest_is_dropped(tmp_path):
+    a = np.arange(4, dtype=np.float32)
+    cache = VectorCache("model", cache_dir=tmp_path)
+    cache.put_many([(text_digest("a"), a)])
+    with open(cache.index_path, "ab") as f:
+        f.write(b"\x00" * 10)
+
+    cache = VectorCache("model", cache_dir=tmp_path)
+    cache.put_many([(text_digest("b"), a + 1)])
+
+    cache = VectorCache("model", cache_dir=tmp_path)
+    assert len(cache) == 2
+    np.testing.assert_array_equal(cache.get_many([text_digest("b")])[text_digest("b")], a + 1)
+
+
+def test_appends_from_another_process_are_picked_up(tmp_path):
+    vectors = {name: np.full(4, i, dtype=np.float32) for i, name in enumerate("abcd")}
+    first = VectorCache("model", cache_dir=tmp_path)
+    first.put_many([(text_digest("a"), vectors["a"])])
+    # Opened before "b" is written, like a second worker process
+    second = VectorCache("model", cache_dir=tmp_path)
+    second.put_many([(text_digest("b"), vectors["b"])])
+    first.put_many([(text_digest("c"), vectors["c"]), (text_digest("b"), vectors["b"])])
+    second.put_many([(text_digest("d"), vectors["d"])])
+
+    for cache in (first, second, VectorCache("model", cache_dir=tmp_path)):
+        cache.put_many([(text_digest("a"), vectors["a"])])
+        found = cache.get_many([text_digest(name) for name in vectors])
+        assert len(found) == 4
+        for name, vector in vectors.items():
+            np.testing.assert_array_equal(found[text_digest(name)], vector)
+
+
+def _append_in_process(cache_dir, worker: int) -> None:
+    cache = VectorCache("model", cache_dir=cache_dir)
+    for batch in range(10):
+        names = [f"{worker}-{batch}-{i}" for i in range(5)]
+        cache.put_many([(text_digest(name), _vector_for(name)) for name in names])
+        # This process's own map must point at its vectors while others append
+        found = cache.get_many([text_digest(name) for name in names])
+        for name in names:
+            np.testing.assert_array_equal(found[text_digest(name)], _vector_for(name))
+
+
+def _vector_for(name: str) -> np.ndarray:
+    return np.frombuffer(text_digest(name)[:16], dtype=np.float32).copy()
+
+
+def test_concurrent_processes_keep_rows_aligned(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_append_in_process, args=(tmp_path, worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+    cache = VectorCache("model", cache_dir=tmp_path)
+    names = [f"{worker}-{batch}-{i}" for worker in range(4) for batch in range(10) for i in range(5)]
+    found = cache.get_many([text_digest(name) for name in names])
+    assert len(found) == len(names)
+    for name in names:
+        np.testing.assert_array_equal(found[text_digest(name)], _vector_for(name))
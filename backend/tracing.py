@@ -0,0 +1,220 @@
+"""Request tracing with OpenTelemetry
+
+Spans are created through ``start_span`` / ``traced`` so call sites do not
+depend on OpenTelemetry being installed: without the package every span is
+a no-op. With the API installed but ``TRACING_EXPORTER=none`` the OTel
+no-op tracer is used; "console", "otlp" and "memory" (for tests) configure
+the SDK in ``setup_tracing``.
+"""
+import asyncio
+import functools
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from config import TRACING_EXPORTER, TRACING_SAMPLE_RATIO, TRACING_SERVICE_NAME
+from logging_config import get_logger
+
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry import propagate
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # Optional: tracing is disabled without it
+    otel_trace = None
+
+logger = get_logger(__name__)
+
+_memory_exporter = None
+
+
+class _NoopSpan:
+    """Stand-in for a span when OpenTelemetry is not installed"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+    def update_name(self, name: str) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def setup_tracing() -> None:
+    """Install the SDK tracer provider for the configured exporter (called once at startup)"""
+    global _memory_exporter
+
+    exporter_name = TRACING_EXPORTER.lower()
+    if exporter_name in ("", "none"):
+        return
+    if otel_trace is None:
+        logger.warning(f"TRACING_EXPORTER={TRACING_EXPORTER} but opentelemetry is not installed; tracing is disabled")
+        return
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        logger.warning("opentelemetry-sdk is not installed; spans are not exported")
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO))
+    )
+    if exporter_name == "console":
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    elif exporter_name == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("opentelemetry-exporter-otlp-proto-http is not installed; spans are not exported")
+            return
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    elif exporter_name == "memory":
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+        _memory_exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(_memory_exporter))
+    else:
+        logger.warning(f"Unknown TRACING_EXPORTER {TRACING_EXPORTER!r}; tracing is disabled")
+        return
+
+    otel_trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled with the {exporter_name} exporter")
+
+
+def get_memory_exporter():
+    """Finished spans when ``TRACING_EXPORTER=memory`` (None otherwise)"""
+    return _memory_exporter
+
+
+def _tracer():
+    return otel_trace.get_tracer("ollama_chat") if otel_trace is not None else None
+
+
+@contextmanager
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, current: bool = True) -> Iterator[Any]:
+    """
+    Open a span for the enclosed block
+
+    Args:
+        name: Span name
+        attributes: Initial span attributes (None values are dropped)
+        current: Make the span the parent of spans opened inside the block.
+            Use False around ``yield`` in async generators, where the block
+            is suspended while the consumer runs.
+
+    Yields:
+        The span (a no-op object when tracing is unavailable)
+    """
+    tracer = _tracer()
+    if tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+    if current:
+        with tracer.start_as_current_span(name, attributes=attributes) as span:
+            yield span
+        return
+
+    span = tracer.start_span(name, attributes=attributes)
+    try:
+        yield span
+    except Exception as e:
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        raise
+    finally:
+        span.end()
+
+
+def traced(name: Optional[str] = None):
+    """
+    Decorator running a function (sync or async) inside a span
+
+    Args:
+        name: Span name (defaults to the function's qualified name)
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def current_trace_id() -> Optional[str]:
+    """Hex trace ID of the active span, if any"""
+    if otel_trace is None:
+        return None
+    context = otel_trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per HTTP request
+
+    Incoming ``traceparent`` headers are continued. The span covers the whole
+    response including streamed bodies, and its trace ID is returned in the
+    ``X-Trace-Id`` header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        tracer = _tracer()
+        if scope["type"] != "http" or tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        context = propagate.extract(headers)
+
+        with tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            context=context,
+            kind=otel_trace.SpanKind.SERVER,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]}
+        ) as span:
+            trace_id = current_trace_id()
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                    if trace_id:
+                        message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", trace_id.encode())]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{scope['method']} {route.path}")
+                    span.set_attribute("http.route", route.path)
@@ -23,8 +23,13 @@ def detect_family(model_name: str) -> str:
     return "other"
 
 def detect_type(model_name: str) -> str:
-    """Detect model type (vision or text) from name"""
+    """Detect model type (vision, embedding or text) from name"""
     name_lower = model_name.lower()
+
+    # Embedding models (e.g. nomic-embed-text, mxbai-embed-large, bge-m3, all-minilm)
+    embedding_keywords = ["embed", "bge-", "bge:", "all-minilm", "paraphrase-multilingual"]
+    if any(keyword in name_lower for keyword in embedding_keywords):
+        return "embedding"
     
     # List of keywords that indicate vision support
     vision_keywords = [
@@ -43,9 +48,7 @@ def detect_type(model_name: str) -> str:
         multimodal_sizes = ["4b", "12b", "27b"]
         if any(size in name_lower for size in multimodal_sizes):
             return "vision"
-            
-    if "embedding" in name_lower:
-        return "embedding"
+
     return "text"
 
 def get_model_description(model_name: str, model_type: str, family: str) -> str:
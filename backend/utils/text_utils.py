@@ -19,3 +19,33 @@ def truncate_with_ellipsis(text: str, max_length: int = 50) -> str:
         return text
 
     return text[:max_length] + "..."
+
+
+def build_snippet(text: str, query: str, context: int = 50, fallback_length: int = 100) -> str:
+    """
+    Build a search result snippet around the first occurrence of query
+
+    Args:
+        text: Full text
+        query: Search query
+        context: Characters to keep on each side of the match
+        fallback_length: Length of the leading excerpt when the query is not found
+
+    Returns:
+        Snippet with ellipses where text was cut
+    """
+    if not text:
+        return ""
+
+    index = text.lower().find(query.lower()) if query else -1
+    if index < 0:
+        return truncate_with_ellipsis(text, fallback_length)
+
+    start = max(0, index - context)
+    end = min(len(text), index + len(query) + context)
+    snippet = text[start:end]
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(text):
+        snippet = snippet + "..."
+    return snippet
@@ -164,7 +164,7 @@ export default function NoteSearchModal({
                         {result.title}
                       </div>
                       <div className="text-xs text-gray-600 dark:text-gray-400 mb-2 line-clamp-2">
-                        {result.snippet || result.content.substring(0, 100) + '...'}
+                        {result.snippet ?? (result.content ? result.content.substring(0, 100) + '...' : '')}
                       </div>
                       {result.labels && result.labels.length > 0 && (
                         <div className="flex flex-wrap gap-1 mb-2">
@@ -36,7 +36,7 @@ export function useChatMessage(
 
   const sendMessage = async (
     messageText: string,
-    uploadedFile: { filename: string, images: string[] } | null,
+    uploadedFile: { filename: string, images: string[], document_id?: number } | null,
     skipUserMessage: boolean = false
   ) => {
     const textToSend = messageText.trim()
@@ -80,11 +80,17 @@ export function useChatMessage(
         session_id: currentSessionId
       }
 
-      // Add images if uploaded
+      // Add images if uploaded (the backend drops them once the document's
+      // passages can be retrieved instead)
       if (imagesToSend && imagesToSend.length > 0) {
         requestData.images = imagesToSend
       }
 
+      // Attach the indexed document so later turns can retrieve from it
+      if (uploadedFile?.document_id) {
+        requestData.document_ids = [uploadedFile.document_id]
+      }
+
       // Use fetch for streaming with abort signal
       const response = await api.sendMessage(requestData, abortControllerRef.current.signal)
 
@@ -6,7 +6,7 @@ import { logger } from '../utils/logger'
 export function useFiles(userId: number | null) {
   const [userFiles, setUserFiles] = useState<UserFile[]>([])
   const [loadingFiles, setLoadingFiles] = useState(false)
-  const [uploadedFile, setUploadedFile] = useState<{ filename: string, images: string[] } | null>(null)
+  const [uploadedFile, setUploadedFile] = useState<{ filename: string, images: string[], document_id?: number } | null>(null)
   const [uploading, setUploading] = useState(false)
   const [selectedFile, setSelectedFile] = useState<{ filename: string, images: string[] } | null>(null)
 
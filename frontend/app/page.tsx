@@ -611,10 +611,11 @@ export default function Home() {
 
     setUploading(true)
     try {
-      const response = await api.uploadFile(file)
+      const response = await api.uploadFile(file, userId, currentSessionId)
       setUploadedFile({
         filename: response.filename,
-        images: response.images
+        images: response.images,
+        document_id: response.document_id
       })
     } catch (error: any) {
       logger.error('Failed to upload file:', error)
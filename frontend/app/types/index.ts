@@ -51,12 +51,14 @@ export interface Note {
   user_id: number
   session_id: string
   title: string
-  content: string
+  content?: string  // Only in note detail; lists return preview instead
   model: string
-  prompt: string
+  prompt?: string
   labels?: string[]
   is_deleted?: number
+  status?: string
   created_at: string
+  preview?: string  // Short content excerpt in note lists
   snippet?: string  // For search results
 }
 
@@ -38,6 +38,7 @@ export const api = {
     model: string
     session_id?: string
     images?: string[]
+    document_ids?: number[]
   }, signal?: AbortSignal): Promise<Response> => {
     return fetch(`${API_URL}/api/chat`, {
       method: 'POST',
@@ -78,14 +79,18 @@ export const api = {
   },
 
   // Upload
-  uploadFile: async (file: File): Promise<{
+  uploadFile: async (file: File, userId?: number, sessionId?: string | null): Promise<{
     file_id: string
     images: string[]
     image_paths: string[]
     filename: string
+    document_id?: number
   }> => {
     const formData = new FormData()
     formData.append('file', file)
+    // Lets the backend index the document text for retrieval in this chat
+    if (userId) formData.append('user_id', String(userId))
+    if (sessionId) formData.append('session_id', sessionId)
     const response = await axios.post(`${API_URL}/api/upload`, formData, {
       headers: {
         'Content-Type': 'multipart/form-data'
@@ -336,6 +341,7 @@ export const api = {
     model: string
     session_id?: string
     images?: string[]
+    document_ids?: number[]
   }, signal?: AbortSignal): Promise<Response> => {
     return fetch(`${API_URL}/api/chat/with-template`, {
       method: 'POST',